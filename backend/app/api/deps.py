@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import uuid
+from dataclasses import dataclass, field
+
 from fastapi import Cookie, Depends, HTTPException, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.security import decode_token
 from app.db.session import AsyncSessionLocal
 from app.models.user import User
+from app.services.auth_revocations import revocations
 
 
 async def get_db() -> AsyncSession:
@@ -14,27 +19,75 @@ async def get_db() -> AsyncSession:
         yield session
 
 
-async def get_current_user(
+# Кто делает запрос. В stateless-режиме собирается из claims токена без обращения к БД;
+# полный ORM User подгружается только там, где он реально нужен (load_user).
+@dataclass
+class Principal:
+    id: uuid.UUID
+    role: str
+    is_active: bool
+    email_verified: bool
+    user: User | None = field(default=None, repr=False)
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            role=user.role,
+            is_active=user.is_active,
+            email_verified=bool(user.email_verified_at),
+            user=user,
+        )
+
+    async def load_user(self, db: AsyncSession) -> User:
+        if self.user is None:
+            q = await db.execute(select(User).where(User.id == self.id))
+            user = q.scalar_one_or_none()
+            if not user or not user.is_active:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+            self.user = user
+        return self.user
+
+
+async def get_principal(
     db: AsyncSession = Depends(get_db),
     access_token: str | None = Cookie(default=None),
-) -> User:
+) -> Principal:
     if not access_token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
     try:
         payload = decode_token(access_token)
-        user_id = payload.get("sub")
+        user_id = uuid.UUID(str(payload.get("sub")))
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+    # токены без claims (выпущены до включения режима) проверяем по БД, как раньше
+    if settings.auth_stateless and "role" in payload:
+        if not payload.get("is_active") or revocations.is_revoked(user_id, payload.get("iat", 0)):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        return Principal(
+            id=user_id,
+            role=payload["role"],
+            is_active=True,
+            email_verified=bool(payload.get("email_verified")),
+        )
+
     q = await db.execute(select(User).where(User.id == user_id))
     user = q.scalar_one_or_none()
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    return Principal.from_user(user)
+
+
+async def get_current_user(
+    principal: Principal = Depends(get_principal),
+    db: AsyncSession = Depends(get_db),
+) -> User:
+    return await principal.load_user(db)
 
 
-async def require_admin(user: User = Depends(get_current_user)) -> User:
-    if user.role != "admin":
+async def require_admin(principal: Principal = Depends(get_principal)) -> Principal:
+    if principal.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
-    return user
+    return principal
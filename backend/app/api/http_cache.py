@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from email.utils import parsedate_to_datetime
+
+from fastapi import Request, Response
+
+from app.services.catalog_cache import CachedBody
+from app.services.static_pages import RenderedPage
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # сравнение для GET/HEAD — слабое: W/"x" совпадает с "x"
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in header.split(","))
+
+
+def cached_response(
+    request: Request,
+    entry: CachedBody,
+    *,
+    media_type: str = "application/json",
+    cache_control: str = "no-cache",
+) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=media_type, headers=headers)
+
+
+def _accepted_encodings(request: Request) -> set[str]:
+    accepted: set[str] = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _not_modified_since(request: Request, page: RenderedPage) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header:
+        return False
+    try:
+        return page.last_modified <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+
+def page_response(request: Request, page: RenderedPage) -> Response:
+    accepted = _accepted_encodings(request)
+    # у каждого варианта своё ETag: байты разные, а ETag — строгий
+    if "br" in accepted or "*" in accepted:
+        body, encoding, etag = page.br, "br", page.etag[:-1] + '-br"'
+    elif "gzip" in accepted:
+        body, encoding, etag = page.gzip, "gzip", page.etag[:-1] + '-gz"'
+    else:
+        body, encoding, etag = page.identity, None, page.etag
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": page.last_modified_http,
+        "Cache-Control": f"public, max-age={page.max_age}",
+        "Vary": "Accept-Encoding",
+    }
+    # If-None-Match приоритетнее If-Modified-Since (RFC 9110)
+    if request.headers.get("if-none-match") is not None:
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+    elif _not_modified_since(request, page):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="text/html; charset=utf-8", headers=headers)
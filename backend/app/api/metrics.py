@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+
+from fastapi import FastAPI
+from starlette.routing import Route
+
+from app.core.metrics import registry
+from app.db.query_stats import RequestQueryStats, current_query_stats, report_repeated
+
+# до 10 мс шаг мелкий: большинство ответов из кеша укладываются туда
+HTTP_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+http_requests = registry.counter_vec("http_requests_total", "HTTP requests by route template", ("route", "method", "status"))
+http_in_flight = registry.gauge_vec("http_requests_in_flight", "HTTP requests being handled", ("route", "method"))
+http_duration = registry.histogram_vec(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("route", "method"), HTTP_BUCKETS_S
+)
+http_db_time = registry.histogram_vec(
+    "http_request_db_seconds", "Time spent in SQL per HTTP request", ("route", "method"), HTTP_BUCKETS_S
+)
+http_db_queries = registry.histogram_vec(
+    "http_request_db_queries", "SQL statements per HTTP request", ("route", "method"), (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+# метод в метке — только из известного набора, иначе произвольные методы на 404 раздуют число рядов
+_KNOWN_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+_STATUS_CLASSES = ("1xx", "1xx", "2xx", "3xx", "4xx", "5xx")
+
+
+# Дочерние метрики одного (маршрут, метод): резолвятся один раз, запрос только инкрементирует
+class _RouteStats:
+    __slots__ = ("route", "method", "label", "in_flight", "duration", "db_time", "db_queries", "_statuses")
+
+    def __init__(self, route: str, method: str) -> None:
+        self.route = route
+        self.method = method
+        self.label = f"{method} {route}"
+        self.in_flight = http_in_flight.labels(route, method)
+        self.duration = http_duration.labels(route, method)
+        self.db_time = http_db_time.labels(route, method)
+        self.db_queries = http_db_queries.labels(route, method)
+        self._statuses: list = [None] * len(_STATUS_CLASSES)
+
+    def count(self, status: int) -> None:
+        idx = status // 100
+        if not 0 < idx < len(_STATUS_CLASSES):
+            idx = 5
+        counter = self._statuses[idx]
+        if counter is None:
+            counter = self._statuses[idx] = http_requests.labels(self.route, self.method, _STATUS_CLASSES[idx])
+        counter.inc()
+
+
+@dataclass(frozen=True)
+class SqlProfile:
+    n_plus_one_threshold: int
+    # Server-Timing с числом и временем SQL в ответе (не для prod: раскрывает внутренности)
+    server_timing: bool
+
+
+class _StatusCapture:
+    __slots__ = ("send", "status", "server_timing")
+
+    def __init__(self, send, server_timing: RequestQueryStats | None = None) -> None:
+        self.send = send
+        self.status = 500
+        self.server_timing = server_timing
+
+    async def __call__(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            stats = self.server_timing
+            if stats is not None:
+                value = f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'
+                message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", value.encode("ascii"))]}
+        await self.send(message)
+
+
+# ASGI-обёртка вокруг конкретного маршрута: шаблон пути известен заранее, сопоставлять ничего не нужно
+class _InstrumentedApp:
+    def __init__(self, app, route: str, profile: SqlProfile | None = None) -> None:
+        self.app = app
+        self.route = route
+        self.profile = profile
+        self._by_method: dict[str, _RouteStats] = {}
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        if method not in _KNOWN_METHODS:
+            method = "OTHER"
+        stats = self._by_method.get(method)
+        if stats is None:
+            stats = self._by_method[method] = _RouteStats(self.route, method)
+
+        profile = self.profile
+        query_stats = RequestQueryStats(stats.label, profile=profile is not None)
+        capture = _StatusCapture(send, query_stats if profile is not None and profile.server_timing else None)
+        if profile is not None:
+            # доступно обработчикам и middleware как request.state.sql
+            scope.setdefault("state", {})["sql"] = query_stats
+        token = current_query_stats.set(query_stats)
+        stats.in_flight.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, capture)
+        except Exception as e:
+            # HTTPException из обработчика 404 Starlette превращает в ответ уже снаружи обёртки
+            capture.status = getattr(e, "status_code", 500)
+            raise
+        finally:
+            stats.duration.observe(time.perf_counter() - started_at)
+            stats.in_flight.dec()
+            current_query_stats.reset(token)
+            stats.db_time.observe(query_stats.db_seconds)
+            stats.db_queries.observe(query_stats.queries)
+            stats.count(capture.status)
+            if profile is not None:
+                report_repeated(query_stats, profile.n_plus_one_threshold)
+
+
+# Оборачивает все HTTP-маршруты приложения и обработчик 404. Вызывать после include_router.
+# profile — профайлер SQL: повторяющиеся запросы (N+1) и Server-Timing.
+def instrument_routes(app: FastAPI, profile: SqlProfile | None = None) -> None:
+    for route in app.router.routes:
+        if isinstance(route, Route) and not isinstance(route.app, _InstrumentedApp):
+            route.app = _InstrumentedApp(route.app, route.path, profile)
+    if not isinstance(app.router.default, _InstrumentedApp):
+        app.router.default = _InstrumentedApp(app.router.default, UNMATCHED_ROUTE, profile)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import uuid
+
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import Principal, get_db, require_admin
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.pool import pool_status
+from app.db.session import engine
+from app.models.credit_ledger import CreditLedgerEntry
+from app.models.payment_event import PaymentEvent
+from app.models.session_token import UserSession
+from app.models.user import User
+from app.schemas.auth import UserAdminUpdateIn
+from app.services.auth_revocations import revoke_user_tokens
+from app.services.credits import get_balance
+from app.services.db_maintenance import db_maintenance
+from app.services.generation_jobs import queue_stats
+from app.services.identities import cache_stats, evict
+from app.services.payment_events import detach_partitions, list_partitions
+from app.services.webhook_inbox import inbox_worker
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/webhooks/inbox", dependencies=[Depends(require_admin)])
+async def webhook_inbox_stats() -> dict:
+    if settings.webhook_mode == "inbox":
+        await inbox_worker.refresh_depth()
+    return {"mode": settings.webhook_mode, "metrics": registry.snapshot("webhook_inbox")}
+
+
+@router.get("/db/pool", dependencies=[Depends(require_admin)])
+async def db_pool_stats() -> dict:
+    return {
+        **pool_status(engine),
+        "pre_ping": settings.db_pool_pre_ping,
+        "recycle_seconds": settings.db_pool_recycle_seconds,
+        "leak_detection": settings.db_leak_detection,
+        "metrics": registry.snapshot("db_"),
+    }
+
+
+# Внеочередной проход чистки; skipped — проход уже идёт на другом инстансе
+@router.post("/db/maintenance", dependencies=[Depends(require_admin)])
+async def db_maintenance_run() -> dict:
+    deleted = await db_maintenance.run_once()
+    return {"skipped": deleted is None, "deleted": deleted or {}, "metrics": registry.snapshot("db_maintenance")}
+
+
+# История платежа из журнала payment_events (индекс provider_payment_id, received_at)
+@router.get("/payments/{provider_payment_id}/events", dependencies=[Depends(require_admin)])
+async def payment_events(
+    provider_payment_id: str,
+    limit: int = Query(default=50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    q = await db.execute(
+        select(
+            PaymentEvent.id,
+            PaymentEvent.received_at,
+            PaymentEvent.source,
+            PaymentEvent.event,
+            PaymentEvent.status,
+            PaymentEvent.applied,
+            PaymentEvent.payload,
+        )
+        .where(PaymentEvent.provider_payment_id == provider_payment_id)
+        .order_by(PaymentEvent.received_at.desc())
+        .limit(limit)
+    )
+    return {"provider_payment_id": provider_payment_id, "events": [dict(r._mapping) for r in q.all()]}
+
+
+@router.get("/payments/events/partitions", dependencies=[Depends(require_admin)])
+async def payment_event_partitions_list() -> dict:
+    async with engine.connect() as conn:
+        return {"partitions": await list_partitions(conn), "metrics": registry.snapshot("payment_events")}
+
+
+# Отсоединить месячные секции старше keep_months: таблицы остаются в базе для выгрузки и удаления вручную
+@router.post("/payments/events/detach", dependencies=[Depends(require_admin)])
+async def payment_event_partitions_detach(keep_months: int = Query(ge=1)) -> dict:
+    async with engine.begin() as conn:
+        detached = await detach_partitions(conn, keep_months)
+    return {"detached": detached}
+
+
+@router.get("/generation/queue", dependencies=[Depends(require_admin)])
+async def generation_queue(db: AsyncSession = Depends(get_db)) -> dict:
+    return {**await queue_stats(db), "metrics": registry.snapshot("generation_")}
+
+
+# Баланс и последние записи журнала кредитов пользователя
+@router.get("/users/{user_id}/credits", dependencies=[Depends(require_admin)])
+async def user_credits(
+    user_id: uuid.UUID,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    q = await db.execute(
+        select(
+            CreditLedgerEntry.id,
+            CreditLedgerEntry.kind,
+            CreditLedgerEntry.delta,
+            CreditLedgerEntry.reason,
+            CreditLedgerEntry.ref,
+            CreditLedgerEntry.created_at,
+        )
+        .where(CreditLedgerEntry.user_id == user_id)
+        .order_by(CreditLedgerEntry.id.desc())
+        .limit(limit)
+    )
+    return {"balance": await get_balance(db, user_id), "ledger": [dict(r._mapping) for r in q.all()]}
+
+
+# Смена роли или блокировка: выданные access-токены отзываются сразу (триггер в базе делает то же при
+# ручном UPDATE, здесь — ещё и кеш этого процесса), при блокировке заодно закрываются refresh-сессии
+@router.patch("/users/{user_id}")
+async def update_user(
+    user_id: uuid.UUID,
+    payload: UserAdminUpdateIn,
+    admin: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    if user_id == admin.id and (payload.role == "user" or payload.is_active is False):
+        raise HTTPException(status_code=400, detail="Cannot demote or deactivate yourself")
+    user = await db.get(User, user_id, with_for_update=True)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    changed = (payload.role is not None and payload.role != user.role) or (
+        payload.is_active is not None and payload.is_active != user.is_active
+    )
+    if payload.role is not None:
+        user.role = payload.role
+    if payload.is_active is not None:
+        user.is_active = payload.is_active
+    if changed:
+        await db.flush()
+        await revoke_user_tokens(db, user.id)
+    if payload.is_active is False:
+        await db.execute(
+            update(UserSession)
+            .where(UserSession.user_id == user.id, UserSession.revoked_at.is_(None))
+            .values(revoked_at=datetime.now(timezone.utc))
+        )
+    await db.commit()
+    return {"ok": True, "role": user.role, "is_active": user.is_active, "tokens_revoked": changed}
+
+
+# Кеш обученных профилей лица: занято/лимит; POST — внеочередной проход вытеснения
+@router.get("/identities/cache", dependencies=[Depends(require_admin)])
+async def identity_cache(db: AsyncSession = Depends(get_db)) -> dict:
+    return {**await cache_stats(db), "metrics": registry.snapshot("identity_")}
+
+
+@router.post("/identities/cache/evict", dependencies=[Depends(require_admin)])
+async def identity_cache_evict(db: AsyncSession = Depends(get_db)) -> dict:
+    return await evict(db)
@@ -5,8 +5,10 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_db, require_admin
+from app.api.routers.styles import STYLES_CACHE_KEY, styles_cache
 from app.models.style import Style
 from app.schemas.style import StyleCreateIn, StyleOut, StyleUpdateIn
+from app.services.catalog_cache import bump_version
 
 router = APIRouter(prefix="/admin/styles", tags=["admin"])
 
@@ -35,8 +37,10 @@ async def admin_create_style(payload: StyleCreateIn, db: AsyncSession = Depends(
 
     s = Style(code=payload.code, name=payload.name, description=payload.description)
     db.add(s)
+    version = await bump_version(db, STYLES_CACHE_KEY)
     await db.commit()
     await db.refresh(s)
+    styles_cache.invalidate(version)
     return StyleOut(
         id=str(s.id),
         code=s.code,
@@ -60,7 +64,9 @@ async def admin_update_style(style_id: str, payload: StyleUpdateIn, db: AsyncSes
     if payload.is_active is not None:
         s.is_active = payload.is_active
 
+    version = await bump_version(db, STYLES_CACHE_KEY)
     await db.commit()
+    styles_cache.invalidate(version)
     return StyleOut(
         id=str(s.id),
         code=s.code,
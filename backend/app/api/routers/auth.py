@@ -4,24 +4,27 @@ from app.api.deps import get_db, get_current_user
 
 from datetime import datetime, timedelta, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
-from sqlalchemy import select, update
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Request, Response, status
+from sqlalchemy import or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.security import (
     create_access_token,
     create_refresh_token,
-    hash_password,
+    decode_token,
+    hash_password_async,
     random_token_urlsafe,
     sha256_hex,
-    verify_password,
+    user_claims,
+    verify_and_update_password_async,
 )
 from app.db.session import AsyncSessionLocal
 from app.models.email_verification import EmailVerification
 from app.models.session_token import UserSession
 from app.models.user import User
 from app.schemas.auth import LoginIn, MeOut, SignupIn
+from app.services.auth_revocations import revoke_user_tokens
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -30,6 +33,12 @@ def client_ip(req: Request) -> str | None:
     return req.client.host if req.client else None
 
 
+def _set_auth_cookies(response: Response, access: str, refresh: str) -> None:
+    secure_cookie = settings.env == "prod"  # в dev можно тестить без https
+    response.set_cookie("access_token", access, httponly=True, secure=secure_cookie, samesite="lax", max_age=60 * settings.access_token_minutes)
+    response.set_cookie("refresh_token", refresh, httponly=True, secure=secure_cookie, samesite="lax", max_age=60 * 60 * 24 * settings.refresh_token_days)
+
+
 @router.post("/signup", status_code=201)
 async def signup(payload: SignupIn, request: Request, db: AsyncSession = Depends(get_db)) -> dict:
     if not all(
@@ -51,7 +60,7 @@ async def signup(payload: SignupIn, request: Request, db: AsyncSession = Depends
 
     user = User(
         email=email,
-        password_hash=hash_password(payload.password),
+        password_hash=await hash_password_async(payload.password),
         consent_version="v1.0",
         consented_at=datetime.now(timezone.utc),
     )
@@ -114,10 +123,17 @@ async def login(payload: LoginIn, request: Request, response: Response, db: Asyn
         raise HTTPException(status_code=401, detail="Invalid credentials")
     if not user.email_verified_at:
         raise HTTPException(status_code=403, detail="Email not verified")
-    if not verify_password(payload.password, user.password_hash):
+    ok, new_hash = await verify_and_update_password_async(payload.password, user.password_hash)
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-
-    access = create_access_token(sub=str(user.id))
+    if new_hash:
+        # параметры Argon2 поменялись — тихо перехешируем при успешном входе
+        user.password_hash = new_hash
+
+    claims = None
+    if settings.auth_stateless:
+        claims = user_claims(role=user.role, is_active=user.is_active, email_verified=bool(user.email_verified_at))
+    access = create_access_token(sub=str(user.id), claims=claims)
     refresh = create_refresh_token(sub=str(user.id))
 
     sess = UserSession(
@@ -130,14 +146,92 @@ async def login(payload: LoginIn, request: Request, response: Response, db: Asyn
     user.last_login_at = datetime.now(timezone.utc)
     await db.commit()
 
-    secure_cookie = settings.env == "prod"  # в dev можно тестить без https
-    response.set_cookie("access_token", access, httponly=True, secure=secure_cookie, samesite="lax", max_age=60 * settings.access_token_minutes)
-    response.set_cookie("refresh_token", refresh, httponly=True, secure=secure_cookie, samesite="lax", max_age=60 * 60 * 24 * settings.refresh_token_days)
+    _set_auth_cookies(response, access, refresh)
+    return {"ok": True}
+
+
+@router.post("/refresh")
+async def refresh(
+    response: Response,
+    refresh_token: str | None = Cookie(default=None),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    if not refresh_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        payload = decode_token(refresh_token)
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    now = datetime.now(timezone.utc)
+    old_hash = sha256_hex(refresh_token)
+    new_refresh = create_refresh_token(sub=str(payload.get("sub")))
+
+    # Ротация одним UPDATE ... RETURNING: из двух параллельных запросов с одним токеном выиграет один,
+    # второй увидит уже сменившийся хеш и пойдёт по ветке повторного использования.
+    # Core-таблицы, а не ORM: ORM-update отбрасывает из RETURNING колонки users.
+    sessions, users = UserSession.__table__, User.__table__
+    q = await db.execute(
+        update(sessions)
+        .where(
+            sessions.c.refresh_token_hash == old_hash,
+            sessions.c.revoked_at.is_(None),
+            sessions.c.expires_at > now,
+            sessions.c.user_id == users.c.id,
+            users.c.is_active.is_(True),
+        )
+        .values(refresh_token_hash=sha256_hex(new_refresh), previous_token_hash=old_hash, rotated_at=now)
+        .returning(sessions.c.user_id, users.c.role, users.c.is_active, users.c.email_verified_at)
+    )
+    row = q.one_or_none()
+
+    if row is None:
+        # предъявлен уже заменённый токен — его кто-то сохранил: отзываем всю сессию.
+        # Сразу после ротации это обычно гонка своего же клиента — такой повтор просто отклоняем.
+        grace_edge = now - timedelta(seconds=settings.refresh_reuse_grace_seconds)
+        rq = await db.execute(
+            update(UserSession)
+            .where(
+                UserSession.previous_token_hash == old_hash,
+                UserSession.revoked_at.is_(None),
+                or_(UserSession.rotated_at.is_(None), UserSession.rotated_at <= grace_edge),
+            )
+            .values(revoked_at=now)
+            .returning(UserSession.user_id)
+            .execution_options(synchronize_session=False)
+        )
+        reused_by = rq.scalar_one_or_none()
+        if reused_by is not None:
+            await revoke_user_tokens(db, reused_by)
+        await db.commit()
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
+
+    await db.commit()
+
+    claims = None
+    if settings.auth_stateless:
+        claims = user_claims(role=row.role, is_active=row.is_active, email_verified=bool(row.email_verified_at))
+    access = create_access_token(sub=str(row.user_id), claims=claims)
+
+    _set_auth_cookies(response, access, new_refresh)
     return {"ok": True}
 
 
 @router.post("/logout")
-async def logout(response: Response) -> dict:
+async def logout(
+    response: Response,
+    refresh_token: str | None = Cookie(default=None),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    if refresh_token:
+        await db.execute(
+            update(UserSession)
+            .where(UserSession.refresh_token_hash == sha256_hex(refresh_token), UserSession.revoked_at.is_(None))
+            .values(revoked_at=datetime.now(timezone.utc))
+        )
+        await db.commit()
     response.delete_cookie("access_token")
     response.delete_cookie("refresh_token")
     return {"ok": True}
@@ -1,19 +1,19 @@
 from __future__ import annotations
 
-import math
+import uuid
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_current_user, get_db
+from app.api.deps import Principal, get_db, get_principal
 from app.core.config import settings
 from app.models.order import Order
-from app.models.payment import Payment
-from app.models.plan import Plan
-from app.models.user import User
-from app.services.yookassa_client import YooKassaClient
+from app.models.payment_intent import PaymentIntent
+from app.services import idempotency, identities
+from app.services.payment_outbox import CheckoutResult, load_checkout_result, payment_outbox
+from app.services.pricing import PlanPrice, get_price_table
 
 router = APIRouter(prefix="/checkout", tags=["checkout"])
 
@@ -28,12 +28,95 @@ def _ensure_pricing_configured() -> None:
         raise HTTPException(status_code=500, detail="Pricing is not configured (COST_* env vars are missing)")
 
 
+def _result_payload(result: CheckoutResult) -> tuple[int, dict]:
+    if result.state == "ready":
+        return 200, {"order_id": str(result.order_id), "payment_id": result.payment_id, "confirmation_url": result.confirmation_url}
+    if result.state == "failed":
+        return 503, {"detail": "Payment provider is unavailable, try again later"}
+    if result.state == "error":
+        return 503, {"detail": "Payment could not be created yet, try again later"}
+    # платёж ещё создаётся: клиент опрашивает GET /checkout/{order_id}
+    return 202, {"order_id": str(result.order_id), "status": "payment_pending", "poll_url": f"/api/v1/checkout/{result.order_id}"}
+
+
+def _result_response(result: CheckoutResult, *, replayed: bool = False):
+    status_code, body = _result_payload(result)
+    return _json(status_code, body, replayed=replayed)
+
+
+def _json(status_code: int, body: dict, *, replayed: bool = False):
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    if status_code == 200 and headers is None:
+        return body
+    return JSONResponse(status_code=status_code, content=body, headers=headers)
+
+
+async def _start_checkout(
+    db: AsyncSession,
+    user: Principal,
+    plan: PlanPrice,
+    photo_hashes: list[str] | None,
+    idem: idempotency.IdempotencyRecord | None = None,
+) -> CheckoutResult:
+    # Профиль лица по набору фото: обученный артефакт в кеше — цена повторного заказа, без обучения.
+    # Без photo_hashes — заказ старого формата по цене первого.
+    identity = None
+    if photo_hashes is not None:
+        try:
+            identity = await identities.choose_for_checkout(db, user.id, photo_hashes)
+        except identities.IdentityError as e:
+            await db.rollback()
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+    reuse = identity is not None and identity.reuse
+    price = plan.price_repeat_rub if reuse else plan.price_first_rub
+
+    # Заказ и намерение платежа — одной транзакцией: падение процесса не оставит заказ без платежа,
+    # а соединение БД не держится, пока ЮKassa отвечает
+    order_id = uuid.uuid4()
+    db.add(
+        Order(
+            id=order_id,
+            user_id=user.id,
+            plan_id=plan.plan_id,
+            identity_profile_id=identity.profile_id if identity is not None else None,
+            status="payment_pending",
+            currency="RUB",
+            price_rub=price,
+            cost_estimate_rub=plan.cost_repeat_rub if reuse else plan.cost_first_rub,
+            updated_at=datetime.now(timezone.utc),
+        )
+    )
+    db.add(
+        PaymentIntent(
+            order_id=order_id,
+            amount_rub=price,
+            description=f"Video Promo SaaS order {order_id}",
+            return_url=settings.yookassa_return_url,
+            payment_metadata={"order_id": str(order_id), "user_id": str(user.id), "plan_code": plan.code},
+        )
+    )
+    if idem is not None:
+        await idempotency.attach_resource(db, idem, str(order_id))
+    await db.commit()
+    payment_outbox.notify()
+    return await _await_result(db, order_id)
+
+
+async def _await_result(db: AsyncSession, order_id: uuid.UUID) -> CheckoutResult:
+    result = await payment_outbox.wait_for(order_id, settings.checkout_wait_seconds)
+    if result is None:
+        # платёж мог создать диспетчер другого процесса
+        result = await load_checkout_result(db, order_id) or CheckoutResult(order_id, "pending")
+    return result
+
+
 @router.post("")
 async def create_checkout(
     payload: dict,
-    user: User = Depends(get_current_user),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+    user: Principal = Depends(get_principal),
     db: AsyncSession = Depends(get_db),
-) -> dict:
+):
     _ensure_yookassa_configured()
     _ensure_pricing_configured()
 
@@ -41,58 +124,62 @@ async def create_checkout(
     if not plan_code:
         raise HTTPException(status_code=400, detail="plan_code is required")
 
-    q = await db.execute(select(Plan).where(Plan.code == plan_code, Plan.is_active == True))
-    plan = q.scalar_one_or_none()
+    table = await get_price_table()
+    plan = table.by_code.get(plan_code)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
 
-    # Пока считаем, что обучение нужно (в следующем этапе привяжем к identity_profile)
-    cost = plan.images_count * settings.cost_image_rub + plan.videos_count * settings.cost_video_rub + settings.cost_training_rub
-    price = int(math.ceil(cost * settings.min_price_multiplier))
-
-    order = Order(
-        user_id=user.id,
-        plan_id=plan.id,
-        status="payment_pending",
-        currency="RUB",
-        price_rub=price,
-        cost_estimate_rub=int(math.ceil(cost)),
-        updated_at=datetime.now(timezone.utc),
-    )
-    db.add(order)
-    await db.commit()
-    await db.refresh(order)
-
-    client = YooKassaClient(
-        api_base=settings.yookassa_api_base,
-        shop_id=settings.yookassa_shop_id,
-        secret_key=settings.yookassa_secret_key,
-    )
-
-    yk = await client.create_payment(
-        amount_rub=price,
-        return_url=settings.yookassa_return_url,
-        description=f"Video Promo SaaS order {order.id}",
-        idempotence_key=str(order.id),
-        metadata={"order_id": str(order.id), "user_id": str(user.id), "plan_code": plan.code},
-    )
-
-    yk_id = yk.get("id")
-    confirmation_url = (yk.get("confirmation") or {}).get("confirmation_url")
-    status = yk.get("status") or "pending"
-
-    if not yk_id:
-        raise HTTPException(status_code=502, detail="YooKassa: no payment id")
-
-    pay = Payment(
-        order_id=order.id,
-        provider="yookassa",
-        provider_payment_id=yk_id,
-        status=status,
-        amount_rub=price,
-        confirmation_url=confirmation_url,
-    )
-    db.add(pay)
-    await db.commit()
-
-    return {"order_id": str(order.id), "payment_id": yk_id, "confirmation_url": confirmation_url}
+    photo_hashes = payload.get("photo_hashes")
+    if photo_hashes is not None:
+        try:
+            photo_hashes = identities.normalize_photo_hashes(photo_hashes)
+        except identities.IdentityError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    if idempotency_key is None:
+        return _result_response(await _start_checkout(db, user, plan, photo_hashes))
+
+    # Повторы с тем же ключом (двойной клик, ретрай мобильного клиента) не создают второй заказ:
+    # получают сохранённый ответ или ждут первый запрос
+    try:
+        idem = await idempotency.acquire(db, scope="checkout", user_id=user.id, key=idempotency_key, payload=payload)
+    except idempotency.IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    if not idem.owned:
+        if idem.response_status == 202 and idem.resource_id:
+            # первый ответ был «ещё создаётся» — отдаём актуальное состояние заказа
+            result = await load_checkout_result(db, uuid.UUID(idem.resource_id), user_id=user.id)
+            if result is not None:
+                return _result_response(result, replayed=True)
+        return _json(idem.response_status or 200, idem.response_body or {}, replayed=True)
+
+    try:
+        if idem.resource_id:
+            # первый запрос упал после создания заказа — продолжаем с тем же заказом
+            result = await _await_result(db, uuid.UUID(idem.resource_id))
+        else:
+            result = await _start_checkout(db, user, plan, photo_hashes, idem)
+        status_code, body = _result_payload(result)
+        if status_code >= 500:
+            # error — заказ жив и платёж ещё создаётся: повтор с тем же ключом продолжит этот заказ
+            await idempotency.release(db, idem, keep_resource=result.state == "error")
+        else:
+            await idempotency.complete(db, idem, status_code, body)
+    except Exception:
+        # заказ мог уже записаться — повтор продолжит с ним, а не создаст второй
+        await idempotency.release(db, idem, keep_resource=True)
+        raise
+    return _json(status_code, body)
+
+
+@router.get("/{order_id}")
+async def get_checkout(
+    order_id: uuid.UUID,
+    user: Principal = Depends(get_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    result = await load_checkout_result(db, order_id, user_id=user.id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return _result_response(result)
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import Principal, get_db, get_principal
+from app.services.credits import get_balance
+
+router = APIRouter(prefix="/credits", tags=["credits"])
+
+
+# Остаток кредитов на генерацию: одна строка по PK, без пересчёта заказов
+@router.get("")
+async def my_credits(user: Principal = Depends(get_principal), db: AsyncSession = Depends(get_db)) -> dict:
+    return await get_balance(db, user.id)
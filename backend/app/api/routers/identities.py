@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import Principal, get_db, get_principal
+from app.services import identities
+
+router = APIRouter(prefix="/identities", tags=["identities"])
+
+
+# Профили лица пользователя; лимит — MAX_IDENTITIES_PER_USER
+@router.get("")
+async def my_identities(user: Principal = Depends(get_principal), db: AsyncSession = Depends(get_db)) -> list[dict]:
+    return await identities.list_profiles(db, user.id)
+
+
+@router.delete("/{identity_id}")
+async def delete_identity(
+    identity_id: uuid.UUID,
+    user: Principal = Depends(get_principal),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    try:
+        await identities.delete_profile(db, user.id, identity_id)
+    except identities.IdentityError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"ok": True}
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-from fastapi import APIRouter
+from datetime import date
+
+from fastapi import APIRouter, Request, Response
 from fastapi.responses import HTMLResponse
 
+from app.api.http_cache import page_response
+from app.services.static_pages import pages
+
 router = APIRouter(tags=["pay-pages"])
 
 
-@router.get("/pay/return", response_class=HTMLResponse)
-async def pay_return() -> str:
+def _pay_return_html(today: date) -> str:
     return """
 <!doctype html>
 <html lang="ru">
@@ -34,8 +38,7 @@ async def pay_return() -> str:
 """
 
 
-@router.get("/pay/fail", response_class=HTMLResponse)
-async def pay_fail() -> str:
+def _pay_fail_html(today: date) -> str:
     return """
 <!doctype html>
 <html lang="ru">
@@ -59,3 +62,17 @@ async def pay_fail() -> str:
 </body>
 </html>
 """
+
+
+pages.register("/pay/return", _pay_return_html, max_age=300)
+pages.register("/pay/fail", _pay_fail_html, max_age=300)
+
+
+@router.get("/pay/return", response_class=HTMLResponse)
+async def pay_return(request: Request) -> Response:
+    return page_response(request, pages.get("/pay/return"))
+
+
+@router.get("/pay/fail", response_class=HTMLResponse)
+async def pay_fail(request: Request) -> Response:
+    return page_response(request, pages.get("/pay/fail"))
@@ -1,18 +1,32 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Request, Response
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.http_cache import cached_response
 from app.db.session import AsyncSessionLocal
 from app.models.style import Style
 from app.schemas.style import StyleOut
+from app.services.catalog_cache import CachedBody, CatalogCache, catalog_versions, json_body
 
 router = APIRouter(prefix="/styles", tags=["styles"])
 
+STYLES_CACHE_KEY = "styles"
+
+
+async def _load_styles() -> CachedBody:
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(select(Style).where(Style.is_active.is_(True)).order_by(Style.weight.desc(), Style.name.asc()))
+        items = q.scalars().all()
+    return json_body(
+        [StyleOut(id=str(s.id), code=s.code, name=s.name, description=s.description, is_active=s.is_active).model_dump() for s in items]
+    )
+
+
+styles_cache = catalog_versions.register(CatalogCache(STYLES_CACHE_KEY, _load_styles))
+
 
 @router.get("", response_model=list[StyleOut])
-async def list_styles(db: AsyncSession = Depends(lambda: AsyncSessionLocal())) -> list[StyleOut]:
-    q = await db.execute(select(Style).where(Style.is_active.is_(True)).order_by(Style.weight.desc(), Style.name.asc()))
-    items = q.scalars().all()
-    return [StyleOut(id=str(s.id), code=s.code, name=s.name, description=s.description, is_active=s.is_active) for s in items]
+async def list_styles(request: Request) -> Response:
+    # сессию открываем только при промахе кеша; 304 и повторные ответы обходятся без БД
+    return cached_response(request, await styles_cache.get())
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import Principal, get_db, get_principal
+from app.services import uploads
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+# Новая загрузка: {"kind": "track" | "photo", "content_type", "size", "plan_code"?, "sha256"?}.
+# Лимиты размера и типа проверяются здесь, до приёма первого байта; лимит размера — по оплаченному плану.
+@router.post("")
+async def create_upload(
+    payload: dict,
+    user: Principal = Depends(get_principal),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    try:
+        return await uploads.create_upload(db, user.id, payload)
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+# Часть файла: сырое тело запроса с текущего offset (не больше chunk_max_bytes). После обрыва —
+# GET за смещением и продолжение с него.
+@router.put("/{upload_id}")
+async def upload_chunk(
+    upload_id: uuid.UUID,
+    request: Request,
+    offset: int = Query(ge=0),
+    user: Principal = Depends(get_principal),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    content_length = request.headers.get("content-length")
+    try:
+        return await uploads.write_chunk(
+            db,
+            user.id,
+            upload_id,
+            offset,
+            request.stream(),
+            int(content_length) if content_length and content_length.isdigit() else None,
+        )
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+@router.get("/{upload_id}")
+async def get_upload(
+    upload_id: uuid.UUID,
+    user: Principal = Depends(get_principal),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    try:
+        return uploads.upload_state(await uploads.get_upload(db, user.id, upload_id))
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
@@ -26,6 +26,28 @@ class Settings(BaseSettings):
     database_url: str = Field(validation_alias=AC("DATABASE_URL", "database_url"))
     jwt_secret: str = Field(validation_alias=AC("JWT_SECRET", "jwt_secret"))
 
+    # Пул соединений БД
+    db_pool_size: int = Field(default=5, validation_alias=AC("DB_POOL_SIZE"))
+    db_max_overflow: int = Field(default=10, validation_alias=AC("DB_MAX_OVERFLOW"))
+    db_pool_timeout_seconds: float = Field(default=30.0, validation_alias=AC("DB_POOL_TIMEOUT_SECONDS"))
+    # -1 — не пересоздавать соединения по возрасту
+    db_pool_recycle_seconds: int = Field(default=1800, validation_alias=AC("DB_POOL_RECYCLE_SECONDS"))
+    # SELECT 1 на каждый checkout; можно выключить, если БД рядом и recycle короче idle-таймаутов
+    db_pool_pre_ping: bool = Field(default=True, validation_alias=AC("DB_POOL_PRE_PING"))
+    # логировать маршрут и стек, если запрос закончился, не вернув соединение в пул; снимает стек на каждом
+    # checkout — включать для поиска утечки, а не постоянно
+    db_leak_detection: bool = Field(default=False, validation_alias=AC("DB_LEAK_DETECTION"))
+
+    # /metrics в формате Prometheus, только с Authorization: Bearer <token>; без METRICS_TOKEN не подключается
+    metrics_enabled: bool = Field(default=True, validation_alias=AC("METRICS_ENABLED"))
+    metrics_token: str | None = Field(default=None, validation_alias=AC("METRICS_TOKEN"))
+
+    # Профайлер SQL (opt-in): лог медленных запросов, предупреждение о повторах одного запроса (N+1)
+    # в пределах HTTP-запроса и заголовок Server-Timing вне prod
+    sql_profiler_enabled: bool = Field(default=False, validation_alias=AC("SQL_PROFILER_ENABLED"))
+    sql_slow_query_ms: float = Field(default=200.0, validation_alias=AC("SQL_SLOW_QUERY_MS"))
+    sql_n_plus_one_threshold: int = Field(default=3, validation_alias=AC("SQL_N_PLUS_ONE_THRESHOLD"))
+
     admin_bootstrap_token: str | None = Field(default=None, validation_alias=AC("ADMIN_BOOTSTRAP_TOKEN"))
 
     # YooKassa
@@ -34,15 +56,160 @@ class Settings(BaseSettings):
     yookassa_return_url: str | None = Field(default=None, validation_alias=AC("YOOKASSA_RETURN_URL"))
     yookassa_api_base: str = Field(default="https://api.yookassa.ru/v3", validation_alias=AC("YOOKASSA_API_BASE"))
 
+    # HTTP-клиент ЮKassa: один на процесс, keep-alive пул
+    yookassa_max_connections: int = Field(default=20, validation_alias=AC("YOOKASSA_MAX_CONNECTIONS"))
+    yookassa_max_keepalive: int = Field(default=10, validation_alias=AC("YOOKASSA_MAX_KEEPALIVE"))
+    yookassa_keepalive_expiry: float = Field(default=30.0, validation_alias=AC("YOOKASSA_KEEPALIVE_EXPIRY"))
+    yookassa_connect_timeout: float = Field(default=3.0, validation_alias=AC("YOOKASSA_CONNECT_TIMEOUT"))
+    yookassa_read_timeout: float = Field(default=10.0, validation_alias=AC("YOOKASSA_READ_TIMEOUT"))
+    yookassa_pool_timeout: float = Field(default=2.0, validation_alias=AC("YOOKASSA_POOL_TIMEOUT"))
+    yookassa_retries: int = Field(default=2, validation_alias=AC("YOOKASSA_RETRIES"))
+    yookassa_retry_backoff: float = Field(default=0.2, validation_alias=AC("YOOKASSA_RETRY_BACKOFF"))
+    yookassa_breaker_threshold: int = Field(default=5, validation_alias=AC("YOOKASSA_BREAKER_THRESHOLD"))
+    yookassa_breaker_reset_seconds: float = Field(default=30.0, validation_alias=AC("YOOKASSA_BREAKER_RESET_SECONDS"))
+
+    # Checkout через outbox: заказ и намерение платежа пишутся одной транзакцией, платёж у провайдера
+    # создаёт диспетчер. Запрос ждёт результат не дольше checkout_wait_seconds, дальше — опрос по order_id.
+    checkout_wait_seconds: float = Field(default=5.0, validation_alias=AC("CHECKOUT_WAIT_SECONDS"))
+    checkout_outbox_concurrency: int = Field(default=20, validation_alias=AC("CHECKOUT_OUTBOX_CONCURRENCY"))
+    checkout_outbox_batch_size: int = Field(default=20, validation_alias=AC("CHECKOUT_OUTBOX_BATCH_SIZE"))
+    checkout_outbox_poll_seconds: float = Field(default=1.0, validation_alias=AC("CHECKOUT_OUTBOX_POLL_SECONDS"))
+    checkout_outbox_claim_timeout_seconds: float = Field(default=60.0, validation_alias=AC("CHECKOUT_OUTBOX_CLAIM_TIMEOUT_SECONDS"))
+    checkout_outbox_max_attempts: int = Field(default=8, validation_alias=AC("CHECKOUT_OUTBOX_MAX_ATTEMPTS"))
+
+    # Idempotency-Key: сколько хранить ответ, сколько повтор ждёт незавершённый первый запрос
+    # и через сколько незавершённый (упавший) запрос можно перехватить
+    idempotency_ttl_seconds: float = Field(default=86400.0, validation_alias=AC("IDEMPOTENCY_TTL_SECONDS"))
+    idempotency_wait_seconds: float = Field(default=10.0, validation_alias=AC("IDEMPOTENCY_WAIT_SECONDS"))
+    idempotency_poll_seconds: float = Field(default=0.2, validation_alias=AC("IDEMPOTENCY_POLL_SECONDS"))
+    idempotency_lock_timeout_seconds: float = Field(default=60.0, validation_alias=AC("IDEMPOTENCY_LOCK_TIMEOUT_SECONDS"))
+
+    # Вебхуки: sync — проверяем и применяем прямо в запросе; inbox — пишем событие в таблицу и отвечаем сразу
+    webhook_mode: str = Field(default="sync", validation_alias=AC("WEBHOOK_MODE"))
+    webhook_workers: int = Field(default=2, validation_alias=AC("WEBHOOK_WORKERS"))
+    webhook_batch_size: int = Field(default=50, validation_alias=AC("WEBHOOK_BATCH_SIZE"))
+    webhook_verify_concurrency: int = Field(default=10, validation_alias=AC("WEBHOOK_VERIFY_CONCURRENCY"))
+    webhook_poll_seconds: float = Field(default=1.0, validation_alias=AC("WEBHOOK_POLL_SECONDS"))
+    webhook_claim_timeout_seconds: float = Field(default=60.0, validation_alias=AC("WEBHOOK_CLAIM_TIMEOUT_SECONDS"))
+    webhook_max_attempts: int = Field(default=10, validation_alias=AC("WEBHOOK_MAX_ATTEMPTS"))
+    # пауза перед повтором неудачной проверки: экспонента от попытки со случайной долей, не больше max
+    webhook_backoff_seconds: float = Field(default=2.0, validation_alias=AC("WEBHOOK_BACKOFF_SECONDS"))
+    webhook_backoff_max_seconds: float = Field(default=300.0, validation_alias=AC("WEBHOOK_BACKOFF_MAX_SECONDS"))
+
+    # Проверка вебхука: refetch — всегда get_payment; ip_allowlist — доверяем источнику из списка сетей ЮKassa;
+    # terminal_refetch — доверяем промежуточным статусам, перепроверяем только succeeded/canceled
+    webhook_verify_mode: str = Field(default="refetch", validation_alias=AC("WEBHOOK_VERIFY_MODE"))
+    yookassa_webhook_ips: str = Field(
+        default="185.71.76.0/27,185.71.77.0/27,77.75.153.0/25,77.75.156.11,77.75.156.35,77.75.154.128/25,2a02:5180::/32",
+        validation_alias=AC("YOOKASSA_WEBHOOK_IPS"),
+    )
+    # сколько доверенных прокси перед приложением дописывают X-Forwarded-For (на Render — 1)
+    webhook_proxy_hops: int = Field(default=0, validation_alias=AC("WEBHOOK_PROXY_HOPS"))
+
+    # Сверка зависших pending-платежей (если вебхук потерялся)
+    reconcile_enabled: bool = Field(default=True, validation_alias=AC("RECONCILE_ENABLED"))
+    reconcile_interval_seconds: float = Field(default=300.0, validation_alias=AC("RECONCILE_INTERVAL_SECONDS"))
+    reconcile_min_age_seconds: float = Field(default=900.0, validation_alias=AC("RECONCILE_MIN_AGE_SECONDS"))
+    reconcile_batch_size: int = Field(default=100, validation_alias=AC("RECONCILE_BATCH_SIZE"))
+    reconcile_concurrency: int = Field(default=10, validation_alias=AC("RECONCILE_CONCURRENCY"))
+
+    # Фоновая чистка истёкших/отозванных сессий, использованных токенов верификации и истёкших Idempotency-Key:
+    # пачками по maintenance_batch_size строк с паузой между ними; отозванное и использованное держим grace секунд
+    maintenance_enabled: bool = Field(default=True, validation_alias=AC("MAINTENANCE_ENABLED"))
+    maintenance_interval_seconds: float = Field(default=3600.0, validation_alias=AC("MAINTENANCE_INTERVAL_SECONDS"))
+    maintenance_batch_size: int = Field(default=1000, validation_alias=AC("MAINTENANCE_BATCH_SIZE"))
+    maintenance_batch_pause_seconds: float = Field(default=0.1, validation_alias=AC("MAINTENANCE_BATCH_PAUSE_SECONDS"))
+    maintenance_grace_seconds: float = Field(default=86400.0, validation_alias=AC("MAINTENANCE_GRACE_SECONDS"))
+
+    # Очередь генерации (python -m app.worker): задачи ставятся в транзакции оплаты заказа.
+    # Аренда задачи продлевается heartbeat-ом; не продлённая lease_seconds — задача возвращается в очередь.
+    generation_worker_concurrency: int = Field(default=4, validation_alias=AC("GENERATION_WORKER_CONCURRENCY"))
+    generation_poll_seconds: float = Field(default=1.0, validation_alias=AC("GENERATION_POLL_SECONDS"))
+    generation_lease_seconds: float = Field(default=120.0, validation_alias=AC("GENERATION_LEASE_SECONDS"))
+    generation_heartbeat_seconds: float = Field(default=30.0, validation_alias=AC("GENERATION_HEARTBEAT_SECONDS"))
+    generation_job_timeout_seconds: float = Field(default=1800.0, validation_alias=AC("GENERATION_JOB_TIMEOUT_SECONDS"))
+    generation_drain_seconds: float = Field(default=30.0, validation_alias=AC("GENERATION_DRAIN_SECONDS"))
+    generation_max_attempts: int = Field(default=5, validation_alias=AC("GENERATION_MAX_ATTEMPTS"))
+    generation_backoff_seconds: float = Field(default=10.0, validation_alias=AC("GENERATION_BACKOFF_SECONDS"))
+    generation_backoff_max_seconds: float = Field(default=600.0, validation_alias=AC("GENERATION_BACKOFF_MAX_SECONDS"))
+    # приоритет задач по коду плана, меньше — раньше: "test_1:0,month_30:20"
+    generation_plan_priorities: str = Field(default="test_1:0", validation_alias=AC("GENERATION_PLAN_PRIORITIES"))
+    generation_default_priority: int = Field(default=10, validation_alias=AC("GENERATION_DEFAULT_PRIORITY"))
+    # исполнитель задач (services/generation_jobs.register_handler); simulate — заглушка для dev и нагрузки
+    generation_handler: str = Field(default="simulate", validation_alias=AC("GENERATION_HANDLER"))
+    generation_simulate_seconds: float = Field(default=2.0, validation_alias=AC("GENERATION_SIMULATE_SECONDS"))
+    # окно рендера для планов с дневной нормой (часы UTC): задачи дня расходятся по нему равномерно
+    generation_window_start_hour: int = Field(default=0, validation_alias=AC("GENERATION_WINDOW_START_HOUR"))
+    generation_window_hours: int = Field(default=24, validation_alias=AC("GENERATION_WINDOW_HOURS"))
+
+    # Журнал payment_events: секции по месяцам создаются заранее; старше retention_months — отсоединяются
+    # для архивации (0 — только вручную, POST /admin/payments/events/detach)
+    payment_events_months_ahead: int = Field(default=2, validation_alias=AC("PAYMENT_EVENTS_MONTHS_AHEAD"))
+    payment_events_retention_months: int = Field(default=0, validation_alias=AC("PAYMENT_EVENTS_RETENTION_MONTHS"))
+    payment_events_maintenance_interval_seconds: float = Field(
+        default=21600.0, validation_alias=AC("PAYMENT_EVENTS_MAINTENANCE_INTERVAL_SECONDS")
+    )
+
+    # Как часто процесс сверяет версии каталогов (стили и т.п.) с БД
+    catalog_version_poll_seconds: float = Field(default=5.0, validation_alias=AC("CATALOG_VERSION_POLL_SECONDS"))
+
+    # Старт процесса: check — DDL только при смене схемы в коде; create_all — каждый раз (как раньше);
+    # skip — схему ведёт отдельный шаг деплоя
+    startup_schema_mode: str = Field(default="check", validation_alias=AC("STARTUP_SCHEMA_MODE"))
+    # сколько соединений пула открыть до приёма трафика
+    startup_warm_connections: int = Field(default=2, validation_alias=AC("STARTUP_WARM_CONNECTIONS"))
+    # прогреть JWT и Argon2 (исполнитель хеширования), чтобы первый логин не платил за старт
+    startup_warm_auth: bool = Field(default=True, validation_alias=AC("STARTUP_WARM_AUTH"))
+
     # Экономика (временно можно оставить None и включить позже)
     cost_image_rub: float | None = Field(default=None, validation_alias=AC("COST_IMAGE_RUB"))
     cost_video_rub: float | None = Field(default=None, validation_alias=AC("COST_VIDEO_RUB"))
     cost_training_rub: float | None = Field(default=None, validation_alias=AC("COST_TRAINING_RUB"))
     min_price_multiplier: float = Field(default=2.0, validation_alias=AC("MIN_PRICE_MULTIPLIER"))
 
+    # Argon2: параметры стоимости (по умолчанию — как у passlib) и пул, в котором считаются хеши
+    argon2_time_cost: int = Field(default=3, validation_alias=AC("ARGON2_TIME_COST"))
+    argon2_memory_cost: int = Field(default=65536, validation_alias=AC("ARGON2_MEMORY_COST"))
+    argon2_parallelism: int = Field(default=4, validation_alias=AC("ARGON2_PARALLELISM"))
+    # thread | process | inline (inline — прямо в event loop, только для отладки)
+    password_hash_executor: str = Field(default="thread", validation_alias=AC("PASSWORD_HASH_EXECUTOR"))
+    password_hash_workers: int = Field(default=2, validation_alias=AC("PASSWORD_HASH_WORKERS"))
+    password_hash_max_concurrency: int = Field(default=4, validation_alias=AC("PASSWORD_HASH_MAX_CONCURRENCY"))
+
     access_token_minutes: int = Field(default=60, validation_alias=AC("ACCESS_TOKEN_MINUTES"))
+    # stateless: роль/активность/верификация берутся из claims токена без SELECT users на каждый запрос
+    auth_stateless: bool = Field(default=False, validation_alias=AC("AUTH_STATELESS"))
+    auth_revocation_refresh_seconds: float = Field(default=15.0, validation_alias=AC("AUTH_REVOCATION_REFRESH_SECONDS"))
     refresh_token_days: int = Field(default=30, validation_alias=AC("REFRESH_TOKEN_DAYS"))
+    # столько секунд после ротации старый refresh-токен — безобидный повтор (две вкладки, ретрай после обрыва),
+    # а не кража: 401 без отзыва сессии
+    refresh_reuse_grace_seconds: float = Field(default=10.0, validation_alias=AC("REFRESH_REUSE_GRACE_SECONDS"))
     max_identities_per_user: int = Field(default=3, validation_alias=AC("MAX_IDENTITIES_PER_USER"))
+    # Кеш обученных профилей лица (services/identities.py): каталог должен быть общим для web и воркеров
+    # (один диск/том); сверх max_bytes давно не использованные артефакты вытесняются
+    identity_cache_dir: str = Field(default="./data/identities", validation_alias=AC("IDENTITY_CACHE_DIR"))
+    identity_cache_max_bytes: int = Field(default=20 * 1024**3, validation_alias=AC("IDENTITY_CACHE_MAX_BYTES"))
+    # повторный заказ без обучения — только когда IDENTITY_CACHE_DIR и правда общий том: сейчас web и worker
+    # на разных дисках, web файл воркера не видит, так что каждый заказ обучает профиль заново
+    identity_reuse_enabled: bool = Field(default=False, validation_alias=AC("IDENTITY_REUSE_ENABLED"))
+    identity_max_photos: int = Field(default=30, validation_alias=AC("IDENTITY_MAX_PHOTOS"))
+
+    # Загрузки треков и фото (services/uploads.py): приём частями с докачкой, содержимое — по sha256 в UPLOAD_DIR
+    # (общий для web-инстансов и воркеров том)
+    upload_dir: str = Field(default="./data/uploads", validation_alias=AC("UPLOAD_DIR"))
+    upload_chunk_max_bytes: int = Field(default=8 * 1024 * 1024, validation_alias=AC("UPLOAD_CHUNK_MAX_BYTES"))
+    upload_chunk_timeout_seconds: float = Field(default=120.0, validation_alias=AC("UPLOAD_CHUNK_TIMEOUT_SECONDS"))
+    upload_session_hours: float = Field(default=24.0, validation_alias=AC("UPLOAD_SESSION_HOURS"))
+    upload_track_max_mb: int = Field(default=200, validation_alias=AC("UPLOAD_TRACK_MAX_MB"))
+    upload_photo_max_mb: int = Field(default=20, validation_alias=AC("UPLOAD_PHOTO_MAX_MB"))
+    # лимиты по плану поверх общих: "test_1.track:50,test_1.photo:10"
+    upload_plan_limits_mb: str = Field(default="test_1.track:50", validation_alias=AC("UPLOAD_PLAN_LIMITS_MB"))
+    # недогруженных загрузок на пользователя одновременно
+    upload_max_open_per_user: int = Field(default=5, validation_alias=AC("UPLOAD_MAX_OPEN_PER_USER"))
+    upload_track_types: str = Field(
+        default="audio/wav,audio/flac,audio/mpeg,audio/ogg,audio/mp4", validation_alias=AC("UPLOAD_TRACK_TYPES")
+    )
+    upload_photo_types: str = Field(default="image/jpeg,image/png,image/webp", validation_alias=AC("UPLOAD_PHOTO_TYPES"))
 
     @property
     def db_url(self) -> str:
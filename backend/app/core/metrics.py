@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Callable
+
+# Простые in-process метрики. Бакеты гистограмм выделяются один раз при создании,
+# observe() — только bisect и инкремент, без аллокаций на горячем пути.
+
+DEFAULT_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+    def expose(self, out: list[str], name: str, labels: str) -> None:
+        out.append(f"{name}{{{labels}}} {_num(self.value)}" if labels else f"{name} {_num(self.value)}")
+
+
+class Gauge:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+    def expose(self, out: list[str], name: str, labels: str) -> None:
+        out.append(f"{name}{{{labels}}} {_num(self.value)}" if labels else f"{name} {_num(self.value)}")
+
+
+class Histogram:
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS_S) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # последний слот — +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative: dict[str, int] = {}
+        running = 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            cumulative[f"{bound:g}"] = running
+        cumulative["+Inf"] = self.count
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": cumulative}
+
+    def expose(self, out: list[str], name: str, labels: str) -> None:
+        sep = "," if labels else ""
+        running = 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            out.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {running}')
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        if labels:
+            out.append(f"{name}_sum{{{labels}}} {_num(self.sum)}")
+            out.append(f"{name}_count{{{labels}}} {self.count}")
+        else:
+            out.append(f"{name}_sum {_num(self.sum)}")
+            out.append(f"{name}_count {self.count}")
+
+
+def _num(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_KINDS = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+
+# Семейство метрик с фиксированным набором меток. Дочерняя метрика создаётся один раз на набор значений;
+# горячий путь держит ссылку на неё и дальше не ходит в словарь.
+class MetricVec:
+    __slots__ = ("name", "help", "kind", "labelnames", "_factory", "_children", "_label_strs")
+
+    def __init__(self, name: str, help: str, kind: type, labelnames: tuple[str, ...], factory: Callable[[], object]) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self._factory = factory
+        self._children: dict[tuple[str, ...], object] = {}
+        self._label_strs: dict[tuple[str, ...], str] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._factory()
+            self._label_strs[values] = ",".join(f'{k}="{_label_value(v)}"' for k, v in zip(self.labelnames, values))
+        return child
+
+    def snapshot(self) -> dict:
+        return {",".join(values): child.snapshot() for values, child in self._children.items()}
+
+    def expose(self, out: list[str], name: str, labels: str) -> None:
+        for values, child in self._children.items():
+            child.expose(out, name, self._label_strs[values])
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Gauge | Histogram | MetricVec] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS_S) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def counter_vec(self, name: str, help: str, labelnames: tuple[str, ...]) -> MetricVec:
+        return self._register(MetricVec(name, help, Counter, labelnames, lambda: Counter(name, help)))
+
+    def gauge_vec(self, name: str, help: str, labelnames: tuple[str, ...]) -> MetricVec:
+        return self._register(MetricVec(name, help, Gauge, labelnames, lambda: Gauge(name, help)))
+
+    def histogram_vec(
+        self, name: str, help: str, labelnames: tuple[str, ...], buckets: tuple[float, ...] = DEFAULT_BUCKETS_S
+    ) -> MetricVec:
+        return self._register(MetricVec(name, help, Histogram, labelnames, lambda: Histogram(name, help, buckets)))
+
+    # Колбэк, который обновляет gauge-и прямо перед выдачей (например, состояние пула БД)
+    def add_collector(self, fn: Callable[[], None]) -> None:
+        self._collectors.append(fn)
+
+    def snapshot(self, prefix: str = "") -> dict:
+        return {name: m.snapshot() for name, m in self._metrics.items() if name.startswith(prefix)}
+
+    # Prometheus text exposition format 0.0.4
+    def render_prometheus(self) -> str:
+        for fn in self._collectors:
+            fn()
+        out: list[str] = []
+        for name, m in self._metrics.items():
+            kind = m.kind if isinstance(m, MetricVec) else type(m)
+            out.append(f"# HELP {name} {m.help}")
+            out.append(f"# TYPE {name} {_KINDS[kind]}")
+            m.expose(out, name, "")
+        out.append("")
+        return "\n".join(out)
+
+
+registry = Registry()
@@ -1,16 +1,41 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import hashlib
 import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 from jose import jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
-
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+from app.core.metrics import registry
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=settings.argon2_time_cost,
+    argon2__memory_cost=settings.argon2_memory_cost,
+    argon2__parallelism=settings.argon2_parallelism,
+)
+
+password_hash_queue = registry.histogram(
+    "password_hash_queue_seconds",
+    "Time an Argon2 call waited for a pool slot",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+password_hash_duration = registry.histogram(
+    "password_hash_seconds",
+    "Argon2 hash/verify compute time",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+password_hash_in_flight = registry.gauge("password_hash_in_flight", "Argon2 calls submitted and not finished")
+
+_executor: Executor | None = None
+_hash_sem = asyncio.Semaphore(settings.password_hash_max_concurrency)
 
 
 def hash_password(password: str) -> str:
@@ -21,6 +46,59 @@ def verify_password(password: str, password_hash: str) -> bool:
     return pwd_context.verify(password, password_hash)
 
 
+# verify + rehash, если параметры Argon2 в Settings поменялись (passlib needs_update)
+def verify_and_update_password(password: str, password_hash: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, password_hash)
+
+
+def _timed(fn, *args):
+    started_at = time.monotonic()
+    result = fn(*args)
+    return result, started_at, time.monotonic()
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.password_hash_executor == "process":
+            _executor = ProcessPoolExecutor(max_workers=settings.password_hash_workers)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="argon2")
+    return _executor
+
+
+async def _run_password_op(fn, *args):
+    if settings.password_hash_executor == "inline":
+        return fn(*args)
+
+    submitted_at = time.monotonic()
+    async with _hash_sem:
+        password_hash_in_flight.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started_at, finished_at = await loop.run_in_executor(_get_executor(), _timed, fn, *args)
+        finally:
+            password_hash_in_flight.dec()
+    password_hash_queue.observe(max(0.0, started_at - submitted_at))
+    password_hash_duration.observe(finished_at - started_at)
+    return result
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_op(hash_password, password)
+
+
+async def verify_and_update_password_async(password: str, password_hash: str) -> tuple[bool, str | None]:
+    return await _run_password_op(verify_and_update_password, password, password_hash)
+
+
+def shutdown_password_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
 def sha256_hex(value: str) -> str:
     return hashlib.sha256(value.encode("utf-8")).hexdigest()
 
@@ -29,17 +107,30 @@ def random_token_urlsafe(n_bytes: int = 32) -> str:
     return base64.urlsafe_b64encode(os.urandom(n_bytes)).decode("ascii").rstrip("=")
 
 
-def create_access_token(*, sub: str) -> str:
+def create_access_token(*, sub: str, claims: dict | None = None) -> str:
     now = datetime.now(timezone.utc)
     exp = now + timedelta(minutes=settings.access_token_minutes)
     payload = {"sub": sub, "iat": int(now.timestamp()), "exp": int(exp.timestamp())}
+    if claims:
+        payload.update(claims)
     return jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
 
 
+def user_claims(*, role: str, is_active: bool, email_verified: bool) -> dict:
+    return {"role": role, "is_active": is_active, "email_verified": email_verified}
+
+
 def create_refresh_token(*, sub: str) -> str:
     now = datetime.now(timezone.utc)
     exp = now + timedelta(days=settings.refresh_token_days)
-    payload = {"sub": sub, "iat": int(now.timestamp()), "exp": int(exp.timestamp()), "type": "refresh"}
+    # jti: два refresh-токена одного пользователя в одну секунду не должны совпасть (ротация по хешу)
+    payload = {
+        "sub": sub,
+        "iat": int(now.timestamp()),
+        "exp": int(exp.timestamp()),
+        "type": "refresh",
+        "jti": random_token_urlsafe(16),
+    }
     return jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
 
 
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timezone
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.db.base import Base
+from app.models.schema_meta import SchemaMeta
+
+# create_all создаёт только отсутствующие таблицы; изменения уже существующих — здесь.
+# Каждая команда идемпотентна, список только дописывается.
+STATEMENTS: list[str] = [
+    "ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS source_ip VARCHAR(45)",
+    "ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS verification VARCHAR(32)",
+    "ALTER TABLE payments ADD COLUMN IF NOT EXISTS last_checked_at TIMESTAMP WITH TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_payments_pending_created_at ON payments (created_at) WHERE status = 'pending'",
+    "ALTER TABLE user_sessions ADD COLUMN IF NOT EXISTS previous_token_hash VARCHAR(64)",
+    "ALTER TABLE user_sessions ADD COLUMN IF NOT EXISTS rotated_at TIMESTAMP WITH TIME ZONE",
+    # был полный индекс ix_user_sessions_previous_token_hash; заменён частичным (см. ниже) — не создаём его заново
+    "CREATE INDEX IF NOT EXISTS ix_user_sessions_live_previous_token_hash ON user_sessions (previous_token_hash) WHERE revoked_at IS NULL",
+    # payment_events: секция по умолчанию ловит строки, для месяца которых секцию ещё не создали
+    # (services/payment_events.py переносит их при создании секции)
+    "CREATE TABLE IF NOT EXISTS payment_events_default PARTITION OF payment_events DEFAULT",
+    # payments.raw_webhook -> payment_events: переносим последнее сохранённое уведомление и убираем колонку
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'payments' AND column_name = 'raw_webhook'
+        ) THEN
+            INSERT INTO payment_events (received_at, provider_payment_id, source, event, status, applied, payload)
+            SELECT COALESCE(paid_at, created_at), provider_payment_id, 'webhook', raw_webhook->>'event', status, true, raw_webhook
+            FROM payments
+            WHERE raw_webhook IS NOT NULL;
+            ALTER TABLE payments DROP COLUMN raw_webhook;
+        END IF;
+    END
+    $$
+    """,
+    # запас места на странице: отметки сверки (last_checked_at вне индексов) обновляются HOT
+    "ALTER TABLE payments SET (fillfactor = 90)",
+    # индексы по хешам токенов — только по живым строкам; полные удаляем
+    "CREATE INDEX IF NOT EXISTS ix_user_sessions_live_refresh_token_hash ON user_sessions (refresh_token_hash) WHERE revoked_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_email_verifications_live_token_hash ON email_verifications (token_hash) WHERE consumed_at IS NULL",
+    "DROP INDEX IF EXISTS ix_user_sessions_refresh_token_hash",
+    "DROP INDEX IF EXISTS ix_user_sessions_previous_token_hash",
+    "DROP INDEX IF EXISTS ix_email_verifications_token_hash",
+    # выборка кандидатов на удаление для фоновой чистки
+    "CREATE INDEX IF NOT EXISTS ix_user_sessions_expires_at ON user_sessions (expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_user_sessions_revoked_at ON user_sessions (revoked_at) WHERE revoked_at IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_email_verifications_expires_at ON email_verifications (expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_email_verifications_consumed_at ON email_verifications (consumed_at) WHERE consumed_at IS NOT NULL",
+    # кредиты для заказов, оплаченных до появления журнала, и списания за уже готовые рендеры. Только один раз,
+    # пока журнал пуст: повторный прогон (при каждой смене отпечатка схемы) записал бы списания за задачи,
+    # которые воркер ещё не оплатил, и debit_for_job пропустил бы их как уже списанные
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM credit_ledger) THEN
+            RETURN;
+        END IF;
+
+        INSERT INTO credit_ledger (user_id, kind, delta, reason, ref, order_id, created_at)
+        SELECT o.user_id, k.kind, k.n, 'grant', 'grant:' || o.id || ':' || k.kind, o.id, o.updated_at
+        FROM orders o
+        JOIN plans p ON p.id = o.plan_id
+        CROSS JOIN LATERAL (VALUES ('image', p.images_count), ('video', p.videos_count)) AS k(kind, n)
+        WHERE o.status IN ('paid', 'in_progress', 'completed', 'generation_failed') AND k.n > 0
+        ON CONFLICT (ref) DO NOTHING;
+
+        INSERT INTO credit_ledger (user_id, kind, delta, reason, ref, order_id, job_id, created_at)
+        SELECT j.user_id, j.kind, -1, 'debit', 'debit:' || j.id, j.order_id, j.id, COALESCE(j.started_at, j.created_at)
+        FROM generation_jobs j
+        WHERE j.kind IN ('image', 'video') AND j.status = 'done'
+        ON CONFLICT (ref) DO NOTHING;
+
+        INSERT INTO credit_balances (user_id, images, videos, updated_at)
+        SELECT user_id,
+               GREATEST(COALESCE(sum(delta) FILTER (WHERE kind = 'image'), 0), 0),
+               GREATEST(COALESCE(sum(delta) FILTER (WHERE kind = 'video'), 0), 0),
+               now()
+        FROM credit_ledger
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+            SET images = EXCLUDED.images, videos = EXCLUDED.videos, updated_at = EXCLUDED.updated_at;
+    END
+    $$
+    """,
+    # дневная норма помесячных планов; план, уже заведённый из DEFAULT_PLANS, seed не обновит
+    "ALTER TABLE plans ADD COLUMN IF NOT EXISTS daily_limit INTEGER",
+    "UPDATE plans SET daily_limit = 1 WHERE code = 'month_30' AND daily_limit IS NULL",
+    "UPDATE plans SET daily_limit = 3 WHERE code = 'month_90' AND daily_limit IS NULL",
+    "ALTER TABLE generation_jobs ADD COLUMN IF NOT EXISTS daily_limit SMALLINT",
+    "ALTER TABLE orders ADD COLUMN IF NOT EXISTS identity_profile_id UUID REFERENCES identity_profiles (id)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_identity_profile_id ON orders (identity_profile_id)",
+    "ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_webhook_events_finished_received_at ON webhook_events (received_at) "
+    "WHERE status IN ('done', 'duplicate', 'failed')",
+    # смена роли или активности пользователя отзывает его access-токены (services/auth_revocations.py) —
+    # и при правке из админки, и при ручном UPDATE в базе
+    """
+    CREATE OR REPLACE FUNCTION auth_revoke_on_user_change() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO auth_revocations (user_id, revoked_at) VALUES (NEW.id, now())
+        ON CONFLICT (user_id) DO UPDATE SET revoked_at = EXCLUDED.revoked_at;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS trg_users_auth_revoke ON users",
+    "CREATE TRIGGER trg_users_auth_revoke AFTER UPDATE OF role, is_active ON users FOR EACH ROW "
+    "WHEN (OLD.role IS DISTINCT FROM NEW.role OR OLD.is_active IS DISTINCT FROM NEW.is_active) "
+    "EXECUTE FUNCTION auth_revoke_on_user_change()",
+]
+
+# произвольная константа для pg_advisory_xact_lock: DDL при выкатке прогоняет ровно один воркер
+_SCHEMA_LOCK_ID = 7_201_001
+
+
+async def run_migrations(conn: AsyncConnection) -> None:
+    for stmt in STATEMENTS:
+        await conn.execute(text(stmt))
+
+
+# Отпечаток моделей + миграций. Меняется сам при любой правке схемы в коде — ручной номер версии не нужен.
+def schema_fingerprint() -> str:
+    dialect = postgresql.dialect()
+    h = hashlib.sha256()
+    for table in Base.metadata.sorted_tables:
+        h.update(str(CreateTable(table).compile(dialect=dialect)).encode("utf-8"))
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            h.update(str(CreateIndex(index).compile(dialect=dialect)).encode("utf-8"))
+    for stmt in STATEMENTS:
+        h.update(stmt.encode("utf-8"))
+    return h.hexdigest()
+
+
+async def _current_version(conn: AsyncConnection) -> str | None:
+    # таблицы ещё нет — первая загрузка на пустой базе. Проверяем через to_regclass, а не ловим ошибку
+    # SELECT: упавший запрос обрывает транзакцию, и create_all в ней получил бы InFailedSQLTransaction
+    q = await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": SchemaMeta.__tablename__})
+    if not q.scalar_one():
+        return None
+    q = await conn.execute(select(SchemaMeta.version).where(SchemaMeta.id == 1))
+    return q.scalar_one_or_none()
+
+
+# mode: check — DDL только при несовпадении версии; create_all — всегда, как раньше; skip — не трогаем схему.
+# Возвращает, что было сделано: current | migrated | skipped.
+async def ensure_schema(engine: AsyncEngine, mode: str = "check") -> str:
+    if mode == "skip":
+        return "skipped"
+
+    expected = schema_fingerprint()
+    if mode == "check":
+        async with engine.connect() as conn:
+            if await _current_version(conn) == expected:
+                return "current"
+
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _SCHEMA_LOCK_ID})
+        # пока ждали блокировку, схему мог обновить соседний воркер
+        if mode == "check" and await _current_version(conn) == expected:
+            return "current"
+        await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
+        now = datetime.now(timezone.utc)
+        await conn.execute(
+            insert(SchemaMeta)
+            .values(id=1, version=expected, applied_at=now)
+            .on_conflict_do_update(index_elements=[SchemaMeta.id], set_={"version": expected, "applied_at": now})
+        )
+    return "migrated"
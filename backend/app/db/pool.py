@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import sysconfig
+import time
+import traceback
+from contextvars import ContextVar
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.metrics import registry
+
+log = logging.getLogger(__name__)
+
+# ожидание свободного соединения бывает и субмиллисекундным, и упирается в pool_timeout
+POOL_WAIT_BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection", POOL_WAIT_BUCKETS_S
+)
+pool_timeouts = registry.counter("db_pool_timeouts_total", "Checkouts that hit pool_timeout")
+pool_checked_out = registry.gauge("db_pool_checked_out", "Connections currently checked out of the pool")
+pool_idle = registry.gauge("db_pool_idle", "Idle connections held by the pool")
+pool_overflow = registry.gauge("db_pool_overflow", "Connections open above pool_size")
+session_leaks = registry.counter("db_session_leaks_total", "Connections still checked out when their request finished")
+
+
+# QueuePool с замером ожидания в очереди пула (без pre-ping и сетевого connect новых соединений)
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_timeouts.inc()
+            raise
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started_at)
+
+
+def pool_status(engine: AsyncEngine) -> dict:
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, InstrumentedPool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        # QueuePool считает overflow от -pool_size; наружу — только реально открытые сверх size
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": pool._max_overflow,
+        "timeout_seconds": pool.timeout(),
+    }
+
+
+# gauge-и пула обновляются при выдаче /metrics, а не на каждом checkout
+def install_pool_gauges(engine: AsyncEngine) -> None:
+    def collect() -> None:
+        status = pool_status(engine)
+        if "size" in status:
+            pool_checked_out.set(status["checked_out"])
+            pool_idle.set(status["idle"])
+            pool_overflow.set(status["overflow"])
+
+    registry.add_collector(collect)
+
+
+# Соединения, взятые из пула в рамках текущего запроса: id(record) -> стек места checkout.
+# Greenlet-ы SQLAlchemy наследуют контекст задачи, так что событие пула видит переменную запроса.
+_request_checkouts: ContextVar[dict[int, traceback.StackSummary] | None] = ContextVar("db_request_checkouts", default=None)
+
+# глубже этого кадры места checkout не показывают — только стоимость на каждом checkout
+_STACK_LIMIT = 64
+
+
+_LIB_PREFIXES = tuple(
+    {os.path.abspath(p) for p in (sysconfig.get_paths()["stdlib"], sysconfig.get_paths()["purelib"], sysconfig.get_paths()["platlib"])}
+)
+
+
+# На checkout — только кадры, начиная с вызвавшего checkout кода, без чтения исходников (lookup_lines=False):
+# это горячий путь каждого запроса. Строки кода подтягиваются при форматировании, то есть лишь при утечке.
+def _capture_stack() -> traceback.StackSummary:
+    return traceback.StackSummary.extract(traceback.walk_stack(sys._getframe(2)), limit=_STACK_LIMIT, lookup_lines=False)
+
+
+# Стек только по коду приложения: кадры SQLAlchemy/Starlette/asyncio место утечки не показывают
+def _app_stack(stack: traceback.StackSummary) -> str:
+    frames = [f for f in reversed(stack) if not os.path.abspath(f.filename).startswith(_LIB_PREFIXES)]
+    return "".join(traceback.format_list(frames[-12:]))
+
+
+def install_leak_detection(engine: AsyncEngine) -> None:
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+        tracked = _request_checkouts.get()
+        if tracked is None:
+            return
+        tracked[id(connection_record)] = _capture_stack()
+        # checkin может случиться в чужом контексте (сборщик мусора), поэтому владельца храним на записи
+        connection_record.info["leak_owner"] = tracked
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record) -> None:
+        tracked = connection_record.info.pop("leak_owner", None)
+        if tracked is not None:
+            tracked.pop(id(connection_record), None)
+
+
+# ASGI-обёртка: после ответа проверяет, что запрос вернул в пул все взятые соединения
+class DbLeakMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracked: dict[int, traceback.StackSummary] = {}
+        token = _request_checkouts.set(tracked)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_checkouts.reset(token)
+            if tracked:
+                route = scope.get("route")
+                path = getattr(route, "path", None) or scope.get("path")
+                session_leaks.inc(len(tracked))
+                for stack in list(tracked.values()):
+                    log.warning(
+                        "DB connection not returned to pool after %s %s; checked out at:\n%s", scope.get("method"), path, _app_stack(stack)
+                    )
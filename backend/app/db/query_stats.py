@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import logging
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.metrics import registry
+
+log = logging.getLogger(__name__)
+
+slow_queries = registry.counter("sql_slow_queries_total", "SQL statements slower than SQL_SLOW_QUERY_MS")
+n_plus_one = registry.counter("sql_n_plus_one_total", "Requests that repeated one statement SQL_N_PLUS_ONE_THRESHOLD+ times")
+
+
+# Счётчики SQL в рамках одного запроса. Заводит тот, кто обслуживает запрос (обёртка маршрута),
+# события движка только прибавляют — вне запроса (воркеры, старт) ничего не копится.
+# statements (нормализованный SQL -> сколько раз) ведётся только при включённом профайлере.
+class RequestQueryStats:
+    __slots__ = ("queries", "db_seconds", "label", "statements")
+
+    def __init__(self, label: str = "", *, profile: bool = False) -> None:
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.label = label
+        self.statements: dict[str, int] | None = {} if profile else None
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        if not self.statements:
+            return []
+        return sorted(((sql, n) for sql, n in self.statements.items() if n >= threshold), key=lambda x: -x[1])
+
+
+current_query_stats: ContextVar[RequestQueryStats | None] = ContextVar("current_query_stats", default=None)
+
+_BIND = re.compile(r"\$\d+|%\(\w+\)s|\?")
+# IN ($1, $2, $3) и VALUES (...), (...) разной длины — это один и тот же запрос
+_BIND_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_ROW_LIST = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    sql = _SPACES.sub(" ", statement).strip()
+    sql = _BIND.sub("?", sql)
+    sql = _BIND_LIST.sub("...", sql)
+    sql = sql.replace("(?)", "(...)")
+    return _ROW_LIST.sub("(...)", sql)
+
+
+# slow_query_seconds=None — только время и число запросов для метрик, без лога медленных
+def install_query_timer(engine: AsyncEngine, *, slow_query_seconds: float | None = None) -> None:
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        if slow_query_seconds is not None or current_query_stats.get() is not None:
+            conn.info["query_started_at"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        started_at = conn.info.pop("query_started_at", None)
+        if started_at is None:
+            return
+        elapsed = time.perf_counter() - started_at
+        stats = current_query_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            if stats.statements is not None:
+                sql = normalize_sql(statement)
+                stats.statements[sql] = stats.statements.get(sql, 0) + 1
+        if slow_query_seconds is not None and elapsed >= slow_query_seconds:
+            slow_queries.inc()
+            log.warning(
+                "slow query %.1f ms [%s]: %s", elapsed * 1000, stats.label if stats is not None else "background", normalize_sql(statement)
+            )
+
+
+# Вызывается в конце запроса при включённом профайлере
+def report_repeated(stats: RequestQueryStats, threshold: int) -> None:
+    repeated = stats.repeated(threshold)
+    if not repeated:
+        return
+    n_plus_one.inc()
+    for sql, n in repeated:
+        log.warning("likely N+1 [%s]: %d× %s", stats.label, n, sql)
@@ -4,8 +4,27 @@ from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engin
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.pool import InstrumentedPool, install_leak_detection, install_pool_gauges
+from app.db.query_stats import install_query_timer
 
-engine: AsyncEngine = create_async_engine(settings.db_url, pool_pre_ping=True)
+engine: AsyncEngine = create_async_engine(
+    settings.db_url,
+    poolclass=InstrumentedPool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout_seconds,
+    pool_recycle=settings.db_pool_recycle_seconds,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+
+install_pool_gauges(engine)
+install_query_timer(
+    engine,
+    slow_query_seconds=settings.sql_slow_query_ms / 1000 if settings.sql_profiler_enabled else None,
+)
+
+if settings.db_leak_detection:
+    install_leak_detection(engine)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -2,3 +2,17 @@ from app.models.user import User
 from app.models.email_verification import EmailVerification
 from app.models.session_token import UserSession
 from app.models.style import Style
+from app.models.webhook_event import WebhookEvent
+from app.models.auth_revocation import AuthRevocation
+from app.models.cache_version import CacheVersion
+from app.models.schema_meta import SchemaMeta
+from app.models.payment_intent import PaymentIntent
+from app.models.idempotency_key import IdempotencyKey
+from app.models.payment_event import PaymentEvent
+from app.models.generation_job import GenerationJob
+from app.models.credit_ledger import CreditLedgerEntry
+from app.models.credit_balance import CreditBalance
+from app.models.generation_daily_usage import GenerationDailyUsage
+from app.models.identity_profile import IdentityProfile
+from app.models.upload_blob import UploadBlob
+from app.models.upload import Upload
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Access-токены пользователя, выпущенные до revoked_at, недействительны (деактивация, смена роли).
+# Одна строка на пользователя; читается всеми процессами в stateless-режиме авторизации.
+class AuthRevocation(Base):
+    __tablename__ = "auth_revocations"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    revoked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
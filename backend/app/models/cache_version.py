@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Версии редко меняющихся каталогов (стили, тарифы). Запись инкрементирует версию,
+# процессы опрашивают таблицу и сбрасывают свои кеши при расхождении.
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=1)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
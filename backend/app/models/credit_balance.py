@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import CheckConstraint, DateTime, ForeignKey, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Текущий остаток кредитов: «может ли пользователь генерировать» — чтение строки по PK, без агрегации журнала
+class CreditBalance(Base):
+    __tablename__ = "credit_balances"
+    __table_args__ = (
+        # последняя линия защиты от ухода в минус; списание и так условное (services/credits.py)
+        CheckConstraint("images >= 0 AND videos >= 0", name="ck_credit_balances_non_negative"),
+    )
+
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    images: Mapped[int] = mapped_column(Integer, default=0)
+    videos: Mapped[int] = mapped_column(Integer, default=0)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
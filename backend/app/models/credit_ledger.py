@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Журнал кредитов (только дописывается): начисление за оплаченный заказ, списание при старте задачи
+# генерации, возврат при её окончательной ошибке. Баланс — в credit_balances, меняется в той же транзакции.
+class CreditLedgerEntry(Base):
+    __tablename__ = "credit_ledger"
+    __table_args__ = (
+        # история пользователя по порядку записи
+        Index("ix_credit_ledger_user_id_id", "user_id", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"))
+
+    # image | video
+    kind: Mapped[str] = mapped_column(String(16))
+    delta: Mapped[int] = mapped_column(Integer)
+    # grant | debit | refund
+    reason: Mapped[str] = mapped_column(String(16))
+
+    # ключ операции (grant:<order>:<kind>, debit:<job>, refund:<job>): повтор той же операции не меняет баланс
+    ref: Mapped[str] = mapped_column(String(80), unique=True)
+    order_id: Mapped[uuid.UUID | None] = mapped_column(ForeignKey("orders.id"), nullable=True)
+    job_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
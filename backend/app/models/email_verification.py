@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, String
+from sqlalchemy import DateTime, ForeignKey, Index, String, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -12,11 +12,18 @@ from app.db.base import Base
 
 class EmailVerification(Base):
     __tablename__ = "email_verifications"
+    __table_args__ = (
+        # verify_email ищет только неиспользованные токены — индекс растёт с числом живых, а не всех регистраций
+        Index("ix_email_verifications_live_token_hash", "token_hash", postgresql_where=text("consumed_at IS NULL")),
+        # для фоновой чистки (services/db_maintenance.py)
+        Index("ix_email_verifications_expires_at", "expires_at"),
+        Index("ix_email_verifications_consumed_at", "consumed_at", postgresql_where=text("consumed_at IS NOT NULL")),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), index=True, nullable=False)
 
-    token_hash: Mapped[str] = mapped_column(String(64), index=True, nullable=False)
+    token_hash: Mapped[str] = mapped_column(String(64), nullable=False)
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     consumed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import uuid
+from datetime import date
+
+from sqlalchemy import Date, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Дневной счётчик запусков по подписке (планы с daily_limit): проверка нормы — одна строка по PK.
+# Старые дни удаляет фоновая чистка (services/db_maintenance.py).
+class GenerationDailyUsage(Base):
+    __tablename__ = "generation_daily_usage"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    # календарный день UTC
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    # image | video
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+    used: Mapped[int] = mapped_column(Integer, default=0)
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, SmallInteger, String, Text, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Очередь генерации: по задаче на каждое изображение/видео оплаченного заказа.
+# Ставится в транзакции, которая переводит заказ в paid; выполняют воркеры (python -m app.worker).
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        # повторное уведомление об оплате не размножит задачи
+        UniqueConstraint("order_id", "kind", "seq", name="uq_generation_jobs_order_kind_seq"),
+        # выборка готовых к запуску в порядке очереди — индекс только по ожидающим
+        Index("ix_generation_jobs_ready", "priority", "run_at", "id", postgresql_where=text("status = 'queued'")),
+        # поиск задач с истёкшей арендой (воркер умер, не продлив её)
+        Index("ix_generation_jobs_running_lease", "lease_expires_at", postgresql_where=text("status = 'running'")),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+
+    order_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("orders.id"), index=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), index=True)
+
+    # image | video; seq — номер в заказе (1..images_count / videos_count)
+    kind: Mapped[str] = mapped_column(String(16))
+    seq: Mapped[int] = mapped_column(Integer)
+
+    # меньше — раньше: тестовые заказы идут впереди пакетных месячных
+    priority: Mapped[int] = mapped_column(SmallInteger, default=10)
+
+    # норма плана в день (services/generation_schedule.py); None — без дневного ограничения
+    daily_limit: Mapped[int | None] = mapped_column(SmallInteger, nullable=True)
+
+    # queued -> running -> done | failed
+    status: Mapped[str] = mapped_column(String(16), default="queued")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=5)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    result: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+
+    # не раньше этого момента: слот расписания или отложенный повтор после ошибки
+    run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # аренда: воркер продлевает её heartbeat-ом; истекла — задача возвращается в очередь
+    worker_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Профиль лица пользователя: обученный по набору референсных фото артефакт на локальном диске
+# (services/identities.py). Это индекс дискового кеша: путь, размер и время последнего использования для LRU.
+class IdentityProfile(Base):
+    __tablename__ = "identity_profiles"
+    __table_args__ = (
+        # кандидаты на вытеснение — только готовые, от давно не использованных
+        Index("ix_identity_profiles_ready_last_used", "last_used_at", postgresql_where=text("status = 'ready'")),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), index=True)
+
+    # sha256 от пользователя и отсортированных sha256 фото: тот же набор фото — тот же профиль
+    photo_set_hash: Mapped[str] = mapped_column(String(64), unique=True)
+    photo_count: Mapped[int] = mapped_column(Integer)
+
+    # pending -> ready | failed; ready -> evicted (файл вытеснен, нужно переобучение)
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+
+    # относительно IDENTITY_CACHE_DIR
+    artifact_path: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    artifact_size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    artifact_sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    trained_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_used_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    evicted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
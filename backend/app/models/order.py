@@ -17,6 +17,9 @@ class Order(Base):
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), index=True)
     plan_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("plans.id"), index=True)
 
+    # профиль лица, на котором генерируется заказ; без него — заказ старого формата, без обучения
+    identity_profile_id: Mapped[uuid.UUID | None] = mapped_column(ForeignKey("identity_profiles.id"), nullable=True, index=True)
+
     status: Mapped[str] = mapped_column(String(32), index=True, default="created")
     currency: Mapped[str] = mapped_column(String(3), default="RUB")
 
@@ -3,8 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, Text, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base
@@ -12,6 +11,10 @@ from app.db.base import Base
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # сверка сканирует только зависшие pending — индекс не растёт вместе с историей платежей
+        Index("ix_payments_pending_created_at", "created_at", postgresql_where=text("status = 'pending'")),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
 
@@ -25,7 +28,9 @@ class Payment(Base):
 
     confirmation_url: Mapped[str | None] = mapped_column(Text, nullable=True)
 
-    raw_webhook: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # сырые уведомления — в payment_events (models/payment_event.py), здесь только текущее состояние
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     paid_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # когда сверка последний раз спрашивала статус у ЮKassa
+    last_checked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, Boolean, DateTime, Index, PrimaryKeyConstraint, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Журнал событий платежа (только дописывается): сырое уведомление или ответ сверки на каждое подтверждённое событие.
+# Секционирован по месяцам received_at — старые секции отсоединяются целиком (services/payment_events.py),
+# а строка payments остаётся узкой. PK обязан включать ключ секционирования.
+class PaymentEvent(Base):
+    __tablename__ = "payment_events"
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "received_at"),
+        Index("ix_payment_events_payment_received", "provider_payment_id", "received_at"),
+        {"postgresql_partition_by": "RANGE (received_at)"},
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, autoincrement=True)
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    provider_payment_id: Mapped[str] = mapped_column(String(64))
+    # webhook | reconcile
+    source: Mapped[str] = mapped_column(String(16))
+    event: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # подтверждённый статус ЮKassa и применился ли переход (False — повтор или запоздавшее событие)
+    status: Mapped[str] = mapped_column(String(32))
+    applied: Mapped[bool] = mapped_column(Boolean, default=False)
+
+    payload: Mapped[dict] = mapped_column(JSONB)
@@ -17,6 +17,8 @@ class Plan(Base):
     title: Mapped[str] = mapped_column(String(200))
     images_count: Mapped[int] = mapped_column(Integer)
     videos_count: Mapped[int] = mapped_column(Integer)
+    # норма в день для помесячных планов: задачи расписываются по дням периода; None — всё сразу
+    daily_limit: Mapped[int | None] = mapped_column(Integer, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, String
+from sqlalchemy import DateTime, ForeignKey, Index, String, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -12,11 +12,22 @@ from app.db.base import Base
 
 class UserSession(Base):
     __tablename__ = "user_sessions"
+    __table_args__ = (
+        # поиск по хешу идёт только среди живых сессий: отозванные в индекс не попадают и его не раздувают
+        Index("ix_user_sessions_live_refresh_token_hash", "refresh_token_hash", postgresql_where=text("revoked_at IS NULL")),
+        Index("ix_user_sessions_live_previous_token_hash", "previous_token_hash", postgresql_where=text("revoked_at IS NULL")),
+        # для фоновой чистки (services/db_maintenance.py)
+        Index("ix_user_sessions_expires_at", "expires_at"),
+        Index("ix_user_sessions_revoked_at", "revoked_at", postgresql_where=text("revoked_at IS NOT NULL")),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), index=True, nullable=False)
 
-    refresh_token_hash: Mapped[str] = mapped_column(String(64), index=True, nullable=False)
+    refresh_token_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    # хеш предыдущего refresh-токена: его повторное предъявление позже grace-окна после rotated_at = кража, сессию отзываем
+    previous_token_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    rotated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     revoked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
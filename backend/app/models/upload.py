@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, String, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Загрузка файла пользователем (трек или референсное фото) по частям: services/uploads.py.
+# Пока идёт приём, байты лежат в part-файле; по завершении содержимое — в upload_blobs по sha256.
+class Upload(Base):
+    __tablename__ = "uploads"
+    __table_args__ = (
+        # «этот пользователь уже загружал такое содержимое» — повторная загрузка не нужна
+        Index("ix_uploads_user_sha256", "user_id", "sha256", postgresql_where=text("status = 'complete'")),
+        # недогруженные с истёкшим сроком — для фоновой чистки
+        Index("ix_uploads_receiving_expires_at", "expires_at", postgresql_where=text("status = 'receiving'")),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), index=True)
+
+    # track | photo
+    kind: Mapped[str] = mapped_column(String(16))
+    content_type: Mapped[str] = mapped_column(String(100))
+    # план, по лимитам которого принимается файл
+    plan_code: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    # заявленный размер и сколько уже принято подряд с начала
+    size: Mapped[int] = mapped_column(BigInteger)
+    received: Mapped[int] = mapped_column(BigInteger, default=0)
+
+    # receiving -> complete | failed (не совпал заявленный sha256)
+    status: Mapped[str] = mapped_column(String(16), default="receiving")
+    # заявленный клиентом хеш (необязателен) и фактический после приёма
+    expected_sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    # кто сейчас пишет часть: пишет ровно один запрос, параллельный получит 409
+    writer: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    writer_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # срок на докачку; продлевается каждой принятой частью
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Содержимое загрузок по sha256: одинаковый файл хранится один раз, сколько бы пользователей его ни загрузили
+class UploadBlob(Base):
+    __tablename__ = "upload_blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger)
+    # тип, определённый по первым байтам файла (а не по заявленному клиентом)
+    content_type: Mapped[str] = mapped_column(String(100))
+    # относительно UPLOAD_DIR
+    path: Mapped[str] = mapped_column(String(255))
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
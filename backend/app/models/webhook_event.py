@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, DateTime, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+# Inbox входящих уведомлений: вебхук только пишет сюда сырое событие, воркеры разбирают
+class WebhookEvent(Base):
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        # воркеры выбирают только необработанное — индекс держим маленьким
+        Index("ix_webhook_events_pending", "id", postgresql_where=text("status IN ('pending', 'processing')")),
+        # обработанные — кандидаты на удаление фоновой чисткой (services/db_maintenance.py)
+        Index(
+            "ix_webhook_events_finished_received_at",
+            "received_at",
+            postgresql_where=text("status IN ('done', 'duplicate', 'failed')"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+
+    provider: Mapped[str] = mapped_column(String(32), default="yookassa")
+    event: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    provider_payment_id: Mapped[str] = mapped_column(String(64), index=True)
+    payload: Mapped[dict] = mapped_column(JSONB)
+    source_ip: Mapped[str | None] = mapped_column(String(45), nullable=True)
+
+    # чем подтверждён статус: refetch | source_ip | pushed_non_terminal (см. services/webhook_verify.py)
+    verification: Mapped[str | None] = mapped_column(String(32), nullable=True)
+
+    # pending -> processing -> done | duplicate | failed
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # повтор после неудачной проверки — не раньше этого момента; None — сразу
+    next_attempt_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    processed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
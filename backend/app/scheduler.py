@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app.db.session import AsyncSessionLocal, engine
+import app.db.base  # noqa: F401  (важно: модели импортируются через base, иначе круговой импорт)
+from app.models.generation_job import GenerationJob
+from app.models.plan import Plan
+from app.services.generation_schedule import format_curve, hourly_curve, render_window, slot_times
+
+# Прогноз почасовой нагрузки рендера без записи в базу: python -m app.scheduler --simulate month_30=1000,month_90=200.
+# Оплаты распределяются по --paid-window-hours от текущего часа; naive — все задачи в момент оплаты (как до
+# расписания), scheduled — по слотам services/generation_schedule.py с текущими настройками окна.
+
+
+def parse_counts(value: str) -> dict[str, int]:
+    out = {}
+    for part in value.split(","):
+        code, sep, n = part.partition("=")
+        if sep and code.strip():
+            out[code.strip()] = int(n)
+    return out
+
+
+async def load_plans(offline: bool) -> dict[str, dict]:
+    if offline:
+        from app.main import DEFAULT_PLANS
+
+        return {p["code"]: p for p in DEFAULT_PLANS}
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(select(Plan.code, Plan.images_count, Plan.videos_count, Plan.daily_limit))
+        return {r.code: r._asdict() for r in q.all()}
+
+
+# Уже стоящие в очереди задачи — общая база для обеих кривых
+async def load_queued(since: datetime, until: datetime) -> Counter:
+    hour = func.date_trunc("hour", GenerationJob.run_at)
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(
+            select(hour.label("hour"), func.count())
+            .where(GenerationJob.status == "queued", GenerationJob.run_at < until)
+            .group_by(hour)
+        )
+        # просроченные запустятся в первый же час
+        return Counter({max(h, since): n for h, n in q.all()})
+
+
+async def main(args: argparse.Namespace) -> None:
+    counts = parse_counts(args.simulate)
+    plans = await load_plans(args.offline)
+    unknown = sorted(set(counts) - set(plans))
+    if unknown:
+        raise SystemExit(f"unknown plan code(s): {', '.join(unknown)}; known: {', '.join(sorted(plans))}")
+
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    window = render_window()
+    rnd = random.Random(args.seed)
+    naive: list[datetime] = []
+    scheduled: list[datetime] = []
+    for code, n in counts.items():
+        plan = plans[code]
+        for _ in range(n):
+            paid_at = start + timedelta(seconds=rnd.uniform(0, args.paid_window_hours * 3600))
+            order_id = uuid.UUID(int=rnd.getrandbits(128))
+            for units in (plan["images_count"], plan["videos_count"]):
+                naive.extend([paid_at] * units)
+                scheduled.extend(slot_times(order_id, paid_at, units, plan["daily_limit"], window))
+
+    curves = {"naive": hourly_curve(naive), "scheduled": hourly_curve(scheduled)}
+    if args.include_queued:
+        queued = await load_queued(start, start + timedelta(hours=args.hours))
+        for c in curves.values():
+            c.update(queued)
+    print(f"window: {window.start_hour:02d}:00 UTC + {window.hours}h; jobs: {len(naive)}")
+    print(format_curve(curves, hours=args.hours))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dry run of the generation schedule: projected hourly render load")
+    parser.add_argument("--simulate", required=True, help="orders per plan code: month_30=1000,month_90=200")
+    parser.add_argument("--paid-window-hours", type=float, default=1.0, help="payments arrive over this many hours")
+    parser.add_argument("--hours", type=int, default=72, help="hours of the curve to print")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--offline", action="store_true", help="use DEFAULT_PLANS instead of the plans table")
+    parser.add_argument("--include-queued", action="store_true", help="add jobs already queued in the database")
+    args = parser.parse_args()
+    if args.offline and args.include_queued:
+        parser.error("--include-queued needs the database")
+    asyncio.run(main(args))
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Literal
+
 from pydantic import BaseModel, EmailStr, Field
 
 
@@ -23,3 +25,8 @@ class MeOut(BaseModel):
     email: EmailStr
     role: str
     email_verified: bool
+
+
+class UserAdminUpdateIn(BaseModel):
+    role: Literal["user", "admin"] | None = None
+    is_active: bool | None = None
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.auth_revocation import AuthRevocation
+
+log = logging.getLogger(__name__)
+
+
+# Снимок недавних отзывов в памяти процесса. Старше срока жизни access-токена хранить незачем:
+# такие токены и так истекли. Задержка применения отзыва — не больше интервала обновления.
+class RevocationCache:
+    def __init__(self, *, refresh_seconds: float, window_minutes: int) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.window = timedelta(minutes=window_minutes)
+        self._revoked: dict[uuid.UUID, float] = {}
+        self._task: asyncio.Task | None = None
+
+    # iat в JWT — целые секунды: токен, выданный в ту же секунду сразу после отзыва (новый вход, refresh),
+    # иначе отвергался бы. Поэтому сравниваем с секундой отзыва строго: токены, выданные в ту же секунду
+    # до отзыва, остаются в силе — окно не больше секунды.
+    def is_revoked(self, user_id: uuid.UUID, issued_at: int | float) -> bool:
+        revoked_at = self._revoked.get(user_id)
+        return revoked_at is not None and issued_at < int(revoked_at)
+
+    def mark(self, user_id: uuid.UUID, revoked_at: datetime) -> None:
+        self._revoked[user_id] = revoked_at.timestamp()
+
+    async def refresh(self) -> None:
+        since = datetime.now(timezone.utc) - self.window
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(
+                select(AuthRevocation.user_id, AuthRevocation.revoked_at).where(AuthRevocation.revoked_at >= since)
+            )
+            self._revoked = {user_id: revoked_at.timestamp() for user_id, revoked_at in q.all()}
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.create_task(self._run(), name="auth-revocations")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("auth revocations refresh failed")
+
+
+revocations = RevocationCache(
+    refresh_seconds=settings.auth_revocation_refresh_seconds,
+    window_minutes=settings.access_token_minutes,
+)
+
+
+# Вызывать при деактивации пользователя или смене роли (PATCH /admin/users/{id}); строку при таком UPDATE пишет и
+# триггер trg_users_auth_revoke (db/migrations.py), вызов отсюда ещё и сразу отмечает отзыв в кеше процесса.
+# Коммит — на вызывающем.
+async def revoke_user_tokens(db: AsyncSession, user_id: uuid.UUID) -> None:
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        insert(AuthRevocation)
+        .values(user_id=user_id, revoked_at=now)
+        .on_conflict_do_update(index_elements=[AuthRevocation.user_id], set_={"revoked_at": now})
+    )
+    revocations.mark(user_id, now)
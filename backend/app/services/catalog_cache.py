@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.cache_version import CacheVersion
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    body: bytes
+    etag: str
+
+
+def dump_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def json_body(data) -> CachedBody:
+    body = dump_json(data)
+    return CachedBody(body=body, etag=make_etag(body))
+
+
+# Собранное значение каталога (обычно готовое тело ответа) в памяти процесса. Пересобирается,
+# только когда ушла вперёд версия из cache_versions или локальный счётчик сбросов;
+# параллельные промахи ждут одну сборку.
+class CatalogCache(Generic[T]):
+    def __init__(self, key: str, loader: Callable[[], Awaitable[T]]) -> None:
+        self.key = key
+        self._loader = loader
+        # версия из базы и локальные сбросы раздельно: сброс без версии не должен занимать номер,
+        # который потом придёт из cache_versions, иначе observe_version его пропустит
+        self._version = 0
+        self._local = 0
+        self._entry: T | None = None
+        self._entry_version: tuple[int, int] | None = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self, version: int | None = None) -> None:
+        if version is None:
+            self._local += 1
+        else:
+            self.observe_version(version)
+
+    def observe_version(self, version: int) -> None:
+        if version > self._version:
+            self._version = version
+
+    async def get(self) -> T:
+        entry = self._entry
+        if entry is not None and self._entry_version == (self._version, self._local):
+            return entry
+        async with self._lock:
+            if self._entry is None or self._entry_version != (self._version, self._local):
+                version = (self._version, self._local)
+                self._entry = await self._loader()
+                self._entry_version = version
+            return self._entry
+
+
+class CatalogVersions:
+    def __init__(self, poll_seconds: float) -> None:
+        self.poll_seconds = poll_seconds
+        self._caches: dict[str, CatalogCache] = {}
+        self._task: asyncio.Task | None = None
+
+    def register(self, cache: CatalogCache) -> CatalogCache:
+        self._caches[cache.key] = cache
+        return cache
+
+    async def refresh(self) -> None:
+        if not self._caches:
+            return
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(select(CacheVersion.key, CacheVersion.version).where(CacheVersion.key.in_(list(self._caches))))
+            rows = q.all()
+        for key, version in rows:
+            self._caches[key].observe_version(version)
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.create_task(self._run(), name="catalog-versions")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("catalog versions refresh failed")
+
+
+catalog_versions = CatalogVersions(settings.catalog_version_poll_seconds)
+
+
+# Вызывается в той же транзакции, что и изменение каталога. Коммит — на вызывающем;
+# после коммита — cache.invalidate(version), чтобы этот процесс не ждал опроса.
+async def bump_version(db: AsyncSession, key: str) -> int:
+    now = datetime.now(timezone.utc)
+    q = await db.execute(
+        insert(CacheVersion)
+        .values(key=key, version=1, updated_at=now)
+        .on_conflict_do_update(
+            index_elements=[CacheVersion.key],
+            set_={"version": CacheVersion.version + 1, "updated_at": now},
+        )
+        .returning(CacheVersion.version)
+    )
+    return q.scalar_one()
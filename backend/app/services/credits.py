@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import uuid
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSON
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import Text, Uuid
+
+from app.core.metrics import registry
+
+# Кредиты на генерацию: журнал credit_ledger + остаток credit_balances, оба меняются одним оператором.
+# Каждая запись журнала несёт уникальный ref операции — повтор (повторный вебхук, перезапуск задачи)
+# не вставит запись, а значит и не тронет баланс.
+
+credits_granted = registry.counter_vec("credits_granted_total", "Generation credits granted for paid orders", ("kind",))
+credits_debited = registry.counter_vec("credits_debited_total", "Generation credits spent on job start", ("kind",))
+credits_refunded = registry.counter_vec("credits_refunded_total", "Generation credits returned for failed jobs", ("kind",))
+credits_insufficient = registry.counter("credits_insufficient_total", "Job starts refused for lack of credits")
+
+
+class InsufficientCredits(Exception):
+    pass
+
+
+# Добавляет к балансам суммы из CTE changed(user_id, kind, delta); строки блокируются в порядке user_id
+_APPLY_TO_BALANCES = """
+    totals AS (
+        SELECT user_id,
+               COALESCE(sum(delta) FILTER (WHERE kind = 'image'), 0) AS images,
+               COALESCE(sum(delta) FILTER (WHERE kind = 'video'), 0) AS videos
+        FROM changed
+        GROUP BY user_id
+    )
+    INSERT INTO credit_balances (user_id, images, videos, updated_at)
+    SELECT user_id, images, videos, now() FROM totals ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET images = credit_balances.images + excluded.images,
+        videos = credit_balances.videos + excluded.videos,
+        updated_at = now()
+"""
+
+_GRANT_SQL = text(
+    """
+    WITH changed AS (
+        INSERT INTO credit_ledger (user_id, kind, delta, reason, ref, order_id, created_at)
+        SELECT o.user_id, k.kind, k.n, 'grant', 'grant:' || o.id || ':' || k.kind, o.id, now()
+        FROM orders o
+        JOIN plans p ON p.id = o.plan_id
+        CROSS JOIN LATERAL (VALUES ('image', p.images_count), ('video', p.videos_count)) AS k(kind, n)
+        WHERE o.id = ANY(:order_ids) AND k.n > 0
+        ON CONFLICT (ref) DO NOTHING
+        RETURNING user_id, kind, delta
+    ),
+    """
+    + _APPLY_TO_BALANCES
+    + " RETURNING (SELECT json_object_agg(kind, n) FROM (SELECT kind, sum(delta) AS n FROM changed GROUP BY kind) s) AS granted"
+).bindparams(bindparam("order_ids", type_=ARRAY(Uuid))).columns(granted=JSON)
+
+# Списание одного кредита. Сначала запись в журнал (уникальный ref сериализует повторы той же задачи),
+# затем условный декремент: строка баланса блокируется, и после ожидания условие >= 1 перепроверяется
+# на свежей версии строки — параллельные старты не уведут баланс в минус.
+_DEBIT_SQL = text(
+    """
+    WITH entry AS (
+        INSERT INTO credit_ledger (user_id, kind, delta, reason, ref, order_id, job_id, created_at)
+        VALUES (:user_id, :kind, -1, 'debit', :ref, :order_id, :job_id, now())
+        ON CONFLICT (ref) DO NOTHING
+        RETURNING user_id, kind
+    ),
+    spent AS (
+        UPDATE credit_balances b
+        SET images = b.images - CASE WHEN e.kind = 'image' THEN 1 ELSE 0 END,
+            videos = b.videos - CASE WHEN e.kind = 'video' THEN 1 ELSE 0 END,
+            updated_at = now()
+        FROM entry e
+        WHERE b.user_id = e.user_id
+          AND CASE WHEN e.kind = 'image' THEN b.images ELSE b.videos END >= 1
+        RETURNING b.user_id
+    )
+    SELECT (SELECT count(*) FROM entry) AS recorded, (SELECT count(*) FROM spent) AS spent
+    """
+).bindparams(bindparam("user_id", type_=Uuid), bindparam("order_id", type_=Uuid))
+
+# Возврат — зеркальная запись к списанию задачи; нет списания — нечего возвращать
+_REFUND_SQL = text(
+    """
+    WITH changed AS (
+        INSERT INTO credit_ledger (user_id, kind, delta, reason, ref, order_id, job_id, created_at)
+        SELECT d.user_id, d.kind, -d.delta, 'refund', 'refund:' || d.job_id, d.order_id, d.job_id, now()
+        FROM credit_ledger d
+        WHERE d.ref = ANY(:debit_refs)
+        ON CONFLICT (ref) DO NOTHING
+        RETURNING user_id, kind, delta
+    ),
+    """
+    + _APPLY_TO_BALANCES
+    + " RETURNING (SELECT json_object_agg(kind, n) FROM (SELECT kind, sum(delta) AS n FROM changed GROUP BY kind) s) AS refunded"
+).bindparams(bindparam("debit_refs", type_=ARRAY(Text))).columns(refunded=JSON)
+
+
+def _count(metric, by_kind: dict | None) -> None:
+    for kind, n in (by_kind or {}).items():
+        metric.labels(kind).inc(n)
+
+
+# Начисление по плану оплаченных заказов; в транзакции перевода заказа в paid
+async def grant_for_orders(db: AsyncSession, order_ids: list[uuid.UUID]) -> None:
+    if not order_ids:
+        return
+    q = await db.execute(_GRANT_SQL, {"order_ids": order_ids})
+    row = q.first()
+    _count(credits_granted, row.granted if row is not None else None)
+
+
+# Списание при старте задачи генерации. Повторный старт той же задачи (повтор после ошибки,
+# перехват аренды) не списывает второй раз. Нет кредита — InsufficientCredits, транзакция вызывающего цела.
+async def debit_for_job(db: AsyncSession, *, job_id: int, user_id: uuid.UUID, order_id: uuid.UUID, kind: str) -> None:
+    async with db.begin_nested():
+        q = await db.execute(
+            _DEBIT_SQL,
+            {"user_id": user_id, "kind": kind, "ref": f"debit:{job_id}", "order_id": order_id, "job_id": job_id},
+        )
+        row = q.one()
+        if row.recorded and not row.spent:
+            credits_insufficient.inc()
+            # исключение откатывает savepoint вместе с записью журнала
+            raise InsufficientCredits(f"no {kind} credits left")
+    if row.recorded:
+        credits_debited.labels(kind).inc()
+
+
+# Возврат за задачи, окончательно завершившиеся ошибкой
+async def refund_for_jobs(db: AsyncSession, job_ids: list[int]) -> None:
+    if not job_ids:
+        return
+    q = await db.execute(_REFUND_SQL, {"debit_refs": [f"debit:{job_id}" for job_id in job_ids]})
+    row = q.first()
+    _count(credits_refunded, row.refunded if row is not None else None)
+
+
+async def get_balance(db: AsyncSession, user_id: uuid.UUID) -> dict:
+    q = await db.execute(text("SELECT images, videos FROM credit_balances WHERE user_id = :user_id"), {"user_id": user_id})
+    row = q.one_or_none()
+    return {"images": row.images if row else 0, "videos": row.videos if row else 0}
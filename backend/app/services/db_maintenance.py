@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.session import AsyncSessionLocal, engine
+from app.services.uploads import sweep_stale_parts
+
+log = logging.getLogger(__name__)
+
+maintenance_deleted = registry.counter_vec("db_maintenance_deleted_total", "Rows deleted by the maintenance purge", ("table",))
+maintenance_runs = registry.counter_vec("db_maintenance_runs_total", "Maintenance purge passes by outcome", ("outcome",))
+maintenance_seconds = registry.histogram("db_maintenance_run_seconds", "Duration of a maintenance purge pass")
+
+# pg_try_advisory_lock (сессионная — проход идёт многими короткими транзакциями): чистит один инстанс
+_PURGE_LOCK_ID = 7_201_003
+
+
+@dataclass(frozen=True)
+class PurgeTarget:
+    table: str
+    # условие «строка больше не нужна»; :grace — сколько держать отозванное/использованное для разбора инцидентов.
+    # Выборка идёт по индексам expires_at и частичным индексам revoked_at/consumed_at — без полного прохода таблицы.
+    condition: str
+
+
+PURGE_TARGETS: tuple[PurgeTarget, ...] = (
+    PurgeTarget(
+        "user_sessions",
+        "expires_at < now() OR (revoked_at IS NOT NULL AND revoked_at < now() - make_interval(secs => :grace))",
+    ),
+    PurgeTarget(
+        "email_verifications",
+        "expires_at < now() OR (consumed_at IS NOT NULL AND consumed_at < now() - make_interval(secs => :grace))",
+    ),
+    PurgeTarget("idempotency_keys", "expires_at < now()"),
+    # обработанные уведомления: история платежа остаётся в payment_events
+    PurgeTarget(
+        "webhook_events",
+        "status IN ('done', 'duplicate', 'failed') AND received_at < now() - make_interval(secs => :grace)",
+    ),
+    # дневные счётчики нужны только за сегодня; неделю держим для разбора
+    PurgeTarget("generation_daily_usage", "day < current_date - 7"),
+    # брошенные недогруженные файлы; их part-файлы удаляет sweep_stale_parts
+    PurgeTarget("uploads", "status = 'receiving' AND expires_at < now()"),
+)
+
+
+# Пакетное удаление: каждая пачка — своя короткая транзакция (блокировки и WAL ограничены batch_size строк),
+# между пачками пауза, чтобы не забивать диск и реплики
+async def purge_table(target: PurgeTarget, *, batch_size: int, pause_seconds: float, grace_seconds: float) -> int:
+    stmt = text(
+        f"DELETE FROM {target.table} WHERE ctid = ANY(ARRAY("
+        f"SELECT ctid FROM {target.table} WHERE {target.condition} LIMIT :n))"
+    )
+    params = {"n": batch_size}
+    if ":grace" in target.condition:
+        params["grace"] = grace_seconds
+
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(stmt, params)
+            await db.commit()
+        deleted = q.rowcount or 0
+        total += deleted
+        maintenance_deleted.labels(target.table).inc(deleted)
+        if deleted < batch_size:
+            return total
+        if pause_seconds > 0:
+            await asyncio.sleep(pause_seconds)
+
+
+class DbMaintenance:
+    def __init__(
+        self,
+        *,
+        interval_seconds: float,
+        batch_size: int,
+        pause_seconds: float,
+        grace_seconds: float,
+        targets: tuple[PurgeTarget, ...] = PURGE_TARGETS,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.grace_seconds = grace_seconds
+        self.targets = targets
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="db-maintenance")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                maintenance_runs.labels("error").inc()
+                log.exception("db maintenance purge failed")
+
+    # Один проход по всем таблицам. None — проход уже идёт на другом инстансе.
+    async def run_once(self) -> dict[str, int] | None:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        async with engine.connect() as lock_conn:
+            q = await lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": _PURGE_LOCK_ID})
+            if not q.scalar_one():
+                await lock_conn.rollback()
+                maintenance_runs.labels("skipped").inc()
+                return None
+            # не держим открытую транзакцию на соединении с блокировкой: она мешала бы vacuum
+            await lock_conn.commit()
+            try:
+                deleted = {}
+                for target in self.targets:
+                    deleted[target.table] = await purge_table(
+                        target,
+                        batch_size=self.batch_size,
+                        pause_seconds=self.pause_seconds,
+                        grace_seconds=self.grace_seconds,
+                    )
+                # файлы недогруженных загрузок — тем же проходом, чтобы не заводить ещё один цикл
+                deleted["upload_parts"] = await sweep_stale_parts()
+                maintenance_deleted.labels("upload_parts").inc(deleted["upload_parts"])
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _PURGE_LOCK_ID})
+                await lock_conn.commit()
+
+        maintenance_runs.labels("done").inc()
+        maintenance_seconds.observe(loop.time() - started_at)
+        if any(deleted.values()):
+            log.info("db maintenance: purged %s", ", ".join(f"{t}={n}" for t, n in deleted.items() if n))
+        return deleted
+
+
+db_maintenance = DbMaintenance(
+    interval_seconds=settings.maintenance_interval_seconds,
+    batch_size=settings.maintenance_batch_size,
+    pause_seconds=settings.maintenance_batch_pause_seconds,
+    grace_seconds=settings.maintenance_grace_seconds,
+)
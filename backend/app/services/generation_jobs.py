@@ -0,0 +1,559 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import bindparam, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import Uuid
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.session import AsyncSessionLocal
+from app.models.generation_job import GenerationJob
+from app.models.order import Order
+from app.models.plan import Plan
+from app.services.credits import InsufficientCredits, debit_for_job, refund_for_jobs
+from app.services.generation_schedule import DailyQuotaExceeded, next_day_slot, render_window, slot_times, take_daily_slot
+from app.services.identities import IDENTITY_KIND, evict, fail_training, orders_needing_training, store_artifact, training_tmp_path
+
+log = logging.getLogger(__name__)
+
+jobs_enqueued = registry.counter("generation_jobs_enqueued_total", "Generation jobs created for paid orders")
+jobs_claimed = registry.counter_vec("generation_jobs_claimed_total", "Generation jobs leased by a worker", ("kind",))
+jobs_finished = registry.counter_vec("generation_jobs_finished_total", "Generation job attempts by outcome", ("kind", "outcome"))
+jobs_running = registry.gauge("generation_jobs_running", "Generation jobs executing in this worker")
+jobs_seconds = registry.histogram_vec(
+    "generation_job_seconds", "Generation job execution time", ("kind",), buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800)
+)
+jobs_queue_wait = registry.histogram(
+    "generation_job_queue_wait_seconds", "Time from run_at to lease", buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+)
+
+# Литерал, а не bind-параметр: иначе generic plan asyncpg не сопоставит условие с частичным индексом
+_QUEUED = text("generation_jobs.status = 'queued'")
+_RUNNING = text("generation_jobs.status = 'running'")
+
+
+def parse_priorities(value: str) -> dict[str, int]:
+    out = {}
+    for part in value.split(","):
+        code, sep, prio = part.partition(":")
+        if sep and code.strip():
+            out[code.strip()] = int(prio)
+    return out
+
+
+_PRIORITIES = parse_priorities(settings.generation_plan_priorities)
+
+# строк на один INSERT: 10 колонок — далеко от лимита 32767 параметров на запрос
+_ENQUEUE_CHUNK = 2000
+
+
+# Задачи на каждое изображение и видео плана; у планов с дневной нормой run_at — слот расписания
+# (services/generation_schedule.py), у остальных — сейчас. Заказу, чей профиль лица ещё не обучен,
+# ставится только задача обучения: изображения и видео добавит её успех (повторным вызовом).
+# Вызывается в транзакции, которая переводит заказы в paid (services/payment_state.py).
+# Повтор для того же заказа ничего не добавит.
+async def enqueue_order_jobs(db: AsyncSession, order_ids: list[uuid.UUID]) -> int:
+    if not order_ids:
+        return 0
+    q = await db.execute(
+        select(Order.id, Order.user_id, Plan.code, Plan.images_count, Plan.videos_count, Plan.daily_limit)
+        .join(Plan, Plan.id == Order.plan_id)
+        .where(Order.id.in_(order_ids))
+    )
+    orders = q.all()
+    training = await orders_needing_training(db, order_ids)
+    now = datetime.now(timezone.utc)
+    window = render_window()
+    rows = []
+    for o in orders:
+        priority = _PRIORITIES.get(o.code, settings.generation_default_priority)
+        units = ((IDENTITY_KIND, 1),) if o.id in training else (("image", o.images_count), ("video", o.videos_count))
+        daily_limit = None if o.id in training else o.daily_limit
+        for kind, n in units:
+            for seq, run_at in enumerate(slot_times(o.id, now, n, daily_limit, window), start=1):
+                rows.append(
+                    {
+                        "order_id": o.id,
+                        "user_id": o.user_id,
+                        "kind": kind,
+                        "seq": seq,
+                        "priority": priority,
+                        "daily_limit": daily_limit,
+                        "status": "queued",
+                        "attempts": 0,
+                        "max_attempts": settings.generation_max_attempts,
+                        "run_at": run_at,
+                        "created_at": now,
+                    }
+                )
+    added = 0
+    for i in range(0, len(rows), _ENQUEUE_CHUNK):
+        q = await db.execute(
+            insert(GenerationJob)
+            .values(rows[i : i + _ENQUEUE_CHUNK])
+            .on_conflict_do_nothing(constraint="uq_generation_jobs_order_kind_seq")
+        )
+        added += q.rowcount or 0
+    jobs_enqueued.inc(added)
+    return added
+
+
+# Заказ закрывается, когда у него не осталось задач в работе: completed или generation_failed
+_SETTLE_ORDER_SQL = text(
+    """
+    UPDATE orders o
+    SET status = CASE
+            WHEN EXISTS (SELECT 1 FROM generation_jobs j WHERE j.order_id = o.id AND j.status = 'failed')
+            THEN 'generation_failed' ELSE 'completed' END,
+        updated_at = now()
+    WHERE o.id = :order_id
+      AND o.status IN ('paid', 'in_progress')
+      AND NOT EXISTS (
+          SELECT 1 FROM generation_jobs j WHERE j.order_id = o.id AND j.status IN ('queued', 'running')
+      )
+    """
+)
+
+
+_START_ORDERS_SQL = text(
+    "UPDATE orders SET status = 'in_progress', updated_at = now() WHERE id = ANY(:order_ids) AND status = 'paid'"
+).bindparams(bindparam("order_ids", type_=ARRAY(Uuid)))
+
+
+async def settle_order(db: AsyncSession, order_id: uuid.UUID) -> None:
+    await db.execute(_SETTLE_ORDER_SQL, {"order_id": order_id})
+
+
+# Исполнитель задачи. Возвращает результат (ссылки на файлы и т.п.) — он сохраняется в generation_jobs.result.
+# Исключение — попытка неудачна, задача повторится с паузой.
+JobHandler = Callable[[object], Awaitable[dict | None]]
+
+_handlers: dict[str, JobHandler] = {}
+
+
+def register_handler(name: str, handler: JobHandler) -> None:
+    _handlers[name] = handler
+
+
+# Заглушка рендера для dev и нагрузочных прогонов: только ждёт. Обучение профиля (kind identity)
+# должно вернуть {"artifact": путь} — файл из training_tmp_path(job.id), его переносит в кеш воркер.
+async def simulate_handler(job) -> dict:
+    await asyncio.sleep(settings.generation_simulate_seconds)
+    if job.kind == IDENTITY_KIND:
+        path = training_tmp_path(job.id)
+        await asyncio.to_thread(_write_file, path, os.urandom(1024))
+        return {"artifact": path}
+    return {"simulated": True, "kind": job.kind, "seq": job.seq}
+
+
+def _write_file(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+register_handler("simulate", simulate_handler)
+
+
+class GenerationWorker:
+    def __init__(
+        self,
+        *,
+        concurrency: int,
+        poll_seconds: float,
+        lease_seconds: float,
+        heartbeat_seconds: float,
+        job_timeout_seconds: float,
+        drain_seconds: float,
+        backoff_seconds: float,
+        backoff_max_seconds: float,
+        handler: str,
+    ) -> None:
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.job_timeout_seconds = job_timeout_seconds
+        self.drain_seconds = drain_seconds
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.handler_name = handler
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._wakeup = asyncio.Event()
+        self._running: dict[int, asyncio.Task] = {}
+        # задачи, аренду которых перехватил другой воркер: результат не записываем
+        self._lost: set[int] = set()
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        if self.handler_name not in _handlers:
+            raise RuntimeError(f"unknown generation handler {self.handler_name!r}; registered: {sorted(_handlers)}")
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._run(), name="generation-worker"),
+            asyncio.create_task(self._heartbeat(), name="generation-heartbeat"),
+        ]
+        log.info("generation worker %s started: concurrency=%s handler=%s", self.worker_id, self.concurrency, self.handler_name)
+
+    # Новые задачи не берём; текущим даём drain_seconds, остальные возвращаем в очередь
+    async def stop(self) -> None:
+        if not self._tasks:
+            return
+        run_task, heartbeat_task = self._tasks
+        # цикл выборки дорабатывает текущую итерацию и выходит: взятые им задачи не потеряются
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(run_task, return_exceptions=True)
+        # heartbeat продолжает продлевать аренды, пока задачи доделываются
+        if self._running:
+            await asyncio.wait(list(self._running.values()), timeout=self.drain_seconds)
+        running = list(self._running.values())
+        for t in running:
+            t.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        heartbeat_task.cancel()
+        await asyncio.gather(heartbeat_task, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            free = self.concurrency - len(self._running)
+            claimed = []
+            try:
+                await self.reap_expired()
+                if free > 0:
+                    claimed = await self._claim(free)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("generation queue claim failed")
+            for job in claimed:
+                task = asyncio.create_task(self._execute(job), name=f"generation-job-{job.id}")
+                self._running[job.id] = task
+                task.add_done_callback(lambda _t, job_id=job.id: self._on_done(job_id))
+
+            # либо слоты заняты (ждём завершения задачи — оно будит цикл), либо очередь пуста (ждём poll)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _on_done(self, job_id: int) -> None:
+        self._running.pop(job_id, None)
+        self._lost.discard(job_id)
+        self._wakeup.set()
+
+    async def _claim(self, limit: int) -> list:
+        now = datetime.now(timezone.utc)
+        candidates = (
+            select(GenerationJob.id)
+            .where(_QUEUED, GenerationJob.run_at <= now)
+            .order_by(GenerationJob.priority, GenerationJob.run_at, GenerationJob.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id.in_(candidates))
+                .values(
+                    status="running",
+                    worker_id=self.worker_id,
+                    attempts=GenerationJob.attempts + 1,
+                    lease_expires_at=now + self.lease,
+                    heartbeat_at=now,
+                    started_at=now,
+                )
+                .returning(
+                    GenerationJob.id,
+                    GenerationJob.order_id,
+                    GenerationJob.user_id,
+                    GenerationJob.kind,
+                    GenerationJob.seq,
+                    GenerationJob.priority,
+                    GenerationJob.attempts,
+                    GenerationJob.max_attempts,
+                    GenerationJob.daily_limit,
+                    GenerationJob.run_at,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            rows = q.all()
+            if rows:
+                await db.execute(_START_ORDERS_SQL, {"order_ids": list({r.order_id for r in rows})})
+            await db.commit()
+        for r in rows:
+            jobs_claimed.labels(r.kind).inc()
+            jobs_queue_wait.observe(max(0.0, (now - r.run_at).total_seconds()))
+        return rows
+
+    # Аренды всех своих задач — одним UPDATE; не вернувшиеся строки перехвачены (истекли) — их отменяем
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            ids = list(self._running)
+            if not ids:
+                continue
+            now = datetime.now(timezone.utc)
+            try:
+                async with AsyncSessionLocal() as db:
+                    q = await db.execute(
+                        update(GenerationJob)
+                        .where(GenerationJob.id.in_(ids), GenerationJob.worker_id == self.worker_id, _RUNNING)
+                        .values(lease_expires_at=now + self.lease, heartbeat_at=now)
+                        .returning(GenerationJob.id)
+                        .execution_options(synchronize_session=False)
+                    )
+                    kept = set(q.scalars().all())
+                    await db.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # не продлили — попробуем на следующем тике; запас даёт lease_seconds > heartbeat_seconds
+                log.exception("generation heartbeat failed")
+                continue
+            for job_id in ids:
+                task = self._running.get(job_id)
+                if job_id not in kept and task is not None:
+                    log.warning("generation job %s: lease lost, cancelling", job_id)
+                    self._lost.add(job_id)
+                    task.cancel()
+
+    # Задачи воркеров, умерших без продления аренды: в очередь или, если попытки кончились, в failed с возвратом кредита
+    async def reap_expired(self) -> int:
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(
+                update(GenerationJob)
+                .where(_RUNNING, GenerationJob.lease_expires_at < now)
+                .values(
+                    status=text("CASE WHEN generation_jobs.attempts >= generation_jobs.max_attempts THEN 'failed' ELSE 'queued' END"),
+                    run_at=now,
+                    worker_id=None,
+                    lease_expires_at=None,
+                    error="lease expired",
+                    finished_at=text("CASE WHEN generation_jobs.attempts >= generation_jobs.max_attempts THEN now() END"),
+                )
+                .returning(GenerationJob.id, GenerationJob.order_id, GenerationJob.kind, GenerationJob.status)
+                .execution_options(synchronize_session=False)
+            )
+            rows = q.all()
+            await refund_for_jobs(db, [r.id for r in rows if r.status == "failed"])
+            await fail_training(db, [r.order_id for r in rows if r.status == "failed" and r.kind == IDENTITY_KIND])
+            for order_id in {r.order_id for r in rows if r.status == "failed"}:
+                await settle_order(db, order_id)
+            await db.commit()
+        if rows:
+            log.warning("generation queue: %s expired lease(s) reclaimed", len(rows))
+        return len(rows)
+
+    async def _execute(self, job) -> None:
+        jobs_running.inc()
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        try:
+            await self._debit(job)
+            result = await asyncio.wait_for(_handlers[self.handler_name](job), timeout=self.job_timeout_seconds)
+        except asyncio.CancelledError:
+            if job.id not in self._lost:
+                # остановка воркера: отдаём задачу сразу, не дожидаясь истечения аренды
+                await self._release(job)
+            raise
+        except InsufficientCredits as e:
+            await self._record_failure(job, str(e), retryable=False)
+            return
+        except DailyQuotaExceeded as e:
+            await self._defer(job, str(e))
+            return
+        except Exception as e:
+            jobs_seconds.labels(job.kind).observe(loop.time() - started_at)
+            await self._record_failure(job, f"{type(e).__name__}: {e}")
+            return
+        finally:
+            jobs_running.dec()
+        jobs_seconds.labels(job.kind).observe(loop.time() - started_at)
+        await self._record_success(job, result)
+
+    # Кредит списывается при старте; повторный старт той же задачи второй раз не списывает.
+    # Задачи подписок сначала занимают место в дневной норме пользователя. Обучение профиля входит в цену заказа.
+    async def _debit(self, job) -> None:
+        if job.kind == IDENTITY_KIND:
+            return
+        async with AsyncSessionLocal() as db:
+            if job.daily_limit:
+                day = datetime.now(timezone.utc).date()
+                await take_daily_slot(db, job_id=job.id, user_id=job.user_id, kind=job.kind, day=day)
+            await debit_for_job(db, job_id=job.id, user_id=job.user_id, order_id=job.order_id, kind=job.kind)
+            await db.commit()
+
+    def _own(self, job_id: int):
+        # запись итога — только пока аренда наша
+        return (GenerationJob.id == job_id, GenerationJob.worker_id == self.worker_id, _RUNNING)
+
+    async def _record_success(self, job, result: dict | None) -> None:
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            if job.kind == IDENTITY_KIND:
+                # артефакт — в кеш профилей; без файла обучение не считается успешным
+                try:
+                    result = await store_artifact(db, job.order_id, (result or {})["artifact"])
+                except (KeyError, OSError) as e:
+                    # снимаем блокировку профиля: запись ошибки идёт в другой сессии
+                    await db.rollback()
+                    await self._record_failure(job, f"identity artifact: {type(e).__name__}: {e}")
+                    return
+            q = await db.execute(
+                update(GenerationJob)
+                .where(*self._own(job.id))
+                .values(
+                    status="done",
+                    result=result,
+                    error=None,
+                    finished_at=now,
+                    worker_id=None,
+                    lease_expires_at=None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if q.rowcount and job.kind == IDENTITY_KIND:
+                # профиль готов — теперь изображения и видео заказа
+                await enqueue_order_jobs(db, [job.order_id])
+            if q.rowcount:
+                await settle_order(db, job.order_id)
+                await db.commit()
+            else:
+                await db.rollback()
+        jobs_finished.labels(job.kind, "done" if q.rowcount else "lease_lost").inc()
+        if q.rowcount and job.kind == IDENTITY_KIND:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await evict(db)
+            except Exception:
+                # не вытеснили сейчас — вытеснит следующее обучение
+                log.exception("identity cache eviction failed")
+
+    async def _record_failure(self, job, error: str, *, retryable: bool = True) -> None:
+        now = datetime.now(timezone.utc)
+        exhausted = not retryable or job.attempts >= job.max_attempts
+        # экспоненциальная пауза со случайной долей: упавший рендер не получает все повторы одновременно
+        delay = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (job.attempts - 1)) * random.uniform(0.5, 1.0)
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(
+                update(GenerationJob)
+                .where(*self._own(job.id))
+                .values(
+                    status="failed" if exhausted else "queued",
+                    run_at=now + timedelta(seconds=delay),
+                    error=error[:1000],
+                    finished_at=now if exhausted else None,
+                    worker_id=None,
+                    lease_expires_at=None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if q.rowcount and exhausted:
+                await refund_for_jobs(db, [job.id])
+                if job.kind == IDENTITY_KIND:
+                    await fail_training(db, [job.order_id])
+                await settle_order(db, job.order_id)
+            await db.commit()
+        if not q.rowcount:
+            jobs_finished.labels(job.kind, "lease_lost").inc()
+        elif exhausted:
+            jobs_finished.labels(job.kind, "failed").inc()
+            log.error("generation job %s (order %s) failed: %s", job.id, job.order_id, error)
+        else:
+            jobs_finished.labels(job.kind, "retry").inc()
+            log.warning("generation job %s attempt %s failed, retry in %.0fs: %s", job.id, job.attempts, delay, error)
+
+    # Норма дня выбрана: на слот следующего дня, попытка не считается
+    async def _defer(self, job, reason: str) -> None:
+        run_at = next_day_slot(job.order_id, datetime.now(timezone.utc), render_window())
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenerationJob)
+                .where(*self._own(job.id))
+                .values(
+                    status="queued",
+                    run_at=run_at,
+                    attempts=GenerationJob.attempts - 1,
+                    worker_id=None,
+                    lease_expires_at=None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        jobs_finished.labels(job.kind, "deferred").inc()
+        log.info("generation job %s deferred to %s: %s", job.id, run_at.isoformat(), reason)
+
+    async def _release(self, job) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenerationJob)
+                .where(*self._own(job.id))
+                .values(
+                    status="queued",
+                    run_at=datetime.now(timezone.utc),
+                    # прерванная остановкой попытка не считается
+                    attempts=GenerationJob.attempts - 1,
+                    worker_id=None,
+                    lease_expires_at=None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        jobs_finished.labels(job.kind, "released").inc()
+
+
+# Сводка очереди для админки
+async def queue_stats(db: AsyncSession) -> dict:
+    q = await db.execute(
+        text(
+            """
+            SELECT status,
+                   count(*) AS n,
+                   count(*) FILTER (WHERE run_at <= now()) AS ready,
+                   min(run_at) FILTER (WHERE run_at <= now()) AS oldest_ready_at
+            FROM generation_jobs
+            WHERE status IN ('queued', 'running')
+            GROUP BY status
+            """
+        )
+    )
+    now = datetime.now(timezone.utc)
+    out = {"queued": 0, "ready": 0, "running": 0, "oldest_ready_seconds": 0.0}
+    for r in q.all():
+        out[r.status] = r.n
+        if r.status == "queued":
+            # ready — можно запускать сейчас; остальные ждут слота расписания или повтора после ошибки
+            out["ready"] = r.ready
+            if r.oldest_ready_at is not None:
+                out["oldest_ready_seconds"] = (now - r.oldest_ready_at).total_seconds()
+    return out
+
+
+def create_worker(concurrency: int | None = None) -> GenerationWorker:
+    return GenerationWorker(
+        concurrency=concurrency or settings.generation_worker_concurrency,
+        poll_seconds=settings.generation_poll_seconds,
+        lease_seconds=settings.generation_lease_seconds,
+        heartbeat_seconds=settings.generation_heartbeat_seconds,
+        job_timeout_seconds=settings.generation_job_timeout_seconds,
+        drain_seconds=settings.generation_drain_seconds,
+        backoff_seconds=settings.generation_backoff_seconds,
+        backoff_max_seconds=settings.generation_backoff_max_seconds,
+        handler=settings.generation_handler,
+    )
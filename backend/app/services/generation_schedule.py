@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import hashlib
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import Date, Uuid
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+# Расписание задач генерации для планов с дневной нормой (Plan.daily_limit: month_30 — 1/день, month_90 — 3/день).
+# Единица плана k (0..n-1) попадает в календарный день k // daily_limit от дня оплаты (UTC), а внутри дня —
+# в слот окна рендера со сдвигом, который зависит от заказа: оплаты приходят волнами (рассылка, реклама),
+# и без сдвига волна повторялась бы каждый день в тот же час. Слоты дня оплаты, которые уже прошли,
+# запускаются сразу — первый результат клиент получает без ожидания.
+#
+# Норма пользователя в день — сумма daily_limit его действующих подписок; проверяется при первом старте задачи
+# (generation_daily_usage). Так расписание держится и после простоя воркеров, когда накопившиеся задачи
+# готовы к запуску все сразу: сверх нормы задача переносится на следующий день.
+
+quota_deferred = registry.counter_vec(
+    "generation_daily_quota_deferred_total", "Job starts moved to the next day by the per-user daily limit", ("kind",)
+)
+
+
+class DailyQuotaExceeded(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class RenderWindow:
+    # часы UTC, в которые ставятся плановые задачи; 0 и 24 — круглые сутки
+    start_hour: int
+    hours: int
+
+    @property
+    def minutes(self) -> int:
+        return self.hours * 60
+
+
+def render_window() -> RenderWindow:
+    return RenderWindow(settings.generation_window_start_hour, settings.generation_window_hours)
+
+
+# Устойчивая доля [0, 1) по ключу — одинакова во всех процессах и между перезапусками (hash() — нет)
+def _spread(key: str) -> float:
+    return int(hashlib.blake2b(key.encode("utf-8"), digest_size=4).hexdigest(), 16) / 2**32
+
+
+def slot_times(
+    order_id: uuid.UUID,
+    paid_at: datetime,
+    count: int,
+    daily_limit: int | None,
+    window: RenderWindow,
+) -> list[datetime]:
+    if not daily_limit:
+        return [paid_at] * count
+
+    offset = _spread(str(order_id))
+    day0 = paid_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    out = []
+    for k in range(count):
+        day, i = divmod(k, daily_limit)
+        # слоты одного дня — равномерно по окну
+        minute = ((offset + i / daily_limit) % 1.0) * window.minutes
+        at = day0 + timedelta(days=day, hours=window.start_hour, minutes=minute)
+        out.append(max(at, paid_at))
+    return out
+
+
+# Слот того же заказа в окне следующего дня — куда переносится задача сверх нормы
+def next_day_slot(order_id: uuid.UUID, now: datetime, window: RenderWindow) -> datetime:
+    day0 = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return day0 + timedelta(hours=window.start_hour, minutes=_spread(str(order_id)) * window.minutes)
+
+
+# +1 к счётчику дня, если норма не выбрана; иначе ни вставки, ни обновления — строка не вернётся.
+# Конкурирующие старты одного пользователя сериализуются на строке счётчика.
+_TAKE_SLOT_SQL = text(
+    """
+    WITH quota AS (
+        SELECT COALESCE(sum(p.daily_limit), 0) AS n
+        FROM orders o
+        JOIN plans p ON p.id = o.plan_id
+        WHERE o.user_id = :user_id AND o.status IN ('paid', 'in_progress') AND p.daily_limit IS NOT NULL
+    )
+    INSERT INTO generation_daily_usage (user_id, day, kind, used)
+    SELECT :user_id, :day, :kind, 1 FROM quota WHERE quota.n >= 1
+    ON CONFLICT (user_id, day, kind) DO UPDATE
+    SET used = generation_daily_usage.used + 1
+    WHERE generation_daily_usage.used < (SELECT n FROM quota)
+    RETURNING used
+    """
+).bindparams(bindparam("user_id", type_=Uuid), bindparam("day", type_=Date))
+
+# Задача уже стартовала раньше (кредит списан) — её день уже посчитан
+_STARTED_SQL = text("SELECT EXISTS (SELECT 1 FROM credit_ledger WHERE ref = :ref)")
+
+
+# Вызывается в транзакции списания кредита, до него: отказ по кредиту откатит и счётчик
+async def take_daily_slot(db: AsyncSession, *, job_id: int, user_id: uuid.UUID, kind: str, day: date) -> None:
+    if (await db.execute(_STARTED_SQL, {"ref": f"debit:{job_id}"})).scalar_one():
+        return
+    q = await db.execute(_TAKE_SLOT_SQL, {"user_id": user_id, "day": day, "kind": kind})
+    if q.first() is None:
+        quota_deferred.labels(kind).inc()
+        raise DailyQuotaExceeded(f"daily {kind} limit reached for {day}")
+
+
+def hourly_curve(times: list[datetime]) -> Counter:
+    return Counter(t.replace(minute=0, second=0, microsecond=0) for t in times)
+
+
+def format_curve(curves: dict[str, Counter], *, hours: int, width: int = 50) -> str:
+    start = min((min(c) for c in curves.values() if c), default=None)
+    if start is None:
+        return "(no jobs)"
+    names = list(curves)
+    # полоса — последняя кривая, в масштабе её собственного пика
+    peak = max(curves[names[-1]].values(), default=0)
+    lines = [f"{'hour (UTC)':<17}" + "".join(f"{n:>12}" for n in names)]
+    for h in range(hours):
+        at = start + timedelta(hours=h)
+        values = [curves[n].get(at, 0) for n in names]
+        bar = "#" * round(values[-1] / peak * width) if peak else ""
+        lines.append(f"{at:%Y-%m-%d %H:00}" + "".join(f"{v:>12}" for v in values) + f"  {bar}")
+    lines.append("")
+    for n in names:
+        c = curves[n]
+        span = [c.get(start + timedelta(hours=h), 0) for h in range(hours)]
+        mean = sum(span) / hours
+        lines.append(f"{n}: peak {max(span)}/h, mean {mean:.1f}/h, peak/mean {max(span) / mean if mean else 0:.1f}")
+    return "\n".join(lines)
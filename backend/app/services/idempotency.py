@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, null, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.models.idempotency_key import IdempotencyKey
+
+idem_replays = registry.counter("idempotency_replays_total", "Responses replayed for a repeated Idempotency-Key")
+idem_waits = registry.counter("idempotency_waits_total", "Requests that waited for an in-flight duplicate")
+
+MAX_KEY_LENGTH = 200
+
+# Будит ожидающих дубликатов в этом процессе; другие процессы увидят результат через опрос БД
+_events: dict[tuple[str, uuid.UUID, str], asyncio.Event] = {}
+
+
+class IdempotencyError(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass(frozen=True)
+class IdempotencyRecord:
+    scope: str
+    user_id: uuid.UUID
+    key: str
+    # True — этот запрос выполняет операцию; False — повтор, отдаём сохранённый ответ
+    owned: bool
+    resource_id: str | None = None
+    response_status: int | None = None
+    response_body: dict | None = None
+
+
+def request_hash(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _ident(record_or_key) -> tuple[str, uuid.UUID, str]:
+    return record_or_key.scope, record_or_key.user_id, record_or_key.key
+
+
+def _notify(ident: tuple[str, uuid.UUID, str]) -> None:
+    event = _events.pop(ident, None)
+    if event is not None:
+        event.set()
+
+
+async def _try_take(db: AsyncSession, scope: str, user_id: uuid.UUID, key: str, req_hash: str) -> IdempotencyRecord | None:
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=settings.idempotency_ttl_seconds)
+    stale_before = now - timedelta(seconds=settings.idempotency_lock_timeout_seconds)
+    # Новый ключ — вставка; истёкший или брошенный упавшим запросом — перехват той же строкой.
+    # Перехваченный in_progress сохраняет resource_id: заказ повторно не создаётся.
+    q = await db.execute(
+        insert(IdempotencyKey)
+        .values(
+            scope=scope,
+            user_id=user_id,
+            key=key,
+            request_hash=req_hash,
+            status="in_progress",
+            locked_at=now,
+            created_at=now,
+            expires_at=expires_at,
+        )
+        .on_conflict_do_update(
+            index_elements=[IdempotencyKey.scope, IdempotencyKey.user_id, IdempotencyKey.key],
+            set_={
+                "request_hash": req_hash,
+                "status": "in_progress",
+                "locked_at": now,
+                "expires_at": expires_at,
+                "resource_id": text("CASE WHEN idempotency_keys.expires_at < now() THEN NULL ELSE idempotency_keys.resource_id END"),
+                "response_status": None,
+                "response_body": null(),
+            },
+            where=or_(
+                IdempotencyKey.expires_at < now,
+                and_(
+                    IdempotencyKey.status == "in_progress",
+                    IdempotencyKey.locked_at < stale_before,
+                    IdempotencyKey.request_hash == req_hash,
+                ),
+            ),
+        )
+        .returning(IdempotencyKey.resource_id)
+    )
+    row = q.one_or_none()
+    await db.commit()
+    if row is None:
+        return None
+    return IdempotencyRecord(scope, user_id, key, owned=True, resource_id=row.resource_id)
+
+
+# Захватить ключ или дождаться результата первого запроса с этим ключом.
+async def acquire(db: AsyncSession, *, scope: str, user_id: uuid.UUID, key: str, payload) -> IdempotencyRecord:
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(400, f"Idempotency-Key must be 1..{MAX_KEY_LENGTH} characters")
+
+    req_hash = request_hash(payload)
+    deadline = time.monotonic() + settings.idempotency_wait_seconds
+    waited = False
+    while True:
+        record = await _try_take(db, scope, user_id, key, req_hash)
+        if record is not None:
+            return record
+
+        q = await db.execute(
+            select(
+                IdempotencyKey.request_hash,
+                IdempotencyKey.status,
+                IdempotencyKey.resource_id,
+                IdempotencyKey.response_status,
+                IdempotencyKey.response_body,
+            ).where(IdempotencyKey.scope == scope, IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        )
+        row = q.one_or_none()
+        # не держим соединение, пока ждём
+        await db.rollback()
+        if row is None:
+            # строку успели удалить (первый запрос упал и освободил ключ) — пробуем снова
+            continue
+        if row.request_hash != req_hash:
+            raise IdempotencyError(422, "Idempotency-Key was already used with a different request")
+        if row.status == "done":
+            idem_replays.inc()
+            return IdempotencyRecord(
+                scope,
+                user_id,
+                key,
+                owned=False,
+                resource_id=row.resource_id,
+                response_status=row.response_status,
+                response_body=row.response_body,
+            )
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise IdempotencyError(409, "A request with this Idempotency-Key is still in progress")
+        if not waited:
+            idem_waits.inc()
+            waited = True
+        ident = (scope, user_id, key)
+        event = _events.setdefault(ident, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(remaining, settings.idempotency_poll_seconds))
+        except asyncio.TimeoutError:
+            # ключ мог выполняться в другом процессе — событие здесь никто не выставит, не копим его
+            if _events.get(ident) is event:
+                del _events[ident]
+
+
+# В транзакции вызывающего (вместе с созданием ресурса): повтор после падения найдёт ресурс
+async def attach_resource(db: AsyncSession, record: IdempotencyRecord, resource_id: str) -> None:
+    await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.scope == record.scope, IdempotencyKey.user_id == record.user_id, IdempotencyKey.key == record.key)
+        .values(resource_id=resource_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def complete(db: AsyncSession, record: IdempotencyRecord, status_code: int, body: dict) -> None:
+    await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.scope == record.scope, IdempotencyKey.user_id == record.user_id, IdempotencyKey.key == record.key)
+        .values(status="done", response_status=status_code, response_body=body)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    _notify(_ident(record))
+
+
+# Первый запрос не дал ответа для повтора. keep_resource=False — операция провалилась, повтор начнёт заново;
+# True — ресурс мог уже появиться (исключение посреди работы): ключ отпускается, повтор продолжит с тем же ресурсом.
+async def release(db: AsyncSession, record: IdempotencyRecord, *, keep_resource: bool = False) -> None:
+    await db.rollback()
+    where = (
+        IdempotencyKey.scope == record.scope,
+        IdempotencyKey.user_id == record.user_id,
+        IdempotencyKey.key == record.key,
+        IdempotencyKey.status == "in_progress",
+    )
+    if keep_resource:
+        await db.execute(delete(IdempotencyKey).where(*where, IdempotencyKey.resource_id.is_(None)))
+        await db.execute(
+            update(IdempotencyKey)
+            .where(*where)
+            .values(locked_at=datetime(1970, 1, 1, tzinfo=timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        await db.execute(delete(IdempotencyKey).where(*where))
+    await db.commit()
+    _notify(_ident(record))
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, func, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import BigInteger, String
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.models.identity_profile import IdentityProfile
+from app.models.order import Order
+from app.models.upload import Upload
+
+log = logging.getLogger(__name__)
+
+identity_reuse = registry.counter_vec("identity_checkout_total", "Checkouts by identity artifact availability", ("outcome",))
+identity_evicted = registry.counter("identity_artifacts_evicted_total", "Identity artifacts removed by the LRU size limit")
+identity_cache_bytes = registry.gauge("identity_cache_bytes", "Bytes of ready identity artifacts after the last eviction pass")
+
+# Задача обучения профиля в очереди генерации (services/generation_jobs.py): кредитов не списывает,
+# после неё ставятся задачи изображений и видео заказа
+IDENTITY_KIND = "identity"
+
+# Заказы, которым профиль ещё понадобится: их артефакт не вытесняем
+_ACTIVE_ORDER_STATUSES = ("payment_pending", "paid", "in_progress")
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class IdentityError(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass(frozen=True)
+class IdentityChoice:
+    profile_id: uuid.UUID
+    # True — артефакт на диске, обучение не нужно: цена повторного заказа
+    reuse: bool
+
+
+def normalize_photo_hashes(photo_hashes) -> list[str]:
+    if not isinstance(photo_hashes, list) or not all(isinstance(h, str) for h in photo_hashes):
+        raise IdentityError(400, "photo_hashes must be a list of sha256 hex digests")
+    photos = sorted({h.strip().lower() for h in photo_hashes})
+    if not photos or len(photos) > settings.identity_max_photos:
+        raise IdentityError(400, f"photo_hashes must list 1..{settings.identity_max_photos} photos")
+    if not all(_SHA256_RE.match(h) for h in photos):
+        raise IdentityError(400, "photo_hashes must be sha256 hex digests")
+    return photos
+
+
+# Ключ набора: порядок и повторы фото не важны; пользователь входит в ключ — профили разных людей не смешиваются
+def photo_set_hash(user_id: uuid.UUID, photos: list[str]) -> str:
+    return hashlib.sha256("\n".join([str(user_id), *photos]).encode("utf-8")).hexdigest()
+
+
+def _abs(rel: str) -> str:
+    return os.path.join(settings.identity_cache_dir, rel)
+
+
+def artifact_rel_path(set_hash: str) -> str:
+    # две буквы префикса — чтобы не держать десятки тысяч файлов в одном каталоге
+    return os.path.join(set_hash[:2], f"{set_hash}.bin")
+
+
+# Куда исполнитель обучения пишет результат: внутри каталога кеша, чтобы переезд на место был os.replace
+def training_tmp_path(job_id: int) -> str:
+    path = _abs(os.path.join("tmp", f"train-{job_id}-{uuid.uuid4().hex[:8]}.bin"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+# Профиль для заказа. Готовый артефакт на диске — повторный заказ без обучения; иначе профиль
+# (новый, вытесненный или с неудачным обучением) ждёт обучения после оплаты.
+async def choose_for_checkout(db: AsyncSession, user_id: uuid.UUID, photo_hashes) -> IdentityChoice:
+    photos = normalize_photo_hashes(photo_hashes)
+    # фото — только из собственных завершённых загрузок (services/uploads.py): хеш чужого файла не подойдёт
+    q = await db.execute(
+        select(func.count(func.distinct(Upload.sha256))).where(
+            Upload.user_id == user_id, Upload.kind == "photo", Upload.status == "complete", Upload.sha256.in_(photos)
+        )
+    )
+    if q.scalar_one() != len(photos):
+        raise IdentityError(400, "photo_hashes must refer to your uploaded photos (POST /api/v1/uploads)")
+    set_hash = photo_set_hash(user_id, photos)
+    now = datetime.now(timezone.utc)
+
+    q = await db.execute(select(IdentityProfile).where(IdentityProfile.photo_set_hash == set_hash).with_for_update())
+    profile = q.scalar_one_or_none()
+    if profile is None:
+        q = await db.execute(
+            select(func.count()).select_from(IdentityProfile).where(
+                IdentityProfile.user_id == user_id, IdentityProfile.status != "failed"
+            )
+        )
+        if q.scalar_one() >= settings.max_identities_per_user:
+            raise IdentityError(409, f"Identity limit reached ({settings.max_identities_per_user}); delete one first")
+        q = await db.execute(
+            insert(IdentityProfile)
+            .values(id=uuid.uuid4(), user_id=user_id, photo_set_hash=set_hash, photo_count=len(photos),
+                    status="pending", created_at=now, last_used_at=now)
+            # параллельный checkout с тем же набором уже вставил профиль
+            .on_conflict_do_update(index_elements=[IdentityProfile.photo_set_hash], set_={"last_used_at": now})
+            .returning(IdentityProfile.id)
+        )
+        identity_reuse.labels("new").inc()
+        return IdentityChoice(q.scalar_one(), reuse=False)
+
+    reuse = (
+        settings.identity_reuse_enabled
+        and profile.status == "ready"
+        and await asyncio.to_thread(os.path.isfile, _abs(profile.artifact_path or ""))
+    )
+    if settings.identity_reuse_enabled and profile.status == "ready" and not reuse:
+        # файл удалили мимо индекса (чистка диска, новый инстанс без тома)
+        log.warning("identity %s: artifact %s is missing, retraining", profile.id, profile.artifact_path)
+    if not reuse and profile.status != "pending":
+        profile.status = "pending"
+        profile.artifact_path = profile.artifact_size = profile.artifact_sha256 = None
+    profile.last_used_at = now
+    identity_reuse.labels("reuse" if reuse else "retrain").inc()
+    return IdentityChoice(profile.id, reuse=reuse)
+
+
+# Профили заказов, которым нужно обучение (задача identity вместо изображений и видео)
+async def orders_needing_training(db: AsyncSession, order_ids: list[uuid.UUID]) -> set[uuid.UUID]:
+    q = await db.execute(
+        select(Order.id)
+        .join(IdentityProfile, IdentityProfile.id == Order.identity_profile_id)
+        .where(Order.id.in_(order_ids), IdentityProfile.status != "ready")
+    )
+    return set(q.scalars().all())
+
+
+def _sha256_file(path: str) -> tuple[int, str]:
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+            size += len(chunk)
+    return size, h.hexdigest()
+
+
+def _install(src: str, dst: str) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(src, dst)
+
+
+# Артефакт, обученный задачей заказа, — на место в кеше и в индекс; вызывается в транзакции записи итога задачи
+async def store_artifact(db: AsyncSession, order_id: uuid.UUID, src_path: str) -> dict:
+    q = await db.execute(
+        select(IdentityProfile).join(Order, Order.identity_profile_id == IdentityProfile.id).where(Order.id == order_id).with_for_update()
+    )
+    profile = q.scalar_one()
+    rel = artifact_rel_path(profile.photo_set_hash)
+    size, digest = await asyncio.to_thread(_sha256_file, src_path)
+    await asyncio.to_thread(_install, src_path, _abs(rel))
+    now = datetime.now(timezone.utc)
+    profile.status = "ready"
+    profile.artifact_path = rel
+    profile.artifact_size = size
+    profile.artifact_sha256 = digest
+    profile.trained_at = now
+    profile.last_used_at = now
+    profile.evicted_at = None
+    return {"identity_profile_id": str(profile.id), "artifact": rel, "size": size, "sha256": digest}
+
+
+# Обучение не удалось: следующий checkout с тем же набором начнёт заново по цене первого заказа
+async def fail_training(db: AsyncSession, order_ids: list[uuid.UUID]) -> None:
+    if not order_ids:
+        return
+    await db.execute(
+        update(IdentityProfile)
+        .where(
+            IdentityProfile.id.in_(select(Order.identity_profile_id).where(Order.id.in_(order_ids))),
+            IdentityProfile.status == "pending",
+        )
+        .values(status="failed")
+        .execution_options(synchronize_session=False)
+    )
+
+
+# LRU по last_used_at: свежие профили оставляем, пока их сумма укладывается в лимит, остальные — на вытеснение.
+# Профили заказов в работе не трогаем; UPDATE перепроверяет это и last_used_at на самой строке: checkout,
+# который взял профиль после выборки кандидатов, держит её FOR UPDATE — после него строка не подойдёт.
+# Строку, которую уже вытеснил соседний процесс, UPDATE не вернёт — файл удаляет ровно один.
+_EVICT_SQL = text(
+    """
+    WITH ready AS (
+        SELECT id, last_used_at, sum(artifact_size) OVER (ORDER BY last_used_at DESC, id DESC) AS kept
+        FROM identity_profiles
+        WHERE status = 'ready'
+    ),
+    victims AS (
+        SELECT r.id, r.last_used_at
+        FROM ready r
+        WHERE r.kept > :max_bytes
+          AND NOT EXISTS (
+              SELECT 1 FROM orders o
+              WHERE o.identity_profile_id = r.id AND o.status = ANY(:active)
+          )
+    )
+    UPDATE identity_profiles p
+    SET status = 'evicted', evicted_at = now()
+    FROM victims v
+    WHERE p.id = v.id
+      AND p.status = 'ready'
+      AND p.last_used_at <= v.last_used_at
+      AND NOT EXISTS (
+          SELECT 1 FROM orders o
+          WHERE o.identity_profile_id = p.id AND o.status = ANY(:active)
+      )
+    RETURNING p.id, p.artifact_path, p.artifact_size
+    """
+).bindparams(bindparam("max_bytes", type_=BigInteger), bindparam("active", type_=ARRAY(String)))
+
+
+def _remove(rel: str) -> None:
+    try:
+        os.remove(_abs(rel))
+    except FileNotFoundError:
+        pass
+
+
+async def evict(db: AsyncSession) -> dict:
+    q = await db.execute(_EVICT_SQL, {"max_bytes": settings.identity_cache_max_bytes, "active": list(_ACTIVE_ORDER_STATUSES)})
+    rows = q.all()
+    await db.commit()
+    # файлы — после фиксации: откат не оставит в индексе ready-профиль без файла
+    for r in rows:
+        await asyncio.to_thread(_remove, r.artifact_path)
+    identity_evicted.inc(len(rows))
+    stats = await cache_stats(db)
+    identity_cache_bytes.set(stats["bytes"])
+    if rows:
+        log.info("identity cache: evicted %s artifact(s), %s bytes", len(rows), sum(r.artifact_size or 0 for r in rows))
+    return {"evicted": len(rows), **stats}
+
+
+async def cache_stats(db: AsyncSession) -> dict:
+    q = await db.execute(
+        select(func.count(), func.coalesce(func.sum(IdentityProfile.artifact_size), 0)).where(IdentityProfile.status == "ready")
+    )
+    n, size = q.one()
+    return {"ready": n, "bytes": int(size), "max_bytes": settings.identity_cache_max_bytes}
+
+
+async def list_profiles(db: AsyncSession, user_id: uuid.UUID) -> list[dict]:
+    q = await db.execute(
+        select(IdentityProfile).where(IdentityProfile.user_id == user_id).order_by(IdentityProfile.created_at)
+    )
+    return [
+        {
+            "id": str(p.id),
+            "status": p.status,
+            "photo_count": p.photo_count,
+            "created_at": p.created_at.isoformat(),
+            "trained_at": p.trained_at.isoformat() if p.trained_at else None,
+            "last_used_at": p.last_used_at.isoformat(),
+        }
+        for p in q.scalars().all()
+    ]
+
+
+# Удаление профиля пользователем: файл и строка индекса; профиль заказа в работе удалять нельзя
+async def delete_profile(db: AsyncSession, user_id: uuid.UUID, profile_id: uuid.UUID) -> None:
+    q = await db.execute(
+        select(IdentityProfile)
+        .where(IdentityProfile.id == profile_id, IdentityProfile.user_id == user_id)
+        .with_for_update()
+    )
+    profile = q.scalar_one_or_none()
+    if profile is None:
+        raise IdentityError(404, "Identity not found")
+    q = await db.execute(
+        select(func.count()).select_from(Order).where(
+            Order.identity_profile_id == profile_id, Order.status.in_(_ACTIVE_ORDER_STATUSES)
+        )
+    )
+    if q.scalar_one():
+        raise IdentityError(409, "Identity is used by an order in progress")
+    rel = profile.artifact_path
+    # строки заказов держат ссылку на профиль — отвязываем
+    await db.execute(
+        update(Order).where(Order.identity_profile_id == profile_id).values(identity_profile_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.delete(profile)
+    await db.commit()
+    if rel:
+        await asyncio.to_thread(_remove, rel)
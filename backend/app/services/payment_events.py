@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.session import engine
+
+log = logging.getLogger(__name__)
+
+partitions_created = registry.counter("payment_events_partitions_created_total", "Monthly payment_events partitions created")
+partitions_detached = registry.counter("payment_events_partitions_detached_total", "Monthly payment_events partitions detached for archival")
+
+PARENT = "payment_events"
+DEFAULT_PARTITION = "payment_events_default"
+
+_NAME_RE = re.compile(r"^payment_events_(\d{4})(\d{2})$")
+
+# pg_try_advisory_xact_lock: секции обслуживает один инстанс, остальные пропускают проход
+_MAINTENANCE_LOCK_ID = 7_201_002
+
+
+def month_start(d: date | datetime) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    m = d.year * 12 + d.month - 1 + n
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_{month:%Y%m}"
+
+
+def _bound(month: date) -> str:
+    # границы секций — по UTC, как и received_at
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+async def list_partitions(conn: AsyncConnection) -> list[dict]:
+    q = await conn.execute(
+        text(
+            """
+            SELECT c.relname AS name,
+                   pg_get_expr(c.relpartbound, c.oid) AS bound,
+                   c.reltuples::bigint AS approx_rows,
+                   pg_total_relation_size(c.oid) AS total_bytes
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:parent AS regclass)
+            ORDER BY c.relname
+            """
+        ),
+        {"parent": PARENT},
+    )
+    return [dict(r._mapping) for r in q.all()]
+
+
+# Секция месяца. Если строки этого месяца уже попали в секцию по умолчанию, переносим их в новую
+# таблицу и присоединяем её: иначе CREATE ... PARTITION OF упадёт на проверке секции по умолчанию.
+async def create_partition(conn: AsyncConnection, month: date) -> bool:
+    name = partition_name(month)
+    q = await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+    if q.scalar_one():
+        return False
+
+    lo, hi = _bound(month), _bound(add_months(month, 1))
+    q = await conn.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE received_at >= {lo} AND received_at < {hi})")
+    )
+    if not q.scalar_one():
+        await conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM ({lo}) TO ({hi})"))
+    else:
+        # ATTACH всё равно возьмёт эксклюзивную блокировку секции по умолчанию — берём её сразу,
+        # чтобы между переносом и присоединением туда не дописались строки этого месяца
+        await conn.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE"))
+        await conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)"))
+        await conn.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE received_at >= {lo} AND received_at < {hi} RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            )
+        )
+        await conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ({lo}) TO ({hi})"))
+    partitions_created.inc()
+    return True
+
+
+# Текущий месяц и months_ahead следующих; возвращает имена созданных секций
+async def ensure_partitions(conn: AsyncConnection, months_ahead: int, *, today: date | None = None) -> list[str]:
+    current = month_start(today or datetime.now(timezone.utc))
+    created = []
+    for i in range(months_ahead + 1):
+        month = add_months(current, i)
+        if await create_partition(conn, month):
+            created.append(partition_name(month))
+    return created
+
+
+# Отсоединяет месячные секции старше keep_months полных месяцев: таблица остаётся в базе как обычная —
+# её можно выгрузить (pg_dump -t) и удалить. Без CONCURRENTLY: он несовместим с секцией по умолчанию.
+async def detach_partitions(conn: AsyncConnection, keep_months: int, *, today: date | None = None) -> list[str]:
+    cutoff = add_months(month_start(today or datetime.now(timezone.utc)), -keep_months)
+    detached = []
+    for p in await list_partitions(conn):
+        m = _NAME_RE.match(p["name"])
+        if m is None or date(int(m.group(1)), int(m.group(2)), 1) >= cutoff:
+            continue
+        await conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {p['name']}"))
+        detached.append(p["name"])
+    partitions_detached.inc(len(detached))
+    return detached
+
+
+class PaymentEventPartitions:
+    def __init__(self, *, interval_seconds: float, months_ahead: int, retention_months: int) -> None:
+        self.interval_seconds = interval_seconds
+        self.months_ahead = months_ahead
+        # 0 — не отсоединять автоматически
+        self.retention_months = retention_months
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="payment-event-partitions")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("payment_events partition maintenance failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def maintain(self) -> dict:
+        async with engine.begin() as conn:
+            q = await conn.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": _MAINTENANCE_LOCK_ID})
+            if not q.scalar_one():
+                return {"skipped": True}
+            # DDL ждёт блокировку родителя за вставками вебхуков — не выстраиваем за собой очередь
+            await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+            created = await ensure_partitions(conn, self.months_ahead)
+            detached = await detach_partitions(conn, self.retention_months) if self.retention_months > 0 else []
+        if created or detached:
+            log.info("payment_events partitions: created %s, detached %s", created, detached)
+        return {"skipped": False, "created": created, "detached": detached}
+
+
+payment_event_partitions = PaymentEventPartitions(
+    interval_seconds=settings.payment_events_maintenance_interval_seconds,
+    months_ahead=settings.payment_events_months_ahead,
+    retention_months=settings.payment_events_retention_months,
+)
@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy import and_, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.session import AsyncSessionLocal
+from app.models.order import Order
+from app.models.payment import Payment
+from app.models.payment_intent import PaymentIntent
+from app.services.yookassa_client import YooKassaUnavailable, get_yookassa_client
+
+log = logging.getLogger(__name__)
+
+outbox_created = registry.counter("payment_outbox_created_total", "Provider payments created from payment intents")
+outbox_retries = registry.counter("payment_outbox_retries_total", "Payment intents returned to the outbox after a provider failure")
+outbox_failed = registry.counter("payment_outbox_failed_total", "Payment intents given up on")
+outbox_in_flight = registry.gauge("payment_outbox_in_flight", "create_payment calls in progress")
+outbox_lag = registry.histogram("payment_outbox_lag_seconds", "Time from checkout to provider payment recorded")
+
+# Литерал, а не bind-параметр: иначе generic plan asyncpg не сопоставит условие с частичным индексом
+_PENDING = text("payment_intents.status = 'pending'")
+
+
+@dataclass(frozen=True)
+class CheckoutResult:
+    order_id: uuid.UUID
+    # pending — платёж у провайдера ещё не создан; ready | failed — итог;
+    # error — диспетчер упал на неожиданной ошибке, намерение повторится
+    state: str
+    payment_id: str | None = None
+    confirmation_url: str | None = None
+
+
+# Итог checkout по данным БД — для опроса клиентом и для случая, когда платёж создал другой процесс
+# user_id — только заказы этого пользователя
+async def load_checkout_result(db: AsyncSession, order_id: uuid.UUID, *, user_id: uuid.UUID | None = None) -> CheckoutResult | None:
+    stmt = (
+        select(PaymentIntent.status, Payment.provider_payment_id, Payment.confirmation_url)
+        .select_from(PaymentIntent)
+        .outerjoin(Payment, Payment.order_id == PaymentIntent.order_id)
+        .where(PaymentIntent.order_id == order_id)
+        .limit(1)
+    )
+    if user_id is not None:
+        stmt = stmt.join(Order, Order.id == PaymentIntent.order_id).where(Order.user_id == user_id)
+    q = await db.execute(stmt)
+    row = q.one_or_none()
+    if row is None:
+        return None
+    status, payment_id, confirmation_url = row
+    if payment_id:
+        return CheckoutResult(order_id, "ready", payment_id, confirmation_url)
+    return CheckoutResult(order_id, "failed" if status == "failed" else "pending")
+
+
+class PaymentOutbox:
+    def __init__(
+        self,
+        *,
+        concurrency: int,
+        batch_size: int,
+        poll_seconds: float,
+        claim_timeout_seconds: float,
+        max_attempts: int,
+    ) -> None:
+        # concurrency — предел одновременных create_payment процесса: пропускная способность checkout
+        # определяется им (и возможностями провайдера), а не числом удерживаемых соединений БД
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.claim_timeout = timedelta(seconds=claim_timeout_seconds)
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._in_flight: set[asyncio.Task] = set()
+        self._waiters: dict[uuid.UUID, list[asyncio.Future]] = {}
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="payment-outbox")
+
+    async def stop(self) -> None:
+        tasks = [*self._in_flight, *([self._task] if self._task is not None else [])]
+        for t in tasks:
+            t.cancel()
+        # незавершённые намерения вернутся в работу по claim_timeout; повтор create_payment идемпотентен
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._in_flight.clear()
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    # Ждём итог для заказа не дольше timeout; None — не успели (клиент опрашивает GET /checkout/{order_id})
+    async def wait_for(self, order_id: uuid.UUID, timeout: float) -> CheckoutResult | None:
+        if timeout <= 0:
+            return None
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(order_id, []).append(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(order_id)
+            if waiters is not None:
+                if fut in waiters:
+                    waiters.remove(fut)
+                if not waiters:
+                    del self._waiters[order_id]
+
+    def _resolve(self, result: CheckoutResult) -> None:
+        for fut in self._waiters.pop(result.order_id, []):
+            if not fut.done():
+                fut.set_result(result)
+
+    async def _run(self) -> None:
+        while True:
+            free = self.concurrency - len(self._in_flight)
+            claimed = []
+            if free > 0:
+                try:
+                    claimed = await self._claim(min(free, self.batch_size))
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("payment outbox claim failed")
+            for intent in claimed:
+                task = asyncio.create_task(self._dispatch(intent))
+                self._in_flight.add(task)
+                task.add_done_callback(self._on_done)
+            if len(claimed) == self.batch_size and len(claimed) < free:
+                # взяли полный пакет и слоты ещё есть — очередь, похоже, длиннее
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._in_flight.discard(task)
+        # освободился слот
+        self._wakeup.set()
+
+    async def _claim(self, limit: int) -> list:
+        now = datetime.now(timezone.utc)
+        # зависшие в processing (процесс упал посреди вызова) возвращаются по таймауту
+        candidates = (
+            select(PaymentIntent.order_id)
+            .where(
+                or_(
+                    and_(_PENDING, PaymentIntent.next_attempt_at <= now),
+                    and_(PaymentIntent.status == "processing", PaymentIntent.claimed_at < now - self.claim_timeout),
+                )
+            )
+            .order_by(PaymentIntent.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(
+                update(PaymentIntent)
+                .where(PaymentIntent.order_id.in_(candidates))
+                .values(status="processing", claimed_at=now, attempts=PaymentIntent.attempts + 1)
+                .returning(
+                    PaymentIntent.order_id,
+                    PaymentIntent.amount_rub,
+                    PaymentIntent.description,
+                    PaymentIntent.return_url,
+                    PaymentIntent.payment_metadata,
+                    PaymentIntent.attempts,
+                    PaymentIntent.created_at,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            rows = q.all()
+            await db.commit()
+        return rows
+
+    async def _dispatch(self, intent) -> None:
+        try:
+            await self._attempt(intent)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # баг или сбой БД при записи итога: без этого ждущие checkout висели бы до таймаута
+            log.exception("payment outbox dispatch for order %s failed", intent.order_id)
+            try:
+                await self._record_failure(intent, f"{type(e).__name__}: {e}", retryable=True)
+            except Exception:
+                # намерение останется в processing и вернётся по claim_timeout
+                log.exception("payment outbox could not record failure for order %s", intent.order_id)
+            self._resolve(CheckoutResult(intent.order_id, "error"))
+
+    async def _attempt(self, intent) -> None:
+        outbox_in_flight.inc()
+        try:
+            yk = await get_yookassa_client().create_payment(
+                amount_rub=intent.amount_rub,
+                return_url=intent.return_url,
+                description=intent.description,
+                idempotence_key=str(intent.order_id),
+                metadata=intent.payment_metadata,
+            )
+        except (YooKassaUnavailable, httpx.HTTPError) as e:
+            # 4xx — запрос отвергнут, повтор с тем же телом не поможет
+            retryable = not isinstance(e, httpx.HTTPStatusError)
+            await self._record_failure(intent, f"{type(e).__name__}: {e}", retryable=retryable)
+            return
+        finally:
+            outbox_in_flight.dec()
+
+        payment_id = yk.get("id")
+        if not payment_id:
+            await self._record_failure(intent, "YooKassa: no payment id", retryable=True)
+            return
+        await self._record_success(intent, payment_id, yk)
+
+    async def _record_success(self, intent, payment_id: str, yk: dict) -> None:
+        now = datetime.now(timezone.utc)
+        confirmation_url = (yk.get("confirmation") or {}).get("confirmation_url")
+        async with AsyncSessionLocal() as db:
+            # повторный create_payment после падения вернёт тот же платёж — строка уже может быть
+            await db.execute(
+                insert(Payment)
+                .values(
+                    id=uuid.uuid4(),
+                    order_id=intent.order_id,
+                    provider="yookassa",
+                    provider_payment_id=payment_id,
+                    status=yk.get("status") or "pending",
+                    amount_rub=intent.amount_rub,
+                    confirmation_url=confirmation_url,
+                    created_at=now,
+                )
+                .on_conflict_do_nothing(index_elements=[Payment.provider_payment_id])
+            )
+            await db.execute(
+                update(PaymentIntent)
+                .where(PaymentIntent.order_id == intent.order_id)
+                .values(status="done", provider_payment_id=payment_id, processed_at=now, error=None)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+        outbox_created.inc()
+        outbox_lag.observe((now - intent.created_at).total_seconds())
+        self._resolve(CheckoutResult(intent.order_id, "ready", payment_id, confirmation_url))
+
+    async def _record_failure(self, intent, error: str, *, retryable: bool) -> None:
+        now = datetime.now(timezone.utc)
+        exhausted = not retryable or intent.attempts >= self.max_attempts
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(PaymentIntent)
+                .where(PaymentIntent.order_id == intent.order_id)
+                .values(
+                    status="failed" if exhausted else "pending",
+                    # экспоненциальная пауза: провайдер лежит — не долбим его каждым poll-тиком
+                    next_attempt_at=now + timedelta(seconds=min(300, 2**intent.attempts)),
+                    processed_at=now if exhausted else None,
+                    error=error[:1000],
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if exhausted:
+                await db.execute(
+                    update(Order)
+                    .where(Order.id == intent.order_id, Order.status == "payment_pending")
+                    .values(status="payment_failed", updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+
+        if exhausted:
+            outbox_failed.inc()
+            log.error("payment intent for order %s failed: %s", intent.order_id, error)
+            self._resolve(CheckoutResult(intent.order_id, "failed"))
+        else:
+            outbox_retries.inc()
+
+
+payment_outbox = PaymentOutbox(
+    concurrency=settings.checkout_outbox_concurrency,
+    batch_size=settings.checkout_outbox_batch_size,
+    poll_seconds=settings.checkout_outbox_poll_seconds,
+    claim_timeout_seconds=settings.checkout_outbox_claim_timeout_seconds,
+    max_attempts=settings.checkout_outbox_max_attempts,
+)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, select, text, update
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.session import AsyncSessionLocal
+from app.models.payment import Payment
+from app.services.payment_state import apply_transitions
+from app.services.yookassa_client import get_yookassa_client
+
+log = logging.getLogger(__name__)
+
+reconcile_checked = registry.counter("payment_reconcile_checked_total", "Pending payments re-checked with YooKassa")
+reconcile_applied = registry.counter("payment_reconcile_applied_total", "Pending payments moved to a new status by reconciliation")
+reconcile_errors = registry.counter("payment_reconcile_errors_total", "Reconciliation get_payment failures")
+
+# Литерал, а не bind-параметр: иначе generic plan asyncpg не сопоставит условие с частичным индексом
+_PENDING = text("payments.status = 'pending'")
+
+
+class PaymentReconciler:
+    def __init__(self, *, interval_seconds: float, min_age_seconds: float, batch_size: int, concurrency: int) -> None:
+        self.interval_seconds = interval_seconds
+        self.min_age = timedelta(seconds=min_age_seconds)
+        self.recheck_after = timedelta(seconds=interval_seconds)
+        self.batch_size = batch_size
+        self._sem = asyncio.Semaphore(concurrency)
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="payment-reconciler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("payment reconciliation failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self) -> int:
+        total = 0
+        while True:
+            claimed = await self._claim()
+            if not claimed:
+                return total
+            total += await self._reconcile(claimed)
+            if len(claimed) < self.batch_size:
+                return total
+
+    async def _claim(self) -> list[str]:
+        # Проставляем last_checked_at в момент захвата: SKIP LOCKED разводит параллельные инстансы,
+        # а отметка не даёт другому инстансу взять те же платежи до следующего интервала.
+        now = datetime.now(timezone.utc)
+        candidates = (
+            select(Payment.id)
+            .where(
+                _PENDING,
+                Payment.created_at < now - self.min_age,
+                or_(Payment.last_checked_at.is_(None), Payment.last_checked_at < now - self.recheck_after),
+            )
+            .order_by(Payment.created_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(
+                update(Payment)
+                .where(Payment.id.in_(candidates))
+                .values(last_checked_at=now)
+                .returning(Payment.provider_payment_id)
+                .execution_options(synchronize_session=False)
+            )
+            ids = list(q.scalars().all())
+            await db.commit()
+        return ids
+
+    async def _fetch(self, payment_id: str) -> tuple[str, dict | None]:
+        async with self._sem:
+            try:
+                verified = await get_yookassa_client().get_payment(payment_id=payment_id)
+            except Exception:
+                reconcile_errors.inc()
+                log.warning("reconcile: get_payment %s failed", payment_id, exc_info=True)
+                return payment_id, None
+        return payment_id, verified
+
+    async def _reconcile(self, payment_ids: list[str]) -> int:
+        results = await asyncio.gather(*(self._fetch(pid) for pid in payment_ids))
+        reconcile_checked.inc(len(payment_ids))
+
+        changed = {pid: obj for pid, obj in results if obj and obj.get("status") not in (None, "pending")}
+        if not changed:
+            return 0
+
+        # один оператор и один коммит на пакет; машина состояний не даст откатить то, что успел применить вебхук.
+        # Ответ ЮKassa уходит в журнал payment_events в той же форме, что и уведомление.
+        async with AsyncSessionLocal() as db:
+            applied = len(
+                await apply_transitions(
+                    db,
+                    {pid: obj["status"] for pid, obj in changed.items()},
+                    raw={pid: {"object": obj} for pid, obj in changed.items()},
+                    source="reconcile",
+                )
+            )
+            await db.commit()
+        reconcile_applied.inc(applied)
+        if applied:
+            log.info("reconcile: %s pending payment(s) updated", applied)
+        return applied
+
+
+payment_reconciler = PaymentReconciler(
+    interval_seconds=settings.reconcile_interval_seconds,
+    min_age_seconds=settings.reconcile_min_age_seconds,
+    batch_size=settings.reconcile_batch_size,
+    concurrency=settings.reconcile_concurrency,
+)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import uuid
+from dataclasses import dataclass
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import Text
+
+from app.services.credits import grant_for_orders
+from app.services.generation_jobs import enqueue_order_jobs
+
+# Машина состояний платежа ЮKassa. Переход применяется одним SQL-оператором с блокировкой строк:
+# параллельные доставки одного платежа выстраиваются на блокировке, и после неё условие перехода
+# проверяется заново — запоздавший pending не перетрёт succeeded.
+# Используется синхронным вебхуком, воркерами inbox и сверкой зависших платежей; сырые события
+# пишутся тем же оператором в журнал payment_events, строка payments остаётся узкой.
+
+TERMINAL = frozenset({"succeeded", "canceled"})
+
+ALLOWED: dict[str, frozenset[str]] = {
+    "pending": frozenset({"waiting_for_capture", "succeeded", "canceled"}),
+    "waiting_for_capture": frozenset({"succeeded", "canceled"}),
+    "succeeded": frozenset(),
+    "canceled": frozenset(),
+}
+
+# статус заказа по финальному статусу платежа; трогаем только заказ, который ещё ждёт оплату
+ORDER_STATUS_BY_PAYMENT = {"succeeded": "paid", "canceled": "canceled"}
+
+
+def can_transition(current: str, new: str | None) -> bool:
+    return bool(new) and new in ALLOWED.get(current, frozenset())
+
+
+def _allowed_values() -> str:
+    pairs = [(src, dst) for src, dsts in ALLOWED.items() for dst in sorted(dsts)]
+    return ", ".join(f"('{src}', '{dst}')" for src, dst in pairs)
+
+
+def _order_case() -> str:
+    return " ".join(f"WHEN '{p}' THEN '{o}'" for p, o in ORDER_STATUS_BY_PAYMENT.items())
+
+
+# Литералы переходов вшиты в текст: план один на все вызовы, а правило живёт в одном месте (ALLOWED).
+# locked — блокируем строки платежей в порядке id, чтобы пересекающиеся пакеты не ловили дедлок.
+_APPLY_SQL = text(
+    f"""
+    WITH incoming AS (
+        SELECT * FROM unnest(:ids, :statuses, :raws) AS i(provider_payment_id, status, raw)
+    ),
+    allowed(from_status, to_status) AS (VALUES {_allowed_values()}),
+    locked AS (
+        SELECT p.id
+        FROM payments p
+        JOIN incoming i ON i.provider_payment_id = p.provider_payment_id
+        ORDER BY p.id
+        FOR UPDATE OF p
+    ),
+    moved AS (
+        UPDATE payments p
+        SET status = i.status,
+            paid_at = CASE WHEN i.status = 'succeeded' THEN now() ELSE p.paid_at END
+        FROM incoming i, allowed a, locked l
+        WHERE p.id = l.id
+          AND p.provider_payment_id = i.provider_payment_id
+          AND a.from_status = p.status
+          AND a.to_status = i.status
+        RETURNING p.provider_payment_id, p.order_id, p.status
+    ),
+    orders_moved AS (
+        UPDATE orders o
+        SET status = CASE m.status {_order_case()} END,
+            updated_at = now()
+        FROM moved m
+        WHERE o.id = m.order_id
+          AND m.status IN ({", ".join(f"'{s}'" for s in ORDER_STATUS_BY_PAYMENT)})
+          AND o.status = 'payment_pending'
+        RETURNING o.id, o.status
+    ),
+    -- сырое событие — в журнал payment_events тем же оператором, включая не применённые (повторы, запоздавшие)
+    logged AS (
+        INSERT INTO payment_events (received_at, provider_payment_id, source, event, status, applied, payload)
+        SELECT now(), i.provider_payment_id, :source, i.raw::jsonb ->> 'event', i.status,
+               EXISTS (SELECT 1 FROM moved m WHERE m.provider_payment_id = i.provider_payment_id),
+               i.raw::jsonb
+        FROM incoming i
+        WHERE i.raw IS NOT NULL
+    )
+    SELECT m.provider_payment_id, m.order_id, m.status, om.status AS order_status
+    FROM moved m
+    LEFT JOIN orders_moved om ON om.id = m.order_id
+    """
+).bindparams(
+    bindparam("ids", type_=ARRAY(Text)),
+    bindparam("statuses", type_=ARRAY(Text)),
+    bindparam("raws", type_=ARRAY(Text)),
+    bindparam("source", type_=Text),
+)
+
+
+@dataclass(frozen=True)
+class Transition:
+    provider_payment_id: str
+    order_id: uuid.UUID
+    status: str
+    # None — заказ не менялся (промежуточный статус или заказ уже не ждёт оплату)
+    order_status: str | None
+
+
+# Пакет переходов одним оператором. statuses: provider_payment_id -> подтверждённый статус ЮKassa.
+# raw — исходные события для журнала payment_events (source: webhook | reconcile).
+# Заказы, ставшие paid, сразу получают кредиты по плану и задачи генерации — в той же транзакции.
+# Возвращает только реально применённые переходы. Коммит — на вызывающем.
+async def apply_transitions(
+    db: AsyncSession,
+    statuses: dict[str, str | None],
+    *,
+    raw: dict[str, dict] | None = None,
+    source: str = "webhook",
+) -> list[Transition]:
+    items = [(pid, status) for pid, status in statuses.items() if status]
+    if not items:
+        return []
+
+    raws = [json.dumps(raw[pid], ensure_ascii=False) if raw is not None and pid in raw else None for pid, _ in items]
+    q = await db.execute(
+        _APPLY_SQL,
+        {"ids": [pid for pid, _ in items], "statuses": [s for _, s in items], "raws": raws, "source": source},
+    )
+    applied = [Transition(r.provider_payment_id, r.order_id, r.status, r.order_status) for r in q.all()]
+    paid = [t.order_id for t in applied if t.order_status == "paid"]
+    await grant_for_orders(db, paid)
+    await enqueue_order_jobs(db, paid)
+    return applied
+
+
+async def apply_transition(
+    db: AsyncSession, provider_payment_id: str, status: str | None, *, raw: dict | None = None, source: str = "webhook"
+) -> Transition | None:
+    applied = await apply_transitions(
+        db, {provider_payment_id: status}, raw={provider_payment_id: raw} if raw is not None else None, source=source
+    )
+    return applied[0] if applied else None
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass
+from decimal import ROUND_CEILING, Decimal
+from types import MappingProxyType
+from typing import Mapping
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.plan import Plan
+from app.services.catalog_cache import CachedBody, CatalogCache, catalog_versions, json_body
+
+PLANS_CACHE_KEY = "plans"
+
+
+@dataclass(frozen=True)
+class PlanPrice:
+    plan_id: uuid.UUID
+    code: str
+    title: str
+    images_count: int
+    videos_count: int
+    # первый заказ включает обучение профиля лица, повторный — нет
+    cost_first_rub: int
+    cost_repeat_rub: int
+    price_first_rub: int
+    price_repeat_rub: int
+
+
+@dataclass(frozen=True)
+class PriceTable:
+    by_code: Mapping[str, PlanPrice]
+    # готовый ответ GET /plans
+    plans_body: CachedBody
+
+
+def _dec(value: float) -> Decimal:
+    # через str: иначе Decimal унаследует двоичный хвост float (0.1 -> 0.1000000000000000055...)
+    return Decimal(str(value))
+
+
+def _ceil_rub(value: Decimal) -> int:
+    return int(value.to_integral_value(rounding=ROUND_CEILING))
+
+
+def build_price_table(plans: list[Plan]) -> PriceTable:
+    image = _dec(settings.cost_image_rub)
+    video = _dec(settings.cost_video_rub)
+    training = _dec(settings.cost_training_rub)
+    multiplier = _dec(settings.min_price_multiplier)
+
+    prices: list[PlanPrice] = []
+    for p in plans:
+        cost_repeat = p.images_count * image + p.videos_count * video
+        cost_first = cost_repeat + training
+        prices.append(
+            PlanPrice(
+                plan_id=p.id,
+                code=p.code,
+                title=p.title,
+                images_count=p.images_count,
+                videos_count=p.videos_count,
+                cost_first_rub=_ceil_rub(cost_first),
+                cost_repeat_rub=_ceil_rub(cost_repeat),
+                price_first_rub=_ceil_rub(cost_first * multiplier),
+                price_repeat_rub=_ceil_rub(cost_repeat * multiplier),
+            )
+        )
+
+    body = json_body(
+        [
+            {
+                "code": pp.code,
+                "title": pp.title,
+                "images_count": pp.images_count,
+                "videos_count": pp.videos_count,
+                "price_rub_first_order": pp.price_first_rub,
+                "price_rub_repeat_order": pp.price_repeat_rub,
+            }
+            for pp in prices
+        ]
+    )
+    return PriceTable(
+        by_code=MappingProxyType({pp.code: pp for pp in prices}),
+        plans_body=body,
+    )
+
+
+async def _load_price_table() -> PriceTable:
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(select(Plan).where(Plan.is_active == True).order_by(Plan.videos_count.asc()))
+        plans = list(q.scalars().all())
+    return build_price_table(plans)
+
+
+price_cache: CatalogCache[PriceTable] = catalog_versions.register(CatalogCache(PLANS_CACHE_KEY, _load_price_table))
+
+
+# Таблица пересобирается при смене версии каталога тарифов (cache_versions); себестоимость из Settings
+# неизменна до перезапуска процесса.
+async def get_price_table() -> PriceTable:
+    return await price_cache.get()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from email.utils import format_datetime
+from typing import Callable
+
+import brotli
+
+
+@dataclass(frozen=True)
+class RenderedPage:
+    identity: bytes
+    gzip: bytes
+    br: bytes
+    etag: str
+    last_modified: datetime
+    last_modified_http: str
+    max_age: int
+    rendered_for: date
+
+
+@dataclass(frozen=True)
+class _PageSpec:
+    builder: Callable[[date], str]
+    daily: bool
+    max_age: int
+
+
+def render_page(html: str, *, max_age: int, rendered_for: date) -> RenderedPage:
+    body = html.encode("utf-8")
+    # HTTP-даты — с точностью до секунды, иначе If-Modified-Since никогда не совпадёт
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    return RenderedPage(
+        identity=body,
+        gzip=gzip.compress(body, compresslevel=9, mtime=0),
+        br=brotli.compress(body, quality=11, mode=brotli.MODE_TEXT),
+        etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+        last_modified=now,
+        last_modified_http=format_datetime(now, usegmt=True),
+        max_age=max_age,
+        rendered_for=rendered_for,
+    )
+
+
+# Маркетинговые и юридические страницы: рендерятся один раз (на старте) и отдаются готовыми байтами.
+# Страницы с датой в тексте (daily) перерисовываются при первом запросе нового дня.
+class PageStore:
+    def __init__(self) -> None:
+        self._specs: dict[str, _PageSpec] = {}
+        self._pages: dict[str, RenderedPage] = {}
+
+    def register(self, key: str, builder: Callable[[date], str], *, daily: bool = False, max_age: int = 3600) -> None:
+        self._specs[key] = _PageSpec(builder=builder, daily=daily, max_age=max_age)
+
+    def _render(self, key: str, today: date) -> RenderedPage:
+        spec = self._specs[key]
+        page = render_page(spec.builder(today), max_age=spec.max_age, rendered_for=today)
+        self._pages[key] = page
+        return page
+
+    def render_all(self) -> None:
+        today = date.today()
+        for key in self._specs:
+            self._render(key, today)
+
+    def get(self, key: str) -> RenderedPage:
+        page = self._pages.get(key)
+        if page is None:
+            return self._render(key, date.today())
+        if self._specs[key].daily:
+            today = date.today()
+            if page.rendered_for != today:
+                return self._render(key, today)
+        return page
+
+
+pages = PageStore()
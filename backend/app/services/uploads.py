@@ -0,0 +1,467 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.models.order import Order
+from app.models.plan import Plan
+from app.models.upload import Upload
+from app.models.upload_blob import UploadBlob
+
+upload_bytes = registry.counter_vec("upload_bytes_total", "Upload bytes accepted into part files", ("kind",))
+upload_completed = registry.counter_vec("uploads_completed_total", "Finished uploads by storage outcome", ("kind", "outcome"))
+upload_rejected = registry.counter_vec("uploads_rejected_total", "Upload requests refused by limits", ("reason",))
+
+# Приём файла частями: POST создаёт загрузку, каждый PUT дописывает кусок строго с текущего смещения,
+# GET отдаёт смещение для докачки после обрыва. Тело запроса пишется на диск по мере чтения, sha256
+# считается на лету — память не зависит от размера файла. Готовое содержимое переезжает в blobs/<sha256>;
+# если такое уже есть (тот же файл у другого пользователя), part-файл просто удаляется.
+
+KINDS = ("track", "photo")
+
+# заявленные клиентами синонимы
+_TYPE_ALIASES = {"audio/x-wav": "audio/wav", "audio/wave": "audio/wav", "audio/mp3": "audio/mpeg", "audio/x-flac": "audio/flac",
+                 "audio/x-m4a": "audio/mp4", "image/jpg": "image/jpeg"}
+
+# первых байт достаточно для любой сигнатуры ниже
+_SNIFF_BYTES = 12
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail) -> None:
+        super().__init__(str(detail))
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_type(head: bytes) -> str | None:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head.startswith(b"fLaC"):
+        return "audio/flac"
+    if head.startswith(b"OggS"):
+        return "audio/ogg"
+    if head[4:8] == b"ftyp":
+        return "audio/mp4"
+    if head.startswith(b"ID3") or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "audio/mpeg"
+    return None
+
+
+def _types(kind: str) -> set[str]:
+    value = settings.upload_track_types if kind == "track" else settings.upload_photo_types
+    return {t.strip() for t in value.split(",") if t.strip()}
+
+
+def _plan_limits_mb(value: str) -> dict[tuple[str, str], int]:
+    out = {}
+    for part in value.split(","):
+        key, sep, mb = part.partition(":")
+        code, dot, kind = key.strip().rpartition(".")
+        if sep and dot and code:
+            out[(code, kind)] = int(mb)
+    return out
+
+
+_PLAN_LIMITS_MB = _plan_limits_mb(settings.upload_plan_limits_mb)
+
+
+# Лимит размера: по плану, если он задан в UPLOAD_PLAN_LIMITS_MB, иначе общий для вида файла.
+# Без плана (первый заказ ещё не оформлен) — общий.
+def max_bytes(kind: str, plan_code: str | None) -> int:
+    default = settings.upload_track_max_mb if kind == "track" else settings.upload_photo_max_mb
+    if plan_code is None:
+        return default * 1024 * 1024
+    return _PLAN_LIMITS_MB.get((plan_code, kind), default) * 1024 * 1024
+
+
+# Планы, которые пользователь действительно держит: оплаченные, выполняемые и выполненные заказы
+async def held_plan_codes(db: AsyncSession, user_id: uuid.UUID) -> set[str]:
+    q = await db.execute(
+        select(Plan.code)
+        .join(Order, Order.plan_id == Plan.id)
+        .where(Order.user_id == user_id, Order.status.in_(("paid", "in_progress", "completed")))
+        .distinct()
+    )
+    return set(q.scalars().all())
+
+
+# plan_code из запроса принимаем, только если план оплачен; без него — самый щедрый из оплаченных,
+# но не строже общего лимита: оплаченный план не должен уменьшать лимит
+async def _resolve_plan(db: AsyncSession, user_id: uuid.UUID, kind: str, requested: str | None) -> str | None:
+    held = await held_plan_codes(db, user_id)
+    if requested is not None:
+        if requested not in held:
+            upload_rejected.labels("plan").inc()
+            raise UploadError(403, "plan_code must be a plan of your paid order")
+        return requested
+    best = max(held, key=lambda code: max_bytes(kind, code), default=None)
+    if best is None or max_bytes(kind, best) <= max_bytes(kind, None):
+        return None
+    return best
+
+
+def _abs(rel: str) -> str:
+    return os.path.join(settings.upload_dir, rel)
+
+
+def _part_rel(upload_id: uuid.UUID) -> str:
+    return os.path.join("parts", f"{upload_id}.part")
+
+
+def blob_rel_path(sha256: str) -> str:
+    return os.path.join("blobs", sha256[:2], sha256)
+
+
+def upload_state(u: Upload) -> dict:
+    return {
+        "upload_id": str(u.id),
+        "kind": u.kind,
+        "status": u.status,
+        "size": u.size,
+        "offset": u.received,
+        "sha256": u.sha256,
+        "chunk_max_bytes": settings.upload_chunk_max_bytes,
+        "expires_at": u.expires_at.isoformat(),
+    }
+
+
+async def create_upload(db: AsyncSession, user_id: uuid.UUID, payload: dict) -> dict:
+    kind = str(payload.get("kind") or "")
+    if kind not in KINDS:
+        raise UploadError(400, f"kind must be one of {', '.join(KINDS)}")
+    content_type = str(payload.get("content_type") or "").strip().lower()
+    content_type = _TYPE_ALIASES.get(content_type, content_type)
+    if content_type not in _types(kind):
+        upload_rejected.labels("type").inc()
+        raise UploadError(415, f"{kind} content_type must be one of {', '.join(sorted(_types(kind)))}")
+    try:
+        size = int(payload.get("size"))
+    except (TypeError, ValueError):
+        raise UploadError(400, "size is required")
+    plan_code = await _resolve_plan(db, user_id, kind, payload.get("plan_code") or None)
+    limit = max_bytes(kind, plan_code)
+    if size <= 0 or size > limit:
+        upload_rejected.labels("size").inc()
+        raise UploadError(413, f"{kind} size must be 1..{limit} bytes for this plan")
+    expected = payload.get("sha256")
+    if expected is not None:
+        expected = str(expected).strip().lower()
+        if not _SHA256_RE.match(expected):
+            raise UploadError(400, "sha256 must be a hex digest")
+        # этот пользователь уже загружал такой файл — передавать заново не нужно
+        q = await db.execute(
+            select(Upload).where(
+                Upload.user_id == user_id, Upload.sha256 == expected, Upload.status == "complete", Upload.kind == kind
+            ).limit(1)
+        )
+        existing = q.scalar_one_or_none()
+        if existing is not None:
+            upload_completed.labels(kind, "reused").inc()
+            return upload_state(existing)
+
+    now = datetime.now(timezone.utc)
+    # счёт открытых и вставка — под блокировкой пользователя, иначе параллельные POST обойдут лимит
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"uploads:{user_id}"})
+    q = await db.execute(
+        select(func.count()).select_from(Upload).where(
+            Upload.user_id == user_id, Upload.status == "receiving", Upload.expires_at > now
+        )
+    )
+    if q.scalar_one() >= settings.upload_max_open_per_user:
+        await db.rollback()
+        upload_rejected.labels("open_uploads").inc()
+        raise UploadError(429, f"Too many unfinished uploads (max {settings.upload_max_open_per_user}); finish or wait for them to expire")
+    upload = Upload(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        kind=kind,
+        content_type=content_type,
+        plan_code=plan_code,
+        size=size,
+        received=0,
+        status="receiving",
+        expected_sha256=expected,
+        created_at=now,
+        updated_at=now,
+        expires_at=now + timedelta(hours=settings.upload_session_hours),
+    )
+    db.add(upload)
+    await db.commit()
+    return upload_state(upload)
+
+
+async def get_upload(db: AsyncSession, user_id: uuid.UUID, upload_id: uuid.UUID) -> Upload:
+    q = await db.execute(select(Upload).where(Upload.id == upload_id, Upload.user_id == user_id))
+    upload = q.scalar_one_or_none()
+    if upload is None:
+        raise UploadError(404, "Upload not found")
+    return upload
+
+
+# Состояние sha256 между частями. Часть, пришедшая в другой процесс (или после перезапуска), пересчитает
+# хеш по уже записанному part-файлу — потоково, той же постоянной памятью.
+_hashers: OrderedDict[uuid.UUID, tuple[int, "hashlib._Hash"]] = OrderedDict()
+_HASHERS_MAX = 1024
+
+
+def _remember_hasher(upload_id: uuid.UUID, offset: int, h) -> None:
+    _hashers[upload_id] = (offset, h)
+    _hashers.move_to_end(upload_id)
+    while len(_hashers) > _HASHERS_MAX:
+        _hashers.popitem(last=False)
+
+
+def _rehash(path: str, length: int):
+    h = hashlib.sha256()
+    if length == 0:
+        return h
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        raise UploadError(409, "Upload data is missing, start over")
+    with f:
+        left = length
+        while left > 0:
+            chunk = f.read(min(1024 * 1024, left))
+            if not chunk:
+                raise UploadError(409, "Upload data is missing, start over")
+            h.update(chunk)
+            left -= len(chunk)
+    return h
+
+
+def _open_part(path: str, offset: int):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "r+b" if offset else "wb")
+    # хвост прошлой оборванной части за смещением отбрасываем
+    f.seek(offset)
+    f.truncate()
+    return f
+
+
+async def _claim_writer(db: AsyncSession, user_id: uuid.UUID, upload_id: uuid.UUID, offset: int, token: str) -> Upload:
+    now = datetime.now(timezone.utc)
+    q = await db.execute(
+        update(Upload)
+        .where(
+            Upload.id == upload_id,
+            Upload.user_id == user_id,
+            Upload.status == "receiving",
+            Upload.received == offset,
+            Upload.expires_at > now,
+            (Upload.writer.is_(None)) | (Upload.writer_until < now),
+        )
+        .values(writer=token, writer_until=now + timedelta(seconds=settings.upload_chunk_timeout_seconds * 2))
+        .returning(Upload)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    upload = q.scalar_one_or_none()
+    await db.commit()
+    if upload is not None:
+        return upload
+
+    # почему не взяли: ответ подсказывает клиенту, что делать дальше
+    current = await get_upload(db, user_id, upload_id)
+    if current.status != "receiving":
+        raise UploadError(409, {"detail": "Upload is already complete", **upload_state(current)})
+    if current.expires_at <= now:
+        raise UploadError(410, "Upload expired, start over")
+    if current.received != offset:
+        raise UploadError(409, {"detail": "Offset mismatch, resume from offset", **upload_state(current)})
+    raise UploadError(409, "Another chunk of this upload is in progress")
+
+
+async def _release_writer(db: AsyncSession, upload_id: uuid.UUID, token: str) -> None:
+    await db.execute(
+        update(Upload)
+        .where(Upload.id == upload_id, Upload.writer == token)
+        .values(writer=None, writer_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def _receive(upload: Upload, offset: int, limit: int, body: AsyncIterator[bytes], h) -> int:
+    path = _abs(_part_rel(upload.id))
+    f = await asyncio.to_thread(_open_part, path, offset)
+    n = 0
+    head = b""
+    try:
+        async for piece in body:
+            if not piece:
+                continue
+            n += len(piece)
+            if n > limit:
+                upload_rejected.labels("chunk_size").inc()
+                raise UploadError(413, f"Chunk exceeds {limit} bytes")
+            if offset == 0 and len(head) < _SNIFF_BYTES:
+                # тип — по сигнатуре файла, до записи остального тела
+                head += piece[: _SNIFF_BYTES - len(head)]
+                if len(head) >= _SNIFF_BYTES or n >= upload.size:
+                    _check_type(upload, head)
+            h.update(piece)
+            await asyncio.to_thread(f.write, piece)
+        if offset == 0 and len(head) < _SNIFF_BYTES:
+            _check_type(upload, head)
+        await asyncio.to_thread(f.flush)
+    finally:
+        await asyncio.to_thread(f.close)
+    return n
+
+
+def _check_type(upload: Upload, head: bytes) -> None:
+    detected = sniff_type(head)
+    if detected != upload.content_type:
+        upload_rejected.labels("signature").inc()
+        raise UploadError(415, f"File content does not look like {upload.content_type}")
+
+
+# Одна часть: смещение должно совпасть с принятым, тело читается потоком прямо в part-файл.
+# Соединение БД на время приёма не держим: запись части закреплена за запросом полем writer.
+async def write_chunk(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    upload_id: uuid.UUID,
+    offset: int,
+    body: AsyncIterator[bytes],
+    content_length: int | None,
+) -> dict:
+    token = uuid.uuid4().hex
+    upload = await _claim_writer(db, user_id, upload_id, offset, token)
+    limit = min(settings.upload_chunk_max_bytes, upload.size - offset)
+    try:
+        if content_length is not None and content_length > limit:
+            upload_rejected.labels("chunk_size").inc()
+            raise UploadError(413, f"Chunk exceeds {limit} bytes")
+        cached = _hashers.pop(upload_id, None)
+        if cached is not None and cached[0] == offset:
+            h = cached[1]
+        else:
+            h = await asyncio.to_thread(_rehash, _abs(_part_rel(upload_id)), offset)
+        try:
+            n = await asyncio.wait_for(_receive(upload, offset, limit, body, h), timeout=settings.upload_chunk_timeout_seconds)
+        except asyncio.TimeoutError:
+            raise UploadError(408, "Chunk upload timed out, resume from the last offset")
+    except BaseException:
+        await _release_writer(db, upload_id, token)
+        raise
+
+    now = datetime.now(timezone.utc)
+    done = offset + n == upload.size
+    q = await db.execute(
+        update(Upload)
+        .where(Upload.id == upload_id, Upload.writer == token)
+        .values(
+            received=offset + n,
+            # последняя часть держит запись до переноса в blob: параллельный запрос не начнёт его второй раз
+            writer=token if done else None,
+            writer_until=upload.writer_until if done else None,
+            updated_at=now,
+            expires_at=now + timedelta(hours=settings.upload_session_hours),
+        )
+        .returning(Upload)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    upload = q.scalar_one_or_none()
+    await db.commit()
+    if upload is None:
+        raise UploadError(409, "Upload chunk lease expired, resume from the last offset")
+    upload_bytes.labels(upload.kind).inc(n)
+    if not done:
+        _remember_hasher(upload_id, upload.received, h)
+        return upload_state(upload)
+    try:
+        return await _finish(db, upload, h.hexdigest())
+    except BaseException:
+        await db.rollback()
+        await _release_writer(db, upload_id, token)
+        raise
+
+
+def _store_blob(part: str, blob: str) -> bool:
+    if os.path.exists(blob):
+        os.remove(part)
+        return False
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    os.replace(part, blob)
+    return True
+
+
+# Приняты все байты: part-файл становится blob-ом по sha256 либо удаляется, если такой blob уже есть
+async def _finish(db: AsyncSession, upload: Upload, digest: str) -> dict:
+    part = _abs(_part_rel(upload.id))
+    if upload.expected_sha256 and upload.expected_sha256 != digest:
+        await asyncio.to_thread(os.remove, part)
+        await db.execute(
+            update(Upload)
+            .where(Upload.id == upload.id)
+            .values(status="failed", sha256=digest, writer=None, writer_until=None, updated_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        upload_rejected.labels("checksum").inc()
+        raise UploadError(422, "sha256 of the received data does not match the declared one")
+
+    rel = blob_rel_path(digest)
+    stored = await asyncio.to_thread(_store_blob, part, _abs(rel))
+    await db.execute(
+        insert(UploadBlob)
+        .values(sha256=digest, size=upload.size, content_type=upload.content_type, path=rel, created_at=datetime.now(timezone.utc))
+        .on_conflict_do_nothing(index_elements=[UploadBlob.sha256])
+    )
+    q = await db.execute(
+        update(Upload)
+        .where(Upload.id == upload.id)
+        .values(status="complete", sha256=digest, writer=None, writer_until=None, updated_at=datetime.now(timezone.utc))
+        .returning(Upload)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    upload = q.scalar_one()
+    await db.commit()
+    upload_completed.labels(upload.kind, "stored" if stored else "deduplicated").inc()
+    return upload_state(upload)
+
+
+def _sweep(root: str, max_age_seconds: float) -> int:
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+# part-файлы брошенных загрузок; строки uploads удаляет purge по expires_at (services/db_maintenance.py)
+async def sweep_stale_parts() -> int:
+    # час запаса: последняя часть могла продлить срок уже после проверки
+    return await asyncio.to_thread(_sweep, _abs("parts"), settings.upload_session_hours * 3600 + 3600)
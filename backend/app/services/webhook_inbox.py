@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.session import AsyncSessionLocal
+from app.models.webhook_event import WebhookEvent
+from app.services.payment_state import apply_transitions
+from app.services.webhook_verify import Verification, verify_event
+
+log = logging.getLogger(__name__)
+
+inbox_depth = registry.gauge("webhook_inbox_depth", "Webhook events waiting in the inbox")
+inbox_oldest_age = registry.gauge("webhook_inbox_oldest_pending_seconds", "Age of the oldest pending webhook event")
+inbox_lag = registry.histogram("webhook_inbox_lag_seconds", "Time from webhook receipt to applied status")
+inbox_processed = registry.counter("webhook_inbox_processed_total", "Webhook events applied")
+inbox_duplicates = registry.counter("webhook_inbox_duplicates_total", "Repeat deliveries collapsed within a batch")
+inbox_retries = registry.counter("webhook_inbox_retries_total", "Webhook events returned to the inbox after a failed verify")
+inbox_failed = registry.counter("webhook_inbox_failed_total", "Webhook events dropped after max attempts")
+
+# Будит воркеры этого процесса сразу после записи события; остальные процессы подхватят по poll-интервалу
+_wakeup = asyncio.Event()
+
+
+async def enqueue(db: AsyncSession, payload: dict, source_ip: str | None) -> None:
+    obj = payload.get("object") or {}
+    await db.execute(
+        insert(WebhookEvent).values(
+            provider="yookassa",
+            event=payload.get("event"),
+            provider_payment_id=obj["id"],
+            payload=payload,
+            source_ip=source_ip,
+            status="pending",
+            attempts=0,
+            received_at=datetime.now(timezone.utc),
+        )
+    )
+    await db.commit()
+    _wakeup.set()
+
+
+class WebhookInboxWorker:
+    def __init__(
+        self,
+        *,
+        workers: int,
+        batch_size: int,
+        verify_concurrency: int,
+        poll_seconds: float,
+        claim_timeout_seconds: float,
+        max_attempts: int,
+        backoff_seconds: float,
+        backoff_max_seconds: float,
+    ) -> None:
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.claim_timeout = timedelta(seconds=claim_timeout_seconds)
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        # общий лимит на исходящие get_payment со всех воркеров процесса
+        self._verify_sem = asyncio.Semaphore(verify_concurrency)
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run(), name=f"webhook-inbox-{i}") for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._monitor(), name="webhook-inbox-monitor"))
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("webhook inbox batch failed")
+                processed = 0
+
+            # ничего не применили (пусто или одни отложенные повторы) — ждём, а не крутим выборку
+            if processed == 0:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                _wakeup.clear()
+
+    async def _monitor(self) -> None:
+        while True:
+            try:
+                await self.refresh_depth()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("webhook inbox depth refresh failed")
+            await asyncio.sleep(max(self.poll_seconds, 5.0))
+
+    async def refresh_depth(self) -> None:
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(
+                select(func.count(), func.min(WebhookEvent.received_at)).where(WebhookEvent.status.in_(("pending", "processing")))
+            )
+            depth, oldest = q.one()
+        inbox_depth.set(depth or 0)
+        inbox_oldest_age.set((datetime.now(timezone.utc) - oldest).total_seconds() if oldest else 0.0)
+
+    async def _claim(self, db: AsyncSession) -> list:
+        now = datetime.now(timezone.utc)
+        # зависшие в processing (воркер упал) возвращаются в работу по таймауту
+        candidates = (
+            select(WebhookEvent.id)
+            .where(
+                or_(
+                    and_(
+                        WebhookEvent.status == "pending",
+                        or_(WebhookEvent.next_attempt_at.is_(None), WebhookEvent.next_attempt_at <= now),
+                    ),
+                    and_(WebhookEvent.status == "processing", WebhookEvent.claimed_at < now - self.claim_timeout),
+                )
+            )
+            .order_by(WebhookEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        q = await db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(candidates))
+            .values(status="processing", claimed_at=now, attempts=WebhookEvent.attempts + 1)
+            .returning(
+                WebhookEvent.id,
+                WebhookEvent.provider_payment_id,
+                WebhookEvent.payload,
+                WebhookEvent.source_ip,
+                WebhookEvent.received_at,
+                WebhookEvent.attempts,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        rows = sorted(q.all(), key=lambda r: r.id)
+        await db.commit()
+        return rows
+
+    async def _verify(self, ev) -> tuple[str, Verification | None, str | None]:
+        async with self._verify_sem:
+            try:
+                verification = await verify_event(ev.payload, ev.source_ip)
+            except Exception as e:
+                return ev.provider_payment_id, None, f"{type(e).__name__}: {e}"
+        return ev.provider_payment_id, verification, None
+
+    # Пауза перед повтором: при недоступной ЮKassa (или открытом breaker) попытки не сгорают за миллисекунды
+    def _retry_delay(self, attempts: int) -> timedelta:
+        delay = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        return timedelta(seconds=delay)
+
+    # Возвращает число применённых событий (включая схлопнутые дубли); отложенные повторы не считаются
+    async def drain_once(self) -> int:
+        async with AsyncSessionLocal() as db:
+            events = await self._claim(db)
+        if not events:
+            return 0
+
+        # повторные доставки одного платежа схлопываем: проверяем и применяем только последнюю
+        latest = {}
+        for ev in events:
+            latest[ev.provider_payment_id] = ev
+        duplicate_ids = [ev.id for ev in events if latest[ev.provider_payment_id].id != ev.id]
+
+        results = await asyncio.gather(*(self._verify(ev) for ev in latest.values()))
+        verified = {pid: v for pid, v, error in results if error is None}
+        errors = {pid: error for pid, _, error in results if error is not None}
+
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            if verified:
+                await apply_transitions(
+                    db,
+                    {pid: v.status for pid, v in verified.items()},
+                    raw={pid: latest[pid].payload for pid in verified},
+                )
+
+                by_method: dict[str, list[int]] = {}
+                for pid, v in verified.items():
+                    by_method.setdefault(v.method, []).append(latest[pid].id)
+                for method, ids in by_method.items():
+                    await db.execute(
+                        update(WebhookEvent)
+                        .where(WebhookEvent.id.in_(ids))
+                        .values(status="done", verification=method, processed_at=now, error=None, next_attempt_at=None)
+                        .execution_options(synchronize_session=False)
+                    )
+
+            if duplicate_ids:
+                await db.execute(
+                    update(WebhookEvent)
+                    .where(WebhookEvent.id.in_(duplicate_ids))
+                    .values(status="duplicate", processed_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+
+            for pid, error in errors.items():
+                exhausted = latest[pid].attempts >= self.max_attempts
+                await db.execute(
+                    update(WebhookEvent)
+                    .where(WebhookEvent.id == latest[pid].id)
+                    .values(
+                        status="failed" if exhausted else "pending",
+                        processed_at=now if exhausted else None,
+                        next_attempt_at=None if exhausted else now + self._retry_delay(latest[pid].attempts),
+                        error=error[:1000],
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+
+            await db.commit()
+
+        for pid in verified:
+            inbox_lag.observe((now - latest[pid].received_at).total_seconds())
+        inbox_processed.inc(len(verified))
+        inbox_duplicates.inc(len(duplicate_ids))
+        for pid in errors:
+            if latest[pid].attempts >= self.max_attempts:
+                inbox_failed.inc()
+                log.error("webhook event %s for payment %s dropped: %s", latest[pid].id, pid, errors[pid])
+            else:
+                inbox_retries.inc()
+        return len(verified) + len(duplicate_ids)
+
+
+inbox_worker = WebhookInboxWorker(
+    workers=settings.webhook_workers,
+    batch_size=settings.webhook_batch_size,
+    verify_concurrency=settings.webhook_verify_concurrency,
+    poll_seconds=settings.webhook_poll_seconds,
+    claim_timeout_seconds=settings.webhook_claim_timeout_seconds,
+    max_attempts=settings.webhook_max_attempts,
+    backoff_seconds=settings.webhook_backoff_seconds,
+    backoff_max_seconds=settings.webhook_backoff_max_seconds,
+)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import ipaddress
+from dataclasses import dataclass
+
+from fastapi import Request
+
+from app.core.config import settings
+from app.services.yookassa_client import get_yookassa_client
+
+REFETCH = "refetch"
+IP_ALLOWLIST = "ip_allowlist"
+TERMINAL_REFETCH = "terminal_refetch"
+
+# как именно подтверждён статус конкретного события (пишется в webhook_events.verification)
+METHOD_REFETCH = "refetch"
+METHOD_SOURCE_IP = "source_ip"
+METHOD_PUSHED = "pushed_non_terminal"
+
+TERMINAL_STATUSES = frozenset({"succeeded", "canceled"})
+
+_allowed_networks = tuple(
+    ipaddress.ip_network(part.strip(), strict=False) for part in settings.yookassa_webhook_ips.split(",") if part.strip()
+)
+
+
+@dataclass(frozen=True)
+class Verification:
+    method: str
+    status: str | None
+
+
+def source_ip(request: Request) -> str | None:
+    hops = settings.webhook_proxy_hops
+    if hops > 0:
+        # каждый доверенный прокси дописывает адрес справа: клиент — hops-й с конца
+        forwarded = [p.strip() for p in request.headers.get("x-forwarded-for", "").split(",") if p.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.client.host if request.client else None
+
+
+def is_allowed_source(ip: str | None) -> bool:
+    if not ip:
+        return False
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in _allowed_networks)
+
+
+async def verify_event(payload: dict, ip: str | None, mode: str | None = None) -> Verification:
+    mode = mode or settings.webhook_verify_mode
+    obj = payload.get("object") or {}
+    pushed_status = obj.get("status")
+
+    if mode == IP_ALLOWLIST and is_allowed_source(ip):
+        return Verification(METHOD_SOURCE_IP, pushed_status)
+    if mode == TERMINAL_REFETCH and pushed_status and pushed_status not in TERMINAL_STATUSES:
+        return Verification(METHOD_PUSHED, pushed_status)
+
+    # по умолчанию и для непроверенного источника — подтверждаем статус запросом в ЮKassa
+    verified = await get_yookassa_client().get_payment(payment_id=obj["id"])
+    return Verification(METHOD_REFETCH, verified.get("status"))
@@ -1,16 +1,81 @@
 from __future__ import annotations
 
+import asyncio
+import random
+import time
 from dataclasses import dataclass
 from decimal import Decimal
 
 import httpx
 
+from app.core.config import settings
+from app.core.metrics import registry
+
+yookassa_request_seconds = registry.histogram_vec(
+    "yookassa_request_seconds", "Outbound YooKassa HTTP call latency, per attempt", ("op",)
+)
+yookassa_requests = registry.counter_vec("yookassa_requests_total", "Outbound YooKassa HTTP attempts by outcome", ("op", "outcome"))
+
+# На эти ответы можно безопасно повторить запрос: create_payment защищён Idempotence-Key, get_payment — чтение
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+# Провайдер недоступен: исчерпаны ретраи или открыт circuit breaker
+class YooKassaUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, *, threshold: int, reset_seconds: float) -> None:
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return False
+        # half-open: пропускаем один пробный запрос, остальные отбиваем до его результата
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._opened_at is not None or self._failures >= self.threshold:
+            self._opened_at = time.monotonic()
+
+    # Запрос завершился без результата. Пробный запрос считаем неудачным, иначе breaker остался бы
+    # half-open с занятым слотом пробы навсегда; обычный запрос счётчик ошибок не трогает.
+    def abort(self) -> None:
+        if self._probe_in_flight:
+            self.record_failure()
+
 
 @dataclass(frozen=True)
 class YooKassaClient:
     api_base: str
     shop_id: str
     secret_key: str
+    # None — старое поведение: новый AsyncClient на каждый вызов
+    http: httpx.AsyncClient | None = None
+    breaker: CircuitBreaker | None = None
+    retries: int = 0
+    retry_backoff: float = 0.2
 
     async def create_payment(self, *, amount_rub: int, return_url: str, description: str, idempotence_key: str, metadata: dict) -> dict:
         # ЮKassa ожидает value строкой с 2 знаками
@@ -25,22 +90,106 @@ class YooKassaClient:
         }
 
         headers = {"Idempotence-Key": idempotence_key}
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(
-                f"{self.api_base}/payments",
-                json=payload,
-                headers=headers,
-                auth=(self.shop_id, self.secret_key),  # Basic Auth
-            )
-            r.raise_for_status()
-            return r.json()
+        return await self._request("create_payment", "POST", "/payments", json=payload, headers=headers)
 
     async def get_payment(self, *, payment_id: str) -> dict:
+        return await self._request("get_payment", "GET", f"/payments/{payment_id}")
+
+    async def _request(self, op: str, method: str, path: str, **kwargs) -> dict:
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            raise YooKassaUnavailable("YooKassa circuit is open")
+
+        url = f"{self.api_base}{path}"
+        latency = yookassa_request_seconds.labels(op)
+        attempt = 0
+        recorded = False
+        try:
+            while True:
+                started_at = time.perf_counter()
+                try:
+                    r = await self._send(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    latency.observe(time.perf_counter() - started_at)
+                    yookassa_requests.labels(op, "transport_error").inc()
+                    error: Exception = e
+                else:
+                    latency.observe(time.perf_counter() - started_at)
+                    yookassa_requests.labels(op, f"{r.status_code // 100}xx").inc()
+                    if r.status_code not in _RETRY_STATUSES:
+                        # 4xx — провайдер жив, ошибка наша: breaker не трогаем, ретраи бессмысленны
+                        if breaker is not None:
+                            breaker.record_success()
+                        recorded = True
+                        r.raise_for_status()
+                        return r.json()
+                    error = httpx.HTTPStatusError(f"YooKassa responded {r.status_code}", request=r.request, response=r)
+
+                if attempt >= self.retries:
+                    if breaker is not None:
+                        breaker.record_failure()
+                    recorded = True
+                    raise YooKassaUnavailable(f"YooKassa {method} {path} failed after {attempt + 1} attempt(s)") from error
+
+                attempt += 1
+                # full jitter, чтобы ретраи разных воркеров не шли синхронной волной
+                await asyncio.sleep(random.uniform(0, self.retry_backoff * (2**attempt)))
+        finally:
+            # отмена или исключение не из httpx.TransportError — результата нет, но слот пробы надо освободить
+            if breaker is not None and not recorded:
+                breaker.abort()
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        auth = (self.shop_id, self.secret_key)  # Basic Auth
+        if self.http is not None:
+            return await self.http.request(method, url, auth=auth, **kwargs)
         async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.get(
-                f"{self.api_base}/payments/{payment_id}",
-                auth=(self.shop_id, self.secret_key),
-            )
-            r.raise_for_status()
-            return r.json()
+            return await client.request(method, url, auth=auth, **kwargs)
+
+
+_http: httpx.AsyncClient | None = None
+_breaker = CircuitBreaker(
+    threshold=settings.yookassa_breaker_threshold,
+    reset_seconds=settings.yookassa_breaker_reset_seconds,
+)
+
+
+def build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(
+            connect=settings.yookassa_connect_timeout,
+            read=settings.yookassa_read_timeout,
+            write=settings.yookassa_read_timeout,
+            pool=settings.yookassa_pool_timeout,
+        ),
+        limits=httpx.Limits(
+            max_connections=settings.yookassa_max_connections,
+            max_keepalive_connections=settings.yookassa_max_keepalive,
+            keepalive_expiry=settings.yookassa_keepalive_expiry,
+        ),
+    )
+
+
+async def open_http_client() -> None:
+    global _http
+    if _http is None:
+        _http = build_http_client()
+
+
+async def close_http_client() -> None:
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
+def get_yookassa_client() -> YooKassaClient:
+    return YooKassaClient(
+        api_base=settings.yookassa_api_base,
+        shop_id=settings.yookassa_shop_id or "",
+        secret_key=settings.yookassa_secret_key or "",
+        http=_http,
+        breaker=_breaker,
+        retries=settings.yookassa_retries,
+        retry_backoff=settings.yookassa_retry_backoff,
+    )
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.db.migrations import ensure_schema
+from app.db.session import engine
+import app.models  # noqa: F401  (важно: чтобы модели импортнулись)
+from app.services.generation_jobs import create_worker
+
+log = logging.getLogger("app.worker")
+
+
+# Отдельный процесс исполнителей очереди генерации: python -m app.worker [--concurrency N].
+# Масштабируется числом процессов; задачи между ними разводит FOR UPDATE SKIP LOCKED.
+async def main(concurrency: int | None) -> None:
+    schema_state = await ensure_schema(engine, settings.startup_schema_mode)
+    log.info("schema: %s", schema_state)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    worker = create_worker(concurrency)
+    await worker.start()
+    try:
+        await stop.wait()
+        log.info("generation worker %s: stopping, draining up to %.0fs", worker.worker_id, worker.drain_seconds)
+    finally:
+        await worker.stop()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generation job worker")
+    parser.add_argument("--concurrency", type=int, default=None, help="jobs per process (GENERATION_WORKER_CONCURRENCY)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(main(args.concurrency))
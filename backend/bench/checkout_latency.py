@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+# p50/p99 для POST /api/v1/checkout: новый httpx-клиент на вызов ("before") против общего пула ("after").
+#
+#   cd backend
+#   DATABASE_URL=postgresql://... JWT_SECRET=bench python -m bench.checkout_latency --requests 300 --concurrency 20
+#
+# Нужна локальная Postgres; ЮKassa подменяется мок-сервером из bench/mock_yookassa.py.
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from bench.common import configure_env, percentile, signup_and_login
+
+
+async def _run(label: str, *, requests: int, concurrency: int, plan_code: str) -> dict:
+    import httpx
+
+    from app.main import app
+
+    latencies: list[float] = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await signup_and_login(client)
+
+        async def one() -> None:
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/api/v1/checkout", json={"plan_code": plan_code})
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+                if r.status_code != 200:
+                    errors += 1
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - t_start
+
+    return {
+        "mode": label,
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+    }
+
+
+async def _main(args: argparse.Namespace) -> None:
+    from app.main import shutdown, startup
+    from app.services import yookassa_client
+
+    await startup()
+    try:
+        # before: как было — AsyncClient (и TCP/TLS-хендшейк) на каждый вызов
+        pooled = yookassa_client._http
+        yookassa_client._http = None
+        before = await _run("before", requests=args.requests, concurrency=args.concurrency, plan_code=args.plan)
+        yookassa_client._http = pooled
+
+        after = await _run("after", requests=args.requests, concurrency=args.concurrency, plan_code=args.plan)
+    finally:
+        await shutdown()
+
+    for row in (before, after):
+        print(
+            f"{row['mode']:>6}: p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms "
+            f"mean={row['mean_ms']:.2f}ms rps={row['rps']} errors={row['errors']}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Checkout latency: per-call vs pooled YooKassa client")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--plan", default="test_1")
+    parser.add_argument("--mock-port", type=int, default=18080)
+    parser.add_argument("--mock-latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    from bench.mock_yookassa import MockServer, create_mock_app
+
+    with MockServer(create_mock_app(latency_ms=args.mock_latency_ms), port=args.mock_port) as mock:
+        configure_env(mock.base_url)
+        asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
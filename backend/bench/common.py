@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import os
+import uuid
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[idx]
+
+
+def configure_env(mock_base_url: str) -> None:
+    # settings читаются при импорте app.*, поэтому env выставляем до него
+    os.environ["YOOKASSA_API_BASE"] = mock_base_url
+    os.environ.setdefault("YOOKASSA_SHOP_ID", "bench-shop")
+    os.environ.setdefault("YOOKASSA_SECRET_KEY", "bench-secret")
+    os.environ.setdefault("YOOKASSA_RETURN_URL", "http://bench/pay/return")
+    os.environ.setdefault("COST_IMAGE_RUB", "10")
+    os.environ.setdefault("COST_VIDEO_RUB", "40")
+    os.environ.setdefault("COST_TRAINING_RUB", "150")
+    os.environ.setdefault("ENV", "dev")
+
+
+async def signup_and_login(client, password: str = "bench-password-1") -> str:
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    r = await client.post(
+        "/api/v1/auth/signup",
+        json={
+            "email": email,
+            "password": password,
+            "consent_rights": True,
+            "consent_face": True,
+            "consent_no_third_party": True,
+            "consent_storage": True,
+            "consent_terms": True,
+        },
+    )
+    r.raise_for_status()
+    token = r.json()["dev_verify_link"].split("token=", 1)[1]
+    (await client.post("/api/v1/auth/verify-email", params={"token": token})).raise_for_status()
+    (await client.post("/api/v1/auth/login", json={"email": email, "password": password})).raise_for_status()
+    return email
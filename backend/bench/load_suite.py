@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+# Нагрузочный прогон всего пользовательского пути при заданной интенсивности (open loop):
+# signup -> verify-email -> login -> /plans -> /checkout -> webhook, плюс просмотр каталогов.
+# Итог — JSON (пропускная способность, p50/p95/p99 по эндпоинтам, насыщение пула БД), чтобы
+# сравнивать прогоны между собой.
+#
+#   cd backend
+#   DATABASE_URL=postgresql://... JWT_SECRET=bench python -m bench.load_suite --rps 50 --seconds 60 --out run.json
+#   ... --mix browse=60,login=15,signup=10,checkout=15 --mock-latency-ms 120 --mock-error-rate 0.02
+#
+# Нужна локальная Postgres; ЮKassa подменяется мок-сервером из bench/mock_yookassa.py.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from bench.common import configure_env, percentile
+
+PASSWORD = "bench-password-1"
+DEFAULT_MIX = "browse=60,login=15,signup=10,checkout=15"
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.active = False
+
+    async def call(self, client, name: str, method: str, url: str, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            r = await client.request(method, url, **kwargs)
+        except Exception:
+            if self.active:
+                self.latencies[name].append((time.perf_counter() - t0) * 1000.0)
+                self.errors[name] += 1
+            raise
+        if self.active:
+            self.latencies[name].append((time.perf_counter() - t0) * 1000.0)
+            self.statuses[name][r.status_code] += 1
+            if r.status_code >= 400:
+                self.errors[name] += 1
+        return r
+
+
+class LoadSuite:
+    def __init__(self, app, mock_base_url: str, args: argparse.Namespace) -> None:
+        import httpx
+
+        self.app = app
+        self.args = args
+        self.rec = Recorder()
+        self.rng = random.Random(args.seed)
+        self.users: list = []
+        self.mock = httpx.AsyncClient(base_url=mock_base_url)
+        self.hooks = self._client()
+        self.journeys: dict[str, dict[str, int]] = defaultdict(lambda: {"started": 0, "completed": 0, "failed": 0})
+
+    def _client(self):
+        import httpx
+
+        # у каждого пользователя свой клиент: cookie авторизации не должны смешиваться
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://bench", timeout=60.0)
+
+    # --- сценарии ---
+
+    async def signup(self) -> None:
+        client = self._client()
+        email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        r = await self.rec.call(
+            client,
+            "POST /api/v1/auth/signup",
+            "POST",
+            "/api/v1/auth/signup",
+            json={
+                "email": email,
+                "password": PASSWORD,
+                "consent_rights": True,
+                "consent_face": True,
+                "consent_no_third_party": True,
+                "consent_storage": True,
+                "consent_terms": True,
+            },
+        )
+        r.raise_for_status()
+        token = r.json()["dev_verify_link"].split("token=", 1)[1]
+        r = await self.rec.call(client, "POST /api/v1/auth/verify-email", "POST", "/api/v1/auth/verify-email", params={"token": token})
+        r.raise_for_status()
+        r = await self.rec.call(client, "POST /api/v1/auth/login", "POST", "/api/v1/auth/login", json={"email": email, "password": PASSWORD})
+        r.raise_for_status()
+        self.users.append((email, client))
+
+    async def login(self) -> None:
+        if not self.users:
+            return await self.signup()
+        email, client = self.rng.choice(self.users)
+        r = await self.rec.call(client, "POST /api/v1/auth/login", "POST", "/api/v1/auth/login", json={"email": email, "password": PASSWORD})
+        r.raise_for_status()
+
+    async def browse(self) -> None:
+        client = self.hooks
+        (await self.rec.call(client, "GET /api/v1/plans", "GET", "/api/v1/plans")).raise_for_status()
+        (await self.rec.call(client, "GET /api/v1/styles", "GET", "/api/v1/styles")).raise_for_status()
+
+    async def checkout(self) -> None:
+        if not self.users:
+            return await self.signup()
+        _, client = self.rng.choice(self.users)
+        r = await self.rec.call(client, "GET /api/v1/plans", "GET", "/api/v1/plans")
+        r.raise_for_status()
+        plan_code = self.rng.choice(r.json())["code"]
+        r = await self.rec.call(client, "POST /api/v1/checkout", "POST", "/api/v1/checkout", json={"plan_code": plan_code})
+        r.raise_for_status()
+        # 202 — платёж ещё создаётся диспетчером outbox, опрашиваем
+        while r.status_code == 202:
+            await asyncio.sleep(self.args.poll_ms / 1000.0)
+            r = await self.rec.call(client, "GET /api/v1/checkout/{order_id}", "GET", r.json()["poll_url"])
+            r.raise_for_status()
+        payment_id = r.json()["payment_id"]
+
+        # пользователь «оплатил»: фейк меняет статус, ЮKassa присылает уведомление
+        status = "succeeded" if self.rng.random() < self.args.pay_success_rate else "canceled"
+        (await self.mock.post(f"/_mock/payments/{payment_id}/{status}")).raise_for_status()
+        await asyncio.sleep(self.args.webhook_delay_ms / 1000.0)
+        body = {"type": "notification", "event": f"payment.{status}", "object": {"id": payment_id, "status": status}}
+        r = await self.rec.call(self.hooks, "POST /api/v1/webhooks/yookassa", "POST", "/api/v1/webhooks/yookassa", json=body)
+        r.raise_for_status()
+
+    # --- драйвер ---
+
+    async def _journey(self, name: str) -> None:
+        stats = self.journeys[name]
+        stats["started"] += 1
+        try:
+            await getattr(self, name)()
+        except Exception:
+            stats["failed"] += 1
+        else:
+            stats["completed"] += 1
+
+    async def prepare(self, users: int) -> None:
+        for _ in range(users):
+            await self.signup()
+        self.journeys.clear()
+
+    async def run(self, mix: dict[str, float], *, rps: float, seconds: float, max_in_flight: int) -> dict:
+        names = list(mix)
+        weights = [mix[n] for n in names]
+        tasks: set[asyncio.Task] = set()
+        dropped = 0
+        max_lag = 0.0
+        interval = 1.0 / rps
+
+        self.rec.active = True
+        started_at = time.perf_counter()
+        next_at = started_at
+        deadline = started_at + seconds
+        while next_at < deadline:
+            now = time.perf_counter()
+            if next_at > now:
+                await asyncio.sleep(next_at - now)
+            else:
+                max_lag = max(max_lag, now - next_at)
+            next_at += interval
+            if len(tasks) >= max_in_flight:
+                # система не успевает: не копим бесконечную очередь, а фиксируем потерю
+                dropped += 1
+                continue
+            task = asyncio.create_task(self._journey(self.rng.choices(names, weights)[0]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started_at
+        self.rec.active = False
+        return {"elapsed_s": round(elapsed, 3), "dropped_arrivals": dropped, "max_schedule_lag_ms": round(max_lag * 1000, 2)}
+
+    async def close(self) -> None:
+        for _, client in self.users:
+            await client.aclose()
+        await self.hooks.aclose()
+        await self.mock.aclose()
+
+
+class PoolSampler:
+    def __init__(self, engine, interval: float) -> None:
+        self.engine = engine
+        self.interval = interval
+        self.samples: list[dict] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        from app.db.pool import pool_status
+
+        while True:
+            self.samples.append(pool_status(self.engine))
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def summary(self) -> dict:
+        from app.core.metrics import registry
+
+        samples = [s for s in self.samples if "size" in s]
+        if not samples:
+            return {}
+        capacity = samples[0]["size"] + samples[0]["max_overflow"]
+        checked_out = [s["checked_out"] for s in samples]
+        return {
+            "size": samples[0]["size"],
+            "max_overflow": samples[0]["max_overflow"],
+            "max_checked_out": max(checked_out),
+            "mean_checked_out": round(sum(checked_out) / len(checked_out), 2),
+            "saturated_fraction": round(sum(1 for n in checked_out if n >= capacity) / len(checked_out), 4),
+            "checkout_wait": registry.snapshot("db_pool_checkout_wait_seconds").get("db_pool_checkout_wait_seconds"),
+            "timeouts": registry.snapshot("db_pool_timeouts_total").get("db_pool_timeouts_total"),
+        }
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix: dict[str, float] = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("browse", "login", "signup", "checkout"):
+            raise argparse.ArgumentTypeError(f"unknown journey: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _endpoint_report(rec: Recorder, elapsed: float) -> dict:
+    report = {}
+    for name in sorted(rec.latencies):
+        values = rec.latencies[name]
+        report[name] = {
+            "count": len(values),
+            "errors": rec.errors[name],
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(max(values), 2),
+            "statuses": {str(k): v for k, v in sorted(rec.statuses[name].items())},
+        }
+    return report
+
+
+async def _main(args: argparse.Namespace, mock_base_url: str) -> dict:
+    from app.db.session import engine
+    from app.main import app, shutdown, startup
+
+    await startup()
+    suite = LoadSuite(app, mock_base_url, args)
+    sampler = PoolSampler(engine, args.pool_sample_ms / 1000.0)
+    try:
+        await suite.prepare(args.users)
+        sampler.start()
+        run = await suite.run(args.mix, rps=args.rps, seconds=args.seconds, max_in_flight=args.max_in_flight)
+        await sampler.stop()
+    finally:
+        await suite.close()
+        await shutdown()
+
+    endpoints = _endpoint_report(suite.rec, run["elapsed_s"])
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "rps": args.rps,
+            "seconds": args.seconds,
+            "mix": args.mix,
+            "users": args.users,
+            "max_in_flight": args.max_in_flight,
+            "mock_latency_ms": args.mock_latency_ms,
+            "mock_error_rate": args.mock_error_rate,
+            "seed": args.seed,
+        },
+        "run": run,
+        "totals": {
+            "requests": total,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "rps": round(total / run["elapsed_s"], 2),
+        },
+        "journeys": dict(suite.journeys),
+        "endpoints": endpoints,
+        "db_pool": sampler.summary(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end load test against a mock YooKassa")
+    parser.add_argument("--rps", type=float, default=20.0, help="journeys started per second")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--users", type=int, default=20, help="users created before the measured run")
+    parser.add_argument("--max-in-flight", type=int, default=500)
+    parser.add_argument("--pay-success-rate", type=float, default=0.9)
+    parser.add_argument("--poll-ms", type=float, default=250.0, help="checkout poll interval after a 202")
+    parser.add_argument("--webhook-delay-ms", type=float, default=50.0)
+    parser.add_argument("--mock-port", type=int, default=18080)
+    parser.add_argument("--mock-latency-ms", type=float, default=80.0)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--pool-sample-ms", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    from bench.mock_yookassa import MockServer, create_mock_app
+
+    with MockServer(create_mock_app(latency_ms=args.mock_latency_ms, error_rate=args.mock_error_rate), port=args.mock_port) as mock:
+        configure_env(mock.base_url)
+        result = asyncio.run(_main(args, mock.base_url))
+
+    body = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(body + "\n")
+    else:
+        print(body)
+
+
+if __name__ == "__main__":
+    main()
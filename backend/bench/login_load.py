@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+# p99 для /health и /api/v1/styles, пока параллельно идут логины (Argon2 verify).
+#
+#   cd backend
+#   DATABASE_URL=postgresql://... JWT_SECRET=bench python -m bench.login_load --executor thread
+#   DATABASE_URL=postgresql://... JWT_SECRET=bench python -m bench.login_load --executor inline   # как было
+#
+# Нужна локальная Postgres.
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from bench.common import percentile
+
+PASSWORD = "bench-password-1"
+
+
+async def _create_users(client, count: int) -> list[str]:
+    emails: list[str] = []
+    for _ in range(count):
+        email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        r = await client.post(
+            "/api/v1/auth/signup",
+            json={
+                "email": email,
+                "password": PASSWORD,
+                "consent_rights": True,
+                "consent_face": True,
+                "consent_no_third_party": True,
+                "consent_storage": True,
+                "consent_terms": True,
+            },
+        )
+        r.raise_for_status()
+        token = r.json()["dev_verify_link"].split("token=", 1)[1]
+        (await client.post("/api/v1/auth/verify-email", params={"token": token})).raise_for_status()
+        emails.append(email)
+    return emails
+
+
+async def _probe(client, path: str, stop: asyncio.Event, interval: float) -> list[float]:
+    latencies: list[float] = []
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await client.get(path)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def _phase(client, emails: list[str], *, seconds: float, login_concurrency: int) -> dict:
+    import httpx
+
+    from app.main import app
+
+    stop = asyncio.Event()
+    logins = 0
+
+    async def login_loop(i: int) -> None:
+        nonlocal logins
+        # отдельный клиент — чтобы cookie логинов не мешали пробам
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as c:
+            while not stop.is_set():
+                await c.post("/api/v1/auth/login", json={"email": emails[(logins + i) % len(emails)], "password": PASSWORD})
+                logins += 1
+
+    probes = [
+        asyncio.create_task(_probe(client, "/health", stop, 0.01)),
+        asyncio.create_task(_probe(client, "/api/v1/styles", stop, 0.01)),
+    ]
+    loaders = [asyncio.create_task(login_loop(i)) for i in range(login_concurrency)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    health, styles = await asyncio.gather(*probes)
+    await asyncio.gather(*loaders)
+
+    return {
+        "logins_per_s": round(logins / seconds, 1),
+        "health_p50_ms": round(percentile(health, 50), 2),
+        "health_p99_ms": round(percentile(health, 99), 2),
+        "styles_p50_ms": round(percentile(styles, 50), 2),
+        "styles_p99_ms": round(percentile(styles, 99), 2),
+    }
+
+
+async def _main(args: argparse.Namespace) -> None:
+    import httpx
+
+    from app.core.config import settings
+    from app.main import app, shutdown, startup
+
+    settings.password_hash_executor = args.executor
+    await startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            emails = await _create_users(client, args.users)
+            idle = await _phase(client, emails, seconds=args.seconds, login_concurrency=0)
+            loaded = await _phase(client, emails, seconds=args.seconds, login_concurrency=args.login_concurrency)
+    finally:
+        await shutdown()
+
+    print(f"executor={args.executor}")
+    for label, row in (("idle", idle), ("logins", loaded)):
+        print(
+            f"{label:>7}: logins/s={row['logins_per_s']} "
+            f"/health p50={row['health_p50_ms']:.2f}ms p99={row['health_p99_ms']:.2f}ms "
+            f"/styles p50={row['styles_p50_ms']:.2f}ms p99={row['styles_p99_ms']:.2f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Endpoint latency under concurrent logins")
+    parser.add_argument("--executor", choices=("thread", "process", "inline"), default="thread")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--login-concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
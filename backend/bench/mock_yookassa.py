@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException, Request
+
+# Фейковая ЮKassa для бенчмарков: /payments create/get с семантикой Idempotence-Key,
+# настраиваемой задержкой и долей 5xx.
+
+
+def create_mock_app(*, latency_ms: float = 50.0, error_rate: float = 0.0) -> FastAPI:
+    app = FastAPI()
+    payments: dict[str, dict] = {}
+    by_key: dict[str, str] = {}
+
+    async def _delay() -> None:
+        if latency_ms > 0:
+            await asyncio.sleep(latency_ms / 1000.0)
+        if error_rate > 0 and random.random() < error_rate:
+            raise HTTPException(status_code=503, detail="mock outage")
+
+    @app.post("/payments")
+    async def create_payment(request: Request, idempotence_key: str = Header(alias="Idempotence-Key")) -> dict:
+        await _delay()
+        if idempotence_key in by_key:
+            return payments[by_key[idempotence_key]]
+        body = await request.json()
+        pid = str(uuid.uuid4())
+        payments[pid] = {
+            "id": pid,
+            "status": "pending",
+            "amount": body.get("amount"),
+            "metadata": body.get("metadata") or {},
+            "confirmation": {"type": "redirect", "confirmation_url": f"https://mock.yookassa/confirm/{pid}"},
+        }
+        by_key[idempotence_key] = pid
+        return payments[pid]
+
+    @app.get("/payments/{payment_id}")
+    async def get_payment(payment_id: str) -> dict:
+        await _delay()
+        p = payments.get(payment_id)
+        if not p:
+            raise HTTPException(status_code=404, detail="not found")
+        return p
+
+    # для сценариев с вебхуками: переводит платёж в финальный статус
+    @app.post("/_mock/payments/{payment_id}/{status}")
+    async def set_status(payment_id: str, status: str) -> dict:
+        p = payments.get(payment_id)
+        if not p:
+            raise HTTPException(status_code=404, detail="not found")
+        p["status"] = status
+        return p
+
+    return app
+
+
+class MockServer:
+    def __init__(self, app: FastAPI, *, port: int) -> None:
+        self.port = port
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "MockServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+# Пропускная способность POST /api/v1/webhooks/yookassa в разных режимах проверки (WEBHOOK_VERIFY_MODE).
+#
+#   cd backend
+#   DATABASE_URL=postgresql://... JWT_SECRET=bench python -m bench.webhook_throughput --events 1000 --concurrency 50
+#
+# Нужна локальная Postgres; ЮKassa подменяется мок-сервером из bench/mock_yookassa.py.
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+
+from bench.common import configure_env, percentile, signup_and_login
+
+MODES = ("refetch", "terminal_refetch", "ip_allowlist")
+# адрес из диапазона ЮKassa по умолчанию (YOOKASSA_WEBHOOK_IPS)
+PROVIDER_IP = "185.71.76.10"
+
+
+async def _prepare_payments(client, count: int) -> list[str]:
+    ids: list[str] = []
+    for _ in range(count):
+        r = await client.post("/api/v1/checkout", json={"plan_code": "test_1"})
+        r.raise_for_status()
+        ids.append(r.json()["payment_id"])
+    return ids
+
+
+async def _run(client, mode: str, payment_ids: list[str], *, events: int, concurrency: int, terminal_share: float) -> dict:
+    from app.core.config import settings
+
+    settings.webhook_verify_mode = mode
+    settings.webhook_proxy_hops = 1
+
+    rng = random.Random(42)
+    latencies: list[float] = []
+    methods: Counter = Counter()
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        nonlocal errors
+        pid = rng.choice(payment_ids)
+        if rng.random() < terminal_share:
+            event, status = "payment.succeeded", "succeeded"
+        else:
+            event, status = "payment.waiting_for_capture", "waiting_for_capture"
+        body = {"type": "notification", "event": event, "object": {"id": pid, "status": status}}
+        async with sem:
+            t0 = time.perf_counter()
+            r = await client.post("/api/v1/webhooks/yookassa", json=body, headers={"X-Forwarded-For": PROVIDER_IP})
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+        if r.status_code != 200:
+            errors += 1
+        else:
+            methods[r.json().get("verification")] += 1
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(events)))
+    elapsed = time.perf_counter() - t_start
+
+    return {
+        "mode": mode,
+        "events": events,
+        "errors": errors,
+        "events_per_s": round(events / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "verification": dict(methods),
+    }
+
+
+async def _main(args: argparse.Namespace) -> None:
+    import httpx
+
+    from app.core.config import settings
+    from app.main import app, shutdown, startup
+
+    settings.webhook_mode = "sync"
+    await startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            await signup_and_login(client)
+            payment_ids = await _prepare_payments(client, args.payments)
+            rows = [
+                await _run(
+                    client,
+                    mode,
+                    payment_ids,
+                    events=args.events,
+                    concurrency=args.concurrency,
+                    terminal_share=args.terminal_share,
+                )
+                for mode in MODES
+            ]
+    finally:
+        await shutdown()
+
+    for row in rows:
+        print(
+            f"{row['mode']:>16}: {row['events_per_s']} ev/s p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms "
+            f"errors={row['errors']} verification={row['verification']}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Webhook throughput per verification mode")
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--payments", type=int, default=50)
+    parser.add_argument("--terminal-share", type=float, default=0.3)
+    parser.add_argument("--mock-port", type=int, default=18080)
+    parser.add_argument("--mock-latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    from bench.mock_yookassa import MockServer, create_mock_app
+
+    with MockServer(create_mock_app(latency_ms=args.mock_latency_ms), port=args.mock_port) as mock:
+        configure_env(mock.base_url)
+        asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
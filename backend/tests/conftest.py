@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+# Поведенческие тесты на живом Postgres: TEST_DATABASE_URL — отдельная одноразовая база, перед каждым тестом
+# все таблицы очищаются. Без переменной тесты пропускаются. Запуск из backend/:
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/app_test python -m pytest -q
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+# settings читаются при импорте app.*, поэтому env выставляем до него
+_TMP = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql://localhost/unused"
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ["UPLOAD_DIR"] = os.path.join(_TMP, "uploads")
+os.environ["IDENTITY_CACHE_DIR"] = os.path.join(_TMP, "identities")
+
+from app.db.base import Base  # noqa: E402  (модели импортируются через base, иначе круговой импорт)
+from app.db.migrations import ensure_schema  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.main import DEFAULT_PLANS  # noqa: E402
+from app.models.order import Order  # noqa: E402
+from app.models.payment import Payment  # noqa: E402
+from app.models.plan import Plan  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.payment_events import ensure_partitions  # noqa: E402
+
+
+# Один цикл на сессию: пул asyncpg привязан к циклу, в котором открыты соединения
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+    shutil.rmtree(_TMP, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def run(loop):
+    return loop.run_until_complete
+
+
+@pytest.fixture(scope="session")
+def schema(run):
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    async def setup() -> None:
+        await ensure_schema(engine, "create_all")
+        async with engine.begin() as conn:
+            await ensure_partitions(conn, 1)
+
+    run(setup())
+
+
+@pytest.fixture(autouse=True)
+def clean(run, schema):
+    tables = ", ".join(t.name for t in Base.metadata.sorted_tables)
+
+    async def truncate() -> None:
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+            await conn.execute(Plan.__table__.insert(), [{"id": uuid.uuid4(), **p} for p in DEFAULT_PLANS])
+
+    run(truncate())
+
+
+async def create_user() -> uuid.UUID:
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"test-{uuid.uuid4().hex[:12]}@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+# Заказ по плану с платежом в статусе payment_status; status — статус заказа
+async def create_order(
+    user_id: uuid.UUID, plan_code: str, *, status: str = "payment_pending", payment_status: str = "pending"
+) -> tuple[uuid.UUID, str]:
+    async with AsyncSessionLocal() as db:
+        plan = (await db.execute(Plan.__table__.select().where(Plan.code == plan_code))).one()
+        order = Order(user_id=user_id, plan_id=plan.id, status=status, price_rub=100, cost_estimate_rub=10)
+        db.add(order)
+        await db.flush()
+        payment_id = f"pay-{uuid.uuid4().hex[:16]}"
+        db.add(
+            Payment(
+                order_id=order.id,
+                provider_payment_id=payment_id,
+                status=payment_status,
+                amount_rub=100,
+                paid_at=datetime.now(timezone.utc) if payment_status == "succeeded" else None,
+            )
+        )
+        await db.commit()
+        return order.id, payment_id
+
+
+@pytest.fixture
+def user(run) -> uuid.UUID:
+    return run(create_user())
+
+
+@pytest.fixture
+def make_order():
+    return create_order
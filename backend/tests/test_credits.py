@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app.db.migrations import run_migrations
+from app.db.session import AsyncSessionLocal, engine
+from app.models.credit_ledger import CreditLedgerEntry
+from app.models.generation_job import GenerationJob
+from app.services.credits import InsufficientCredits, debit_for_job, get_balance, grant_for_orders, refund_for_jobs
+from app.services.payment_state import apply_transition
+
+
+# Оплаченный заказ test_1 (1 изображение, 1 видео): кредиты начислены, задачи в очереди
+async def _paid_order(make_order, user):
+    order_id, payment_id = await make_order(user, "test_1")
+    async with AsyncSessionLocal() as db:
+        await apply_transition(db, payment_id, "succeeded")
+        await db.commit()
+        q = await db.execute(select(GenerationJob.id, GenerationJob.kind).where(GenerationJob.order_id == order_id))
+        return order_id, dict((kind, job_id) for job_id, kind in q.all())
+
+
+async def _debit(user, order_id, job_id: int, kind: str = "image", *, hold: float = 0.0) -> bool:
+    async with AsyncSessionLocal() as db:
+        try:
+            await debit_for_job(db, job_id=job_id, user_id=user, order_id=order_id, kind=kind)
+        except InsufficientCredits:
+            await db.commit()
+            return False
+        await asyncio.sleep(hold)
+        await db.commit()
+        return True
+
+
+async def _balance(user) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await get_balance(db, user)
+
+
+async def _ledger(user) -> list[tuple[str, int]]:
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(
+            select(CreditLedgerEntry.reason, func.sum(CreditLedgerEntry.delta))
+            .where(CreditLedgerEntry.user_id == user)
+            .group_by(CreditLedgerEntry.reason)
+            .order_by(CreditLedgerEntry.reason)
+        )
+        return [tuple(r) for r in q.all()]
+
+
+def test_grant_is_idempotent(run, user, make_order):
+    order_id, _ = run(_paid_order(make_order, user))
+
+    async def regrant() -> None:
+        async with AsyncSessionLocal() as db:
+            await grant_for_orders(db, [order_id])
+            await db.commit()
+
+    run(regrant())
+    assert run(_balance(user)) == {"images": 1, "videos": 1}
+
+
+def test_debit_of_the_same_job_is_charged_once(run, user, make_order):
+    order_id, jobs = run(_paid_order(make_order, user))
+
+    assert run(_debit(user, order_id, jobs["image"]))
+    # перезапуск той же задачи: запись журнала уже есть, баланс не трогаем
+    assert run(_debit(user, order_id, jobs["image"]))
+
+    assert run(_balance(user)) == {"images": 0, "videos": 1}
+    assert run(_ledger(user)) == [("debit", -1), ("grant", 2)]
+
+
+def test_debit_without_credit_is_refused_and_leaves_no_entry(run, user, make_order):
+    order_id, jobs = run(_paid_order(make_order, user))
+    run(_debit(user, order_id, jobs["image"]))
+
+    # другая задача того же вида: кредит уже потрачен
+    assert not run(_debit(user, order_id, jobs["video"], kind="image"))
+
+    assert run(_balance(user)) == {"images": 0, "videos": 1}
+    assert run(_ledger(user)) == [("debit", -1), ("grant", 2)]
+
+
+def test_concurrent_debits_do_not_overdraw(run, user, make_order):
+    order_id, jobs = run(_paid_order(make_order, user))
+
+    async def race() -> list[bool]:
+        # первый держит строку баланса до коммита; второй ждёт её и видит уже списанный кредит
+        return await asyncio.gather(
+            _debit(user, order_id, jobs["image"], hold=0.3),
+            _debit(user, order_id, jobs["video"], kind="image"),
+        )
+
+    assert sorted(run(race())) == [False, True]
+    assert run(_balance(user)) == {"images": 0, "videos": 1}
+
+
+def test_refund_is_idempotent(run, user, make_order):
+    order_id, jobs = run(_paid_order(make_order, user))
+    run(_debit(user, order_id, jobs["image"]))
+
+    async def refund() -> None:
+        async with AsyncSessionLocal() as db:
+            await refund_for_jobs(db, [jobs["image"]])
+            await db.commit()
+
+    run(refund())
+    run(refund())
+
+    assert run(_balance(user)) == {"images": 1, "videos": 1}
+    assert run(_ledger(user)) == [("debit", -1), ("grant", 2), ("refund", 1)]
+
+
+def test_refund_without_debit_returns_nothing(run, user, make_order):
+    order_id, jobs = run(_paid_order(make_order, user))
+
+    async def refund() -> None:
+        async with AsyncSessionLocal() as db:
+            await refund_for_jobs(db, [jobs["video"]])
+            await db.commit()
+
+    run(refund())
+
+    assert run(_balance(user)) == {"images": 1, "videos": 1}
+    assert run(_ledger(user)) == [("grant", 2)]
+
+
+@pytest.mark.parametrize("kind", ["image", "video"])
+def test_debit_touches_only_its_kind(run, user, make_order, kind):
+    order_id, jobs = run(_paid_order(make_order, user))
+
+    assert run(_debit(user, order_id, jobs[kind], kind=kind))
+
+    assert run(_balance(user)) == {"images": 0 if kind == "image" else 1, "videos": 0 if kind == "video" else 1}
+
+
+def test_backfill_runs_once_and_charges_only_finished_renders(run, user, make_order):
+    # заказ оплачен до появления журнала: кредитов нет, изображение готово, видео воркер уже взял, но не списал
+    order_id, _ = run(make_order(user, "test_1", status="in_progress", payment_status="succeeded"))
+
+    async def legacy_jobs() -> int:
+        async with AsyncSessionLocal() as db:
+            db.add(GenerationJob(order_id=order_id, user_id=user, kind="image", seq=1, status="done"))
+            video = GenerationJob(order_id=order_id, user_id=user, kind="video", seq=1, status="running")
+            db.add(video)
+            await db.commit()
+            return video.id
+
+    async def migrate() -> None:
+        async with engine.begin() as conn:
+            await run_migrations(conn)
+
+    video_id = run(legacy_jobs())
+    run(migrate())
+
+    assert run(_balance(user)) == {"images": 0, "videos": 1}
+    assert run(_ledger(user)) == [("debit", -1), ("grant", 2)]
+
+    # воркер списывает видео сам; повторный прогон миграций журнал и баланс не трогает
+    assert run(_debit(user, order_id, video_id, kind="video"))
+    run(migrate())
+
+    assert run(_balance(user)) == {"images": 0, "videos": 0}
+    assert run(_ledger(user)) == [("debit", -2), ("grant", 2)]
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+
+from app.db.session import AsyncSessionLocal
+from app.models.generation_job import GenerationJob
+from app.models.order import Order
+from app.services.credits import get_balance
+from app.services.generation_jobs import GenerationWorker, register_handler
+from app.services.payment_state import apply_transition
+
+
+async def _noop_handler(job) -> dict:
+    return {"kind": job.kind, "seq": job.seq}
+
+
+register_handler("test-noop", _noop_handler)
+
+
+def _worker(**kwargs) -> GenerationWorker:
+    params = dict(
+        concurrency=10,
+        poll_seconds=0.1,
+        lease_seconds=60,
+        heartbeat_seconds=10,
+        job_timeout_seconds=10,
+        drain_seconds=1,
+        backoff_seconds=0,
+        backoff_max_seconds=0,
+        handler="test-noop",
+    )
+    params.update(kwargs)
+    return GenerationWorker(**params)
+
+
+async def _pay(make_order, user, plan_code: str):
+    order_id, payment_id = await make_order(user, plan_code)
+    async with AsyncSessionLocal() as db:
+        await apply_transition(db, payment_id, "succeeded")
+        await db.commit()
+    return order_id
+
+
+async def _jobs(order_id) -> list:
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(select(GenerationJob).where(GenerationJob.order_id == order_id).order_by(GenerationJob.id))
+        return list(q.scalars().all())
+
+
+async def _set(job_ids: list[int], **values) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(GenerationJob).where(GenerationJob.id.in_(job_ids)).values(**values))
+        await db.commit()
+
+
+async def _order_status(order_id) -> str:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(Order.status).where(Order.id == order_id))).scalar_one()
+
+
+def test_claim_leases_each_job_to_one_worker(run, user, make_order):
+    order_id = run(_pay(make_order, user, "test_1"))
+    a, b = _worker(), _worker()
+
+    claimed = run(a._claim(10))
+    assert sorted(j.kind for j in claimed) == ["image", "video"]
+    assert run(b._claim(10)) == []
+
+    jobs = run(_jobs(order_id))
+    assert {j.status for j in jobs} == {"running"}
+    assert {j.worker_id for j in jobs} == {a.worker_id}
+    assert all(j.attempts == 1 and j.lease_expires_at > datetime.now(timezone.utc) for j in jobs)
+    assert run(_order_status(order_id)) == "in_progress"
+
+
+def test_expired_lease_is_reclaimed_and_the_old_worker_cannot_record(run, user, make_order):
+    order_id = run(_pay(make_order, user, "test_1"))
+    a, b = _worker(), _worker()
+    job = next(j for j in run(a._claim(10)) if j.kind == "image")
+    # воркер a перестал продлевать аренду
+    run(_set([job.id], lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)))
+
+    assert run(b.reap_expired()) == 1
+    (reclaimed,) = run(b._claim(10))
+    assert reclaimed.id == job.id and reclaimed.attempts == 2
+
+    # запоздавший итог a не перетирает аренду b
+    run(a._record_success(job, {"late": True}))
+    row = next(j for j in run(_jobs(order_id)) if j.id == job.id)
+    assert (row.status, row.worker_id, row.result) == ("running", b.worker_id, None)
+
+    run(b._execute(reclaimed))
+    row = next(j for j in run(_jobs(order_id)) if j.id == job.id)
+    assert (row.status, row.worker_id, row.result) == ("done", None, {"kind": "image", "seq": 1})
+
+
+def test_expired_lease_after_last_attempt_fails_job_and_refunds(run, user, make_order):
+    order_id = run(_pay(make_order, user, "test_1"))
+    w = _worker()
+    jobs = run(w._claim(10))
+    for job in jobs:
+        run(w._debit(job))
+    run(_set([j.id for j in jobs], attempts=5, max_attempts=5, lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)))
+
+    async def balance() -> dict:
+        async with AsyncSessionLocal() as db:
+            return await get_balance(db, user)
+
+    assert run(balance()) == {"images": 0, "videos": 0}
+    assert run(_worker().reap_expired()) == 2
+
+    assert {(j.status, j.error) for j in run(_jobs(order_id))} == {("failed", "lease expired")}
+    assert run(balance()) == {"images": 1, "videos": 1}
+    assert run(_order_status(order_id)) == "generation_failed"
+
+
+def test_jobs_finish_and_settle_the_order(run, user, make_order):
+    order_id = run(_pay(make_order, user, "test_1"))
+    w = _worker()
+    for job in run(w._claim(10)):
+        run(w._execute(job))
+
+    assert {j.status for j in run(_jobs(order_id))} == {"done"}
+    assert run(_order_status(order_id)) == "completed"
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+
+from app.db.session import AsyncSessionLocal
+from app.models.generation_daily_usage import GenerationDailyUsage
+from app.models.generation_job import GenerationJob
+from app.services.credits import get_balance
+from app.services.generation_jobs import GenerationWorker, register_handler
+from app.services.generation_schedule import next_day_slot, render_window
+from app.services.payment_state import apply_transition
+
+
+async def _noop_handler(job) -> dict:
+    return {"kind": job.kind, "seq": job.seq}
+
+
+register_handler("test-noop", _noop_handler)
+
+
+def _worker(**kwargs) -> GenerationWorker:
+    params = dict(
+        concurrency=10,
+        poll_seconds=0.1,
+        lease_seconds=60,
+        heartbeat_seconds=10,
+        job_timeout_seconds=10,
+        drain_seconds=1,
+        backoff_seconds=0,
+        backoff_max_seconds=0,
+        handler="test-noop",
+    )
+    params.update(kwargs)
+    return GenerationWorker(**params)
+
+
+async def _pay(make_order, user, plan_code: str):
+    order_id, payment_id = await make_order(user, plan_code)
+    async with AsyncSessionLocal() as db:
+        await apply_transition(db, payment_id, "succeeded")
+        await db.commit()
+    return order_id
+
+
+async def _jobs(order_id) -> list:
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(select(GenerationJob).where(GenerationJob.order_id == order_id).order_by(GenerationJob.id))
+        return list(q.scalars().all())
+
+
+# Готовы к запуску только jobs; остальные задачи заказа — в будущем (первый слот дня оплаты мог уже пройти)
+async def _due_only(order_id, jobs: list, *, ago: timedelta) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.order_id == order_id)
+            .values(run_at=datetime.now(timezone.utc) + timedelta(days=1))
+        )
+        await db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id.in_([j.id for j in jobs]))
+            .values(run_at=datetime.now(timezone.utc) - ago)
+        )
+        await db.commit()
+
+
+def test_daily_quota_defers_extra_starts_to_the_next_day(run, user, make_order):
+    # month_30: 1 изображение и 1 видео в день; после простоя два изображения готовы к запуску одновременно
+    order_id = run(_pay(make_order, user, "month_30"))
+    images = [j for j in run(_jobs(order_id)) if j.kind == "image"][:2]
+    run(_due_only(order_id, images, ago=timedelta(days=1)))
+    w = _worker()
+
+    claimed = run(w._claim(10))
+    assert sorted(j.id for j in claimed) == sorted(j.id for j in images)
+    for job in claimed:
+        run(w._execute(job))
+
+    rows = {j.id: j for j in run(_jobs(order_id))}
+    done = [rows[j.id] for j in images if rows[j.id].status == "done"]
+    deferred = [rows[j.id] for j in images if rows[j.id].status == "queued"]
+    assert len(done) == 1 and len(deferred) == 1
+    now = datetime.now(timezone.utc)
+    # перенос не тратит попытку и кредит
+    assert deferred[0].attempts == 0
+    assert deferred[0].run_at == next_day_slot(order_id, now, render_window())
+
+    async def usage() -> list:
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(select(GenerationDailyUsage.day, GenerationDailyUsage.kind, GenerationDailyUsage.used))
+            return q.all()
+
+    async def balance() -> dict:
+        async with AsyncSessionLocal() as db:
+            return await get_balance(db, user)
+
+    assert run(usage()) == [(now.date(), "image", 1)]
+    assert run(balance()) == {"images": 29, "videos": 30}
+
+
+def test_daily_quota_sums_active_subscriptions(run, user, make_order):
+    first = run(_pay(make_order, user, "month_30"))
+    second = run(_pay(make_order, user, "month_30"))
+    jobs = [next(j for j in run(_jobs(o)) if j.kind == "video") for o in (first, second)]
+    for o, job in zip((first, second), jobs):
+        run(_due_only(o, [job], ago=timedelta(minutes=1)))
+    w = _worker()
+
+    for job in run(w._claim(10)):
+        run(w._execute(job))
+
+    # две подписки по 1 видео в день — оба старта в норме
+    ids = {j.id for j in jobs}
+    assert [j.status for o in (first, second) for j in run(_jobs(o)) if j.id in ids] == ["done", "done"]
+
+
+def test_restarted_job_does_not_take_a_second_daily_slot(run, user, make_order):
+    order_id = run(_pay(make_order, user, "month_30"))
+    job = next(j for j in run(_jobs(order_id)) if j.kind == "image")
+    run(_due_only(order_id, [job], ago=timedelta(minutes=1)))
+    w = _worker()
+
+    (claimed,) = run(w._claim(10))
+    run(w._debit(claimed))
+    # падение после списания: задача вернулась в очередь и стартует снова в тот же день
+    run(w._release(claimed))
+    (claimed,) = run(w._claim(10))
+    run(w._execute(claimed))
+
+    row = next(j for j in run(_jobs(order_id)) if j.id == job.id)
+    assert row.status == "done"
+
+    async def used() -> int:
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(select(GenerationDailyUsage.used))
+            return q.scalar_one()
+
+    assert run(used()) == 1
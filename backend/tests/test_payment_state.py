@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.db.session import AsyncSessionLocal
+from app.models.generation_job import GenerationJob
+from app.models.order import Order
+from app.models.payment import Payment
+from app.models.payment_event import PaymentEvent
+from app.services.credits import get_balance
+from app.services.payment_state import apply_transition, apply_transitions
+
+
+async def _apply(payment_id: str, status: str, **kwargs):
+    async with AsyncSessionLocal() as db:
+        t = await apply_transition(db, payment_id, status, **kwargs)
+        await db.commit()
+        return t
+
+
+async def _state(order_id, payment_id) -> tuple[str, str]:
+    async with AsyncSessionLocal() as db:
+        order_status = (await db.execute(select(Order.status).where(Order.id == order_id))).scalar_one()
+        payment_status = (
+            await db.execute(select(Payment.status).where(Payment.provider_payment_id == payment_id))
+        ).scalar_one()
+        return order_status, payment_status
+
+
+async def _jobs(order_id) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count()).where(GenerationJob.order_id == order_id))).scalar_one()
+
+
+def test_succeeded_pays_order_grants_credits_and_enqueues_jobs(run, user, make_order):
+    order_id, payment_id = run(make_order(user, "test_1"))
+
+    t = run(_apply(payment_id, "succeeded", raw={"event": "payment.succeeded"}))
+
+    assert t is not None and t.status == "succeeded" and t.order_status == "paid"
+    assert run(_state(order_id, payment_id)) == ("paid", "succeeded")
+
+    async def check() -> None:
+        async with AsyncSessionLocal() as db:
+            assert await get_balance(db, user) == {"images": 1, "videos": 1}
+            q = await db.execute(select(PaymentEvent.event, PaymentEvent.applied).where(PaymentEvent.provider_payment_id == payment_id))
+            assert q.all() == [("payment.succeeded", True)]
+
+    run(check())
+    assert run(_jobs(order_id)) == 2
+
+
+def test_repeated_succeeded_is_a_noop(run, user, make_order):
+    order_id, payment_id = run(make_order(user, "test_1"))
+    run(_apply(payment_id, "succeeded"))
+
+    # повторная доставка того же вебхука: перехода нет, кредиты и задачи не удваиваются
+    assert run(_apply(payment_id, "succeeded", raw={"event": "payment.succeeded"})) is None
+
+    async def check() -> None:
+        async with AsyncSessionLocal() as db:
+            assert await get_balance(db, user) == {"images": 1, "videos": 1}
+            q = await db.execute(select(PaymentEvent.applied).where(PaymentEvent.provider_payment_id == payment_id))
+            assert q.scalars().all() == [False]
+
+    run(check())
+    assert run(_jobs(order_id)) == 2
+
+
+def test_late_pending_and_cancel_do_not_overwrite_succeeded(run, user, make_order):
+    order_id, payment_id = run(make_order(user, "test_1"))
+    run(_apply(payment_id, "succeeded"))
+
+    assert run(_apply(payment_id, "pending")) is None
+    assert run(_apply(payment_id, "waiting_for_capture")) is None
+    assert run(_apply(payment_id, "canceled")) is None
+    assert run(_state(order_id, payment_id)) == ("paid", "succeeded")
+
+
+def test_waiting_for_capture_then_canceled_cancels_order(run, user, make_order):
+    order_id, payment_id = run(make_order(user, "test_1"))
+
+    t = run(_apply(payment_id, "waiting_for_capture"))
+    # промежуточный статус заказ не трогает
+    assert t is not None and t.order_status is None
+    assert run(_state(order_id, payment_id)) == ("payment_pending", "waiting_for_capture")
+
+    t = run(_apply(payment_id, "canceled"))
+    assert t is not None and t.order_status == "canceled"
+    assert run(_state(order_id, payment_id)) == ("canceled", "canceled")
+    assert run(_jobs(order_id)) == 0
+
+
+def test_batch_applies_only_allowed_transitions(run, user, make_order):
+    paid_order, paid_payment = run(make_order(user, "test_1"))
+    done_order, done_payment = run(make_order(user, "test_1", status="paid", payment_status="succeeded"))
+
+    async def apply() -> list:
+        async with AsyncSessionLocal() as db:
+            applied = await apply_transitions(db, {paid_payment: "succeeded", done_payment: "canceled", "unknown": "succeeded"})
+            await db.commit()
+            return applied
+
+    applied = run(apply())
+
+    assert [(t.provider_payment_id, t.order_status) for t in applied] == [(paid_payment, "paid")]
+    assert run(_state(done_order, done_payment)) == ("paid", "succeeded")
+
+
+def test_concurrent_deliveries_apply_once(run, user, make_order):
+    order_id, payment_id = run(make_order(user, "test_1"))
+
+    async def deliver(hold: float):
+        async with AsyncSessionLocal() as db:
+            t = await apply_transition(db, payment_id, "succeeded")
+            # первый держит блокировку строки платежа, второй ждёт её и перепроверяет переход
+            await asyncio.sleep(hold)
+            await db.commit()
+            return t
+
+    async def race() -> list:
+        return await asyncio.gather(deliver(0.3), deliver(0.0))
+
+    results = run(race())
+
+    assert sum(t is not None for t in results) == 1
+
+    async def check() -> None:
+        async with AsyncSessionLocal() as db:
+            assert await get_balance(db, user) == {"images": 1, "videos": 1}
+
+    run(check())
+    assert run(_jobs(order_id)) == 2
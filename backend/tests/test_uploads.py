@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import uuid
+
+import pytest
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.services import uploads
+
+# JPEG по сигнатуре: проверка типа смотрит только первые байты
+PHOTO = b"\xff\xd8\xff\xe0" + os.urandom(300_000)
+
+
+async def _body(data: bytes, piece: int = 64 * 1024):
+    for i in range(0, len(data), piece):
+        yield data[i : i + piece]
+
+
+async def _create(user, data: bytes = PHOTO, **extra) -> uuid.UUID:
+    async with AsyncSessionLocal() as db:
+        state = await uploads.create_upload(db, user, {"kind": "photo", "content_type": "image/jpeg", "size": len(data), **extra})
+    return uuid.UUID(state["upload_id"])
+
+
+async def _create_track(user, size: int, **extra) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await uploads.create_upload(db, user, {"kind": "track", "content_type": "audio/mpeg", "size": size, **extra})
+
+
+async def _write(user, upload_id: uuid.UUID, offset: int, chunk: bytes) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await uploads.write_chunk(db, user, upload_id, offset, _body(chunk), len(chunk))
+
+
+async def _state(user, upload_id: uuid.UUID) -> dict:
+    async with AsyncSessionLocal() as db:
+        return uploads.upload_state(await uploads.get_upload(db, user, upload_id))
+
+
+def _blob(digest: str) -> bytes:
+    with open(os.path.join(settings.upload_dir, uploads.blob_rel_path(digest)), "rb") as f:
+        return f.read()
+
+
+def test_upload_resumes_from_the_last_offset(run, user):
+    digest = hashlib.sha256(PHOTO).hexdigest()
+    upload_id = run(_create(user, sha256=digest))
+
+    state = run(_write(user, upload_id, 0, PHOTO[:100_000]))
+    assert (state["status"], state["offset"]) == ("receiving", 100_000)
+
+    # обрыв: клиент спрашивает смещение и продолжает с него
+    assert run(_state(user, upload_id))["offset"] == 100_000
+    state = run(_write(user, upload_id, 100_000, PHOTO[100_000:]))
+
+    assert (state["status"], state["offset"], state["sha256"]) == ("complete", len(PHOTO), digest)
+    assert _blob(digest) == PHOTO
+
+
+def test_resume_in_another_process_rehashes_the_part_file(run, user):
+    upload_id = run(_create(user))
+    run(_write(user, upload_id, 0, PHOTO[:150_000]))
+    # следующая часть пришла в процесс без состояния хеша
+    uploads._hashers.clear()
+
+    state = run(_write(user, upload_id, 150_000, PHOTO[150_000:]))
+
+    assert state["sha256"] == hashlib.sha256(PHOTO).hexdigest()
+
+
+def test_offset_mismatch_is_refused_with_the_current_offset(run, user):
+    upload_id = run(_create(user))
+    run(_write(user, upload_id, 0, PHOTO[:100_000]))
+
+    # повтор уже принятой части и часть с пропуском
+    for offset in (0, 200_000):
+        with pytest.raises(uploads.UploadError) as e:
+            run(_write(user, upload_id, offset, PHOTO[offset : offset + 1000]))
+        assert e.value.status_code == 409
+        assert e.value.detail["offset"] == 100_000
+
+    state = run(_write(user, upload_id, 100_000, PHOTO[100_000:]))
+    assert state["status"] == "complete"
+    assert _blob(state["sha256"]) == PHOTO
+
+
+def test_completed_upload_refuses_more_data(run, user):
+    upload_id = run(_create(user))
+    run(_write(user, upload_id, 0, PHOTO))
+
+    with pytest.raises(uploads.UploadError) as e:
+        run(_write(user, upload_id, len(PHOTO), b"x"))
+    assert e.value.status_code == 409
+    assert e.value.detail["status"] == "complete"
+
+
+def test_checksum_mismatch_fails_the_upload(run, user):
+    upload_id = run(_create(user, sha256="0" * 64))
+
+    with pytest.raises(uploads.UploadError) as e:
+        run(_write(user, upload_id, 0, PHOTO))
+    assert e.value.status_code == 422
+    assert run(_state(user, upload_id))["status"] == "failed"
+
+
+def test_wrong_signature_is_rejected_on_the_first_chunk(run, user):
+    data = b"GIF89a" + PHOTO[6:]
+    upload_id = run(_create(user, data))
+
+    with pytest.raises(uploads.UploadError) as e:
+        run(_write(user, upload_id, 0, data[:50_000]))
+    assert e.value.status_code == 415
+    # запись части отпущена: повтор получает ту же ошибку типа, а не «часть уже принимается»
+    assert run(_state(user, upload_id))["offset"] == 0
+    with pytest.raises(uploads.UploadError) as e:
+        run(_write(user, upload_id, 0, data[:50_000]))
+    assert e.value.status_code == 415
+
+
+def test_same_content_is_not_uploaded_twice(run, user):
+    upload_id = run(_create(user))
+    done = run(_write(user, upload_id, 0, PHOTO))
+
+    # тот же файл ещё раз: возвращается готовая загрузка, передавать байты не нужно
+    assert run(_create(user, sha256=done["sha256"])) == upload_id
+    assert run(_state(user, upload_id))["status"] == "complete"
+
+
+def test_open_uploads_are_limited_per_user(run, user):
+    for _ in range(settings.upload_max_open_per_user):
+        run(_create(user))
+
+    with pytest.raises(uploads.UploadError) as e:
+        run(_create(user))
+    assert e.value.status_code == 429
+
+
+def test_plan_code_must_be_held(run, user):
+    with pytest.raises(uploads.UploadError) as e:
+        run(_create(user, plan_code="month_90"))
+    assert e.value.status_code == 403
+
+
+def test_limit_without_a_plan_is_the_general_one(run, user):
+    size = settings.upload_track_max_mb * 1024 * 1024
+
+    # первый заказ ещё не оформлен: общий лимит, а не самый строгий из плановых
+    assert run(_create_track(user, size))["size"] == size
+    with pytest.raises(uploads.UploadError) as e:
+        run(_create_track(user, size + 1))
+    assert e.value.status_code == 413
+
+
+def test_completed_order_keeps_its_plan(run, user, make_order):
+    run(make_order(user, "test_1", status="completed", payment_status="succeeded"))
+    limit = uploads.max_bytes("track", "test_1")
+    assert limit < settings.upload_track_max_mb * 1024 * 1024
+
+    assert run(_create_track(user, limit, plan_code="test_1"))["size"] == limit
+    with pytest.raises(uploads.UploadError) as e:
+        run(_create_track(user, limit + 1, plan_code="test_1"))
+    assert e.value.status_code == 413
+    # без plan_code план строже общего лимита не применяется
+    assert run(_create_track(user, limit + 1))["size"] == limit + 1